@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.models import Group
 
-from .models import (Account, User, PaymentMethod, Subscription, Customer)
+from .models import (Account, User, PaymentMethod, Subscription, Customer, WebhookEvent, GatewayOperation,
+                     ReconciliationCursor)
+from .services import AuthUserCache, SubscriptionStatusCache
 
 
 class AccountAdmin(admin.ModelAdmin):
@@ -45,6 +47,18 @@ class UserAdmin(admin.ModelAdmin):
             obj.refresh_from_db()
             obj.set_password(form.data.get('password'))
             obj.save()
+        # The account, active and staff flags of the cached users may have changed
+        AuthUserCache().invalidate(obj.id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        AuthUserCache().invalidate(obj.id)
+
+    def delete_queryset(self, request, queryset):
+        user_ids = list(queryset.values_list('id', flat=True))
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            AuthUserCache().invalidate(user_id)
 
 
 class CustomerAdmin(admin.ModelAdmin):
@@ -118,10 +132,76 @@ class SubscriptionAdmin(admin.ModelAdmin):
         'payment_gateway_status',
     ]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        SubscriptionStatusCache().invalidate(obj.account_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        SubscriptionStatusCache().invalidate(obj.account_id)
+
+    def delete_queryset(self, request, queryset):
+        account_ids = set(queryset.values_list('account_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for account_id in account_ids:
+            SubscriptionStatusCache().invalidate(account_id)
+
+
+class WebhookEventAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'id',
+        'event_id',
+        'type',
+        'status',
+        'attempts',
+        'created_at',
+        'processed_at',
+    )
+    search_fields = [
+        'id',
+        'event_id',
+    ]
+    list_filter = [
+        'status',
+        'type',
+    ]
+
+
+class GatewayOperationAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'id',
+        'account',
+        'operation',
+        'result_reference',
+        'created_at',
+    )
+    search_fields = [
+        'id',
+        'idempotency_key',
+        'result_reference',
+    ]
+    list_filter = [
+        'operation',
+    ]
+
+
+class ReconciliationCursorAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'name',
+        'high_water_mark',
+        'updated_at',
+    )
+
 
 admin.site.register(Account, AccountAdmin)
 admin.site.register(User, UserAdmin)
 admin.site.register(Customer, CustomerAdmin)
 admin.site.register(PaymentMethod, PaymentMethodAdmin)
 admin.site.register(Subscription, SubscriptionAdmin)
+admin.site.register(WebhookEvent, WebhookEventAdmin)
+admin.site.register(GatewayOperation, GatewayOperationAdmin)
+admin.site.register(ReconciliationCursor, ReconciliationCursorAdmin)
 admin.site.unregister(Group)
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from .services import KeySetTokenBackend, StripeClient
+        from .utils.queries import install_query_tracking
+        StripeClient.configure()
+        KeySetTokenBackend.configure()
+        connection_created.connect(install_query_tracking)
@@ -0,0 +1,153 @@
+import hashlib
+import hmac
+import time
+import uuid
+
+from django.conf import settings
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework import HTTP_HEADER_ENCODING
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .services import AuthUserCache
+from .utils import LRUCache, metrics
+
+
+class ClaimsUser:
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, account_id, is_active):
+        self.id = uuid.UUID(str(id))
+        self.account_id = uuid.UUID(str(account_id))
+        self.is_active = is_active
+
+    @property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def is_staff(self):
+        # Not trusted from the token, only the staff endpoints pay for the cached lookup
+        claims = AuthUserCache().get(self.id)
+        return bool(claims and claims['is_active'] and claims['is_staff'])
+
+    @cached_property
+    def user(self):
+        return User.objects.get(id=self.id)
+
+    def __getattr__(self, name):
+        # Anything not in the claims (name, email, account...) is read from the user row, loaded once on demand
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return f'{self.id}'
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+
+    CLAIMS = ('account_id', 'is_active')
+
+    # Tokens already verified by this process with their expiration, clients reuse them for every request
+    verified_tokens = LRUCache(settings.JWT_VERIFIED_TOKEN_CACHE_SIZE)
+
+    def get_validated_token(self, raw_token):
+        key = hashlib.sha256(raw_token).digest()
+        cached = self.verified_tokens.get(key)
+        if cached is not None:
+            expires_at, validated_token = cached
+            if expires_at > time.time():
+                metrics.increment('jwt_token_cache.hits')
+                return validated_token
+            self.verified_tokens.delete(key)
+            metrics.increment('jwt_token_cache.expirations')
+
+        metrics.increment('jwt_token_cache.misses')
+        validated_token = super().get_validated_token(raw_token)
+        self.verified_tokens.set(key, (validated_token['exp'], validated_token))
+        return validated_token
+
+    @classmethod
+    def stats(cls):
+        hits = metrics.get('jwt_token_cache.hits')
+        misses = metrics.get('jwt_token_cache.misses')
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0,
+            'expirations': metrics.get('jwt_token_cache.expirations'),
+            'evictions': cls.verified_tokens.evictions,
+            'size': len(cls.verified_tokens),
+            'max_size': cls.verified_tokens.max_size,
+        }
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        if all(claim in validated_token for claim in self.CLAIMS):
+            claims = {
+                'id': user_id,
+                'account_id': validated_token['account_id'],
+                'is_active': validated_token['is_active'],
+            }
+        else:
+            # Tokens issued before the claims were added
+            user_claims = AuthUserCache().get(user_id)
+            if user_claims is None:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            claims = {claim: user_claims[claim] for claim in ('id', 'account_id', 'is_active')}
+
+        user = ClaimsUser(**claims)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return user
+
+
+class ServicePrincipal:
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+
+    def __str__(self):
+        return 'service'
+
+
+class ServiceKeyAuthentication(BaseAuthentication):
+
+    keyword = 'Service'
+
+    def authenticate(self, request):
+        parts = get_authorization_header(request).split()
+        if not parts or parts[0] != self.keyword.encode(HTTP_HEADER_ENCODING):
+            return None
+
+        if len(parts) != 2:
+            raise AuthenticationFailed(_('Authorization header must contain two space-delimited values'))
+
+        key = parts[1]
+        if not any(hmac.compare_digest(key, valid_key.encode()) for valid_key in settings.SERVICE_API_KEYS):
+            raise AuthenticationFailed(_('Invalid service key'))
+
+        return ServicePrincipal(), None
+
+    def authenticate_header(self, request):
+        return self.keyword
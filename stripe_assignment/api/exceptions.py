@@ -17,3 +17,25 @@ class PaymentsGatewayError(Exception):
     def __init__(self, message):
         self.message = message
         super().__init__()
+
+
+class IdempotencyKeyInProgressError(Exception):
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__()
+
+
+class IdempotencyKeyMismatchError(Exception):
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__()
+
+
+class PaymentsGatewayUnavailableError(Exception):
+
+    def __init__(self, message, retry_after):
+        self.message = message
+        self.retry_after = retry_after
+        super().__init__()
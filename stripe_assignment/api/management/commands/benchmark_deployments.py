@@ -0,0 +1,171 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from stripe.http_client import HTTPClient
+
+from ...models import Account, Customer, PaymentMethod, Subscription, User
+from ...models.constants import PaymentMethodType, SubscriptionProduct
+from ...serializers import MyTokenObtainPairSerializer
+from ...utils import percentile
+
+
+class SlowStripe(HTTPClient):
+
+    name = 'slow'
+
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def request(self, method, url, headers, post_data=None):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+        body = {'id': f'bench_{next(self.ids)}', 'object': url.rstrip('/').split('/')[-1].rstrip('s')}
+        return json.dumps(body), 200, {}
+
+    def close(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Compares the WSGI and ASGI subscribe endpoints serving the same number of requests at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Subscribe requests')
+        parser.add_argument(
+            '--concurrency', type=int, default=12,
+            help='Requests both deployments serve at the same time, gunicorn workers times threads for WSGI')
+        parser.add_argument('--stripe-latency', type=float, default=0.5, help='Seconds every Stripe call takes')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write('SQLite serializes the writes of concurrent requests, run it against PostgreSQL')
+        concurrency = options['concurrency']
+        # The async views still run the blocking ORM and Stripe work in threads, with the same concurrency
+        # the comparison measures the cost of each deployment and not the size of its thread pool
+        self.stdout.write(
+            f'Both deployments serve at most {concurrency} requests at a time, '
+            f'the async views run their blocking work in up to {settings.ASYNC_WORKER_THREADS} threads')
+        if settings.ASYNC_WORKER_THREADS < concurrency:
+            self.stdout.write(f'ASYNC_WORKER_THREADS is below {concurrency}, the ASGI requests queue for a thread')
+
+        stripe_client, api_key = stripe.default_http_client, stripe.api_key
+        users = self.seed(options['requests'])
+        requests = self.authorize(users)
+        try:
+            # The simulated Stripe has no rate limit
+            with override_settings(ALLOWED_HOSTS=['*'], STRIPE_RATE_LIMIT=0):
+                stripe.api_key = 'sk_benchmark'
+                self.report('WSGI', concurrency, options, lambda: self.run_wsgi(requests, concurrency))
+                self.delete_subscriptions(users)
+                self.report('ASGI', concurrency, options, lambda: self.run_asgi(requests, concurrency))
+        finally:
+            stripe.default_http_client, stripe.api_key = stripe_client, api_key
+            Account.objects.filter(id__in=[user.account_id for user in users]).delete()
+
+    def seed(self, count):
+        prefix = uuid.uuid4().hex[:8]
+        accounts = Account.objects.bulk_create([
+            Account(name=f'Benchmark {prefix} {index}') for index in range(count)])
+        users = []
+        for index, account in enumerate(accounts):
+            user = User(username=f'benchmark_{prefix}_{index}', account=account)
+            user.set_unusable_password()
+            users.append(user)
+        User.objects.bulk_create(users)
+        Customer.objects.bulk_create([
+            Customer(is_active=True, id_reference=f'cus_{prefix}_{index}', account=account)
+            for index, account in enumerate(accounts)])
+        PaymentMethod.objects.bulk_create([
+            PaymentMethod(
+                is_active=True, id_reference=f'pm_{prefix}_{index}', type=PaymentMethodType.CARD, account=account)
+            for index, account in enumerate(accounts)])
+        return list(User.objects.filter(username__startswith=f'benchmark_{prefix}_'))
+
+    def delete_subscriptions(self, users):
+        Subscription.objects.filter(account_id__in=[user.account_id for user in users]).delete()
+
+    def report(self, deployment, concurrency, options, run):
+        stripe.default_http_client = SlowStripe(options['stripe_latency'])
+        started_at = time.perf_counter()
+        results = run()
+        elapsed = time.perf_counter() - started_at
+        latencies = [latency for _, latency in results]
+        errors = len([status for status, _ in results if status != 200])
+        self.stdout.write(
+            f'{deployment}: concurrency={concurrency} '
+            f'stripe_calls_in_flight={stripe.default_http_client.max_in_flight} '
+            f'elapsed={elapsed:.2f}s throughput={len(results) / elapsed:.1f}/s '
+            f'p50={percentile(latencies, 50) * 1000:.0f}ms p95={percentile(latencies, 95) * 1000:.0f}ms '
+            f'errors={errors}')
+
+    def data(self):
+        return {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767}
+
+    def authorize(self, users):
+        # Tokens are signed before measuring, only the server side work is part of the benchmark
+        return [(user, f'JWT {MyTokenObtainPairSerializer.get_token(user).access_token}') for user in users]
+
+    def run_wsgi(self, requests, workers):
+        # Every worker thread serves one request at a time, like a gunicorn sync worker
+        url = reverse('subscriptions-subscribe')
+
+        def subscribe(request):
+            _, authorization = request
+            started_at = time.perf_counter()
+            try:
+                response = Client().post(
+                    url, data=self.data(), content_type='application/json', HTTP_AUTHORIZATION=authorization)
+            finally:
+                close_old_connections()
+            return response.status_code, time.perf_counter() - started_at
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(subscribe, requests))
+
+    def run_asgi(self, requests, concurrency):
+        # A single event loop serves the requests, like one uvicorn worker limited to `concurrency` of them
+        url = reverse('async-subscriptions-subscribe')
+
+        async def subscribe(client, slots, authorization):
+            async with slots:
+                started_at = time.perf_counter()
+                response = await client.post(
+                    url, data=self.data(), content_type='application/json', authorization=authorization)
+                return response.status_code, time.perf_counter() - started_at
+
+        async def subscribe_all():
+            client = AsyncClient()
+            slots = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*[
+                subscribe(client, slots, authorization) for _, authorization in requests])
+
+        return async_to_sync(subscribe_all)()
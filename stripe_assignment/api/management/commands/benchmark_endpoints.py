@@ -0,0 +1,176 @@
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from ...models import Account, User
+from ...models.constants import SubscriptionProduct
+from ...services import StripeClient
+from ...utils import QueryCounter, percentile
+from ...utils.stripe_stand_in import LatencyDistribution, StripeStandIn
+
+PASSWORD = 'benchmark1234'
+
+
+class Command(BaseCommand):
+    help = 'Measures the token, subscribe and status endpoints end to end, and compares them with a baseline'
+
+    # Lower is better for all of them except the throughput
+    COMPARED = ('throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=100, help='Accounts and users seeded')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at the same time')
+        parser.add_argument('--status-rounds', type=int, default=5, help='Status requests of every user')
+        parser.add_argument(
+            '--stripe-latency', type=float, default=0.05,
+            help='Median latency of the local Stripe stand-in, in seconds')
+        parser.add_argument('--output', default='', help='File the JSON results are written to')
+        parser.add_argument('--baseline', default='', help='JSON results of a previous run to compare with')
+        parser.add_argument(
+            '--threshold', type=float, default=0.1,
+            help='Relative change of a metric against the baseline reported as a regression')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write('SQLite serializes the writes of concurrent requests, run it against PostgreSQL')
+
+        stand_in = StripeStandIn(
+            ('127.0.0.1', 0), latency=LatencyDistribution('lognormal', options['stripe_latency']))
+        stand_in.start()
+        previous = stripe.api_base, stripe.api_key, stripe.default_http_client
+        users = self.seed(options['accounts'])
+        try:
+            stripe.api_base, stripe.api_key = stand_in.url, 'sk_benchmark'
+            stripe.default_http_client = StripeClient(
+                pool_size=options['concurrency'], connect_timeout=5, read_timeout=30)
+            # The stand-in has no rate limit
+            with override_settings(ALLOWED_HOSTS=['*'], STRIPE_RATE_LIMIT=0):
+                results = self.run(users, options)
+        finally:
+            stripe.api_base, stripe.api_key, stripe.default_http_client = previous
+            stand_in.shutdown()
+            stand_in.server_close()
+            Account.objects.filter(id__in=[user.account_id for user in users]).delete()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['threshold'])
+
+    def seed(self, count):
+        prefix = uuid.uuid4().hex[:8]
+        accounts = Account.objects.bulk_create([
+            Account(name=f'Benchmark {prefix} {index}') for index in range(count)])
+        # Hashed once, every user has the same password
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=f'benchmark_{prefix}_{index}', password=password, account=account)
+            for index, account in enumerate(accounts)])
+        return list(User.objects.filter(username__startswith=f'benchmark_{prefix}_'))
+
+    def run(self, users, options):
+        concurrency = options['concurrency']
+        tokens = {}
+
+        def obtain_token(user):
+            result = self.request('post', reverse('token_create'), {'username': user.username, 'password': PASSWORD})
+            response = result[0]
+            if response.status_code == 200:
+                tokens[user.id] = f'JWT {response.json()["access"]}'
+            return result
+
+        def subscribe(user):
+            return self.request('post', reverse('subscriptions-subscribe'), {
+                'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+                'card_number': '4242424242424242',
+                'card_expiration_month': 10,
+                'card_expiration_year': 2100,
+                'card_cvc': 767,
+            }, tokens.get(user.id))
+
+        def subscription_status(user):
+            return self.request('get', reverse('subscriptions-status'), None, tokens.get(user.id))
+
+        endpoints = {}
+        for name, function, requests in [
+            ('token', obtain_token, users),
+            ('subscribe', subscribe, users),
+            ('status', subscription_status, users * options['status_rounds']),
+        ]:
+            endpoints[name] = self.measure(function, requests, concurrency)
+            self.stdout.write(f'{name}: ' + ' '.join(
+                f'{metric}={value}' for metric, value in endpoints[name].items()))
+
+        return {
+            'accounts': len(users),
+            'concurrency': concurrency,
+            'stripe_latency': options['stripe_latency'],
+            'database': connection.vendor,
+            'endpoints': endpoints,
+        }
+
+    def request(self, method, url, data, authorization=None):
+        counter = QueryCounter()
+        extra = {'HTTP_AUTHORIZATION': authorization} if authorization else {}
+        started_at = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                response = getattr(Client(), method)(url, data=data, content_type='application/json', **extra)
+        finally:
+            close_old_connections()
+        return response, time.perf_counter() - started_at, counter.count
+
+    def measure(self, function, requests, concurrency):
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(function, requests))
+        elapsed = time.perf_counter() - started_at
+
+        latencies = [latency for _, latency, _ in results]
+        return {
+            'requests': len(results),
+            'errors': len([response for response, _, _ in results if response.status_code >= 400]),
+            'throughput': round(len(results) / elapsed, 1) if elapsed else 0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'queries_per_request': round(sum(queries for _, _, queries in results) / len(results), 2)
+            if results else 0,
+        }
+
+    def compare(self, results, baseline_path, threshold):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = []
+        for name, metrics in baseline['endpoints'].items():
+            current = results['endpoints'].get(name)
+            if current is None:
+                continue
+            # Failing requests answer fast, the latencies and throughput of a broken endpoint would look better
+            if current.get('errors', 0) > metrics.get('errors', 0):
+                regressions.append(f'{name} errors {metrics.get("errors", 0)} -> {current["errors"]}')
+                continue
+            for metric in self.COMPARED:
+                before, after = metrics.get(metric), current.get(metric)
+                if not before or after is None:
+                    continue
+                change = (after - before) / before
+                worse = change < -threshold if metric == 'throughput' else change > threshold
+                if worse:
+                    regressions.append(f'{name} {metric} {before} -> {after} ({change:+.0%})')
+
+        for regression in regressions:
+            self.stdout.write(f'REGRESSION {regression}')
+        if regressions:
+            raise CommandError(f'{len(regressions)} metrics regressed more than {threshold:.0%} against the baseline')
+        self.stdout.write(f'No metric regressed more than {threshold:.0%} against the baseline')
@@ -0,0 +1,107 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...models import Account, Customer, PaymentMethod, Subscription
+
+
+class Command(BaseCommand):
+    help = 'Seeds the subscription tables and checks every hot lookup uses an index scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=1000000,
+            help='Rows to seed in each of the customer, payment method and subscription tables')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--repeat', type=int, default=100,
+            help='Times each lookup is executed to measure its average duration')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'Query plans can not be checked on {connection.vendor}')
+
+        failures = []
+        # Everything runs in a transaction that is rolled back, so the seeded rows never persist.
+        with transaction.atomic():
+            started_at = time.perf_counter()
+            account_id, customer_reference = self.seed(options['rows'], options['batch_size'])
+            self.stdout.write(f'Seeded {options["rows"]} rows per table in {time.perf_counter() - started_at:.1f}s')
+            self.analyze()
+
+            for name, queryset in self.lookups(account_id, customer_reference):
+                plan = queryset.explain()
+                duration = self.measure(queryset, options['repeat'])
+                uses_index = self.uses_index_scan(plan)
+                self.stdout.write(f'{name}: {"index scan" if uses_index else "NO INDEX SCAN"} ({duration * 1000:.3f}ms)')
+                self.stdout.write(f'    {plan}')
+                if not uses_index:
+                    failures.append(name)
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f'Lookups without an index scan: {", ".join(failures)}')
+
+    def lookups(self, account_id, customer_reference):
+        return [
+            (
+                'PaymentsWebhook customer by id_reference',
+                Customer.objects.filter(id_reference=customer_reference).order_by('pk')[:1],
+            ),
+            (
+                'User.get_customer',
+                Customer.objects.filter(account_id=account_id, is_active=True).order_by('created_at')[:1],
+            ),
+            (
+                'User.get_payment_method',
+                PaymentMethod.objects.filter(account_id=account_id, is_active=True).order_by('created_at')[:1],
+            ),
+            (
+                'User.get_subscription',
+                Subscription.objects.filter(account_id=account_id).order_by('created_at')[:1],
+            ),
+        ]
+
+    def seed(self, rows, batch_size):
+        # Every account gets two rows per table, one of them inactive where the table has the flag.
+        accounts = max(rows // 2, 1)
+        account_id = None
+        customer_reference = None
+        for offset in range(0, accounts, batch_size):
+            batch = [Account(id=uuid.uuid4(), name=f'Benchmark {offset + i}') for i in range(min(batch_size, accounts - offset))]
+            Account.objects.bulk_create(batch)
+            customers, payment_methods, subscriptions = [], [], []
+            for i, account in enumerate(batch):
+                for is_active in (True, False):
+                    suffix = f'{offset + i}_{int(is_active)}'
+                    customers.append(Customer(is_active=is_active, id_reference=f'cus_{suffix}', account=account))
+                    payment_methods.append(PaymentMethod(is_active=is_active, id_reference=f'pm_{suffix}', account=account))
+                    subscriptions.append(Subscription(id_reference=f'sub_{suffix}', account=account))
+            Customer.objects.bulk_create(customers)
+            PaymentMethod.objects.bulk_create(payment_methods)
+            Subscription.objects.bulk_create(subscriptions)
+            account_id = batch[len(batch) // 2].id
+            customer_reference = customers[len(customers) // 2].id_reference
+
+        return account_id, customer_reference
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def measure(self, queryset, repeat):
+        started_at = time.perf_counter()
+        for _ in range(repeat):
+            list(queryset.all())
+        return (time.perf_counter() - started_at) / max(repeat, 1)
+
+    def uses_index_scan(self, plan):
+        # Sorting the handful of rows an index search returns for one account is fine,
+        # reading the whole table is not.
+        if connection.vendor == 'sqlite':
+            return 'USING INDEX' in plan and 'SCAN' not in plan
+
+        return 'Index' in plan and 'Seq Scan' not in plan
@@ -0,0 +1,54 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.backends import ALLOWED_ALGORITHMS, TokenBackend
+
+from ...services import KeySetTokenBackend
+
+
+class Command(BaseCommand):
+    help = 'Measures the sign and verify throughput of the JSON web token algorithms'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=500)
+        parser.add_argument(
+            '--algorithms', nargs='+', default=['RS256', 'ES256', 'EdDSA'], choices=KeySetTokenBackend.ALGORITHMS)
+
+    def handle(self, *args, **options):
+        payloads = [
+            {'token_type': 'access', 'exp': int(time.time()) + 300, 'jti': uuid.uuid4().hex, 'id': f'{uuid.uuid4()}'}
+            for _ in range(options['tokens'])
+        ]
+
+        # The stock backend parses the PEM keys on every signature and verification
+        if settings.JWT_ALGORITHM in ALLOWED_ALGORITHMS:
+            self.report(f'{settings.JWT_ALGORITHM} (simplejwt backend)', TokenBackend(
+                settings.JWT_ALGORITHM, settings.JWT_SIGNING_KEY, settings.JWT_VERIFYING_KEY), payloads)
+
+        for algorithm in options['algorithms']:
+            if algorithm == settings.JWT_ALGORITHM:
+                private_pem, public_pem = settings.JWT_SIGNING_KEY, settings.JWT_VERIFYING_KEY
+            else:
+                private_pem, public_pem = KeySetTokenBackend.generate_key_pair(algorithm)
+            backend = KeySetTokenBackend(
+                algorithm,
+                private_pem,
+                signing_key_id='benchmark',
+                verifying_keys={'benchmark': (algorithm, KeySetTokenBackend.prepare_key(algorithm, public_pem))})
+            self.report(algorithm, backend, payloads)
+
+    def report(self, name, backend, payloads):
+        started_at = time.perf_counter()
+        tokens = [backend.encode(payload) for payload in payloads]
+        sign_duration = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        for token in tokens:
+            backend.decode(token)
+        verify_duration = time.perf_counter() - started_at
+
+        self.stdout.write(
+            f'{name}: sign={len(tokens) / sign_duration:.0f}/s verify={len(tokens) / verify_duration:.0f}/s '
+            f'token_size={len(tokens[0])}B')
@@ -0,0 +1,61 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ...authentication import ClaimsJWTAuthentication
+from ...utils import LRUCache, percentile
+
+
+class Command(BaseCommand):
+    help = 'Measures the authentication cost per request with and without the verified token cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument(
+            '--clients', type=int, default=100,
+            help='Distinct tokens, every client reuses its token for its share of the requests')
+        parser.add_argument('--cache-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        authorizations = [self.authorization() for _ in range(options['clients'])]
+        factory = RequestFactory()
+        requests = [
+            factory.get('/', HTTP_AUTHORIZATION=authorizations[i % len(authorizations)])
+            for i in range(options['requests'])
+        ]
+
+        original_cache = ClaimsJWTAuthentication.verified_tokens
+        try:
+            for name, cache_size in (('without cache', 0), ('with cache', options['cache_size'])):
+                ClaimsJWTAuthentication.verified_tokens = LRUCache(cache_size)
+                self.report(name, self.measure(requests), ClaimsJWTAuthentication.verified_tokens)
+        finally:
+            ClaimsJWTAuthentication.verified_tokens = original_cache
+
+    def authorization(self):
+        # The claims are enough to authenticate, no user needs to exist
+        token = AccessToken()
+        token['id'] = f'{uuid.uuid4()}'
+        token['account_id'] = f'{uuid.uuid4()}'
+        token['is_active'] = True
+        return f'JWT {token}'
+
+    def measure(self, requests):
+        authentication = ClaimsJWTAuthentication()
+        durations = []
+        for request in requests:
+            started_at = time.perf_counter()
+            authentication.authenticate(request)
+            durations.append(time.perf_counter() - started_at)
+        return durations
+
+    def report(self, name, durations, cache):
+        self.stdout.write(
+            f'{name}: {len(durations)} requests, '
+            f'mean={sum(durations) / len(durations) * 1000:.3f}ms '
+            f'p50={percentile(durations, 50) * 1000:.3f}ms '
+            f'p99={percentile(durations, 99) * 1000:.3f}ms '
+            f'cached={len(cache)} evictions={cache.evictions}')
@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import stripe
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from requests.adapters import HTTPAdapter
+
+from ...models import Account, Customer, Subscription, WebhookEvent
+from ...models.constants import SubscriptionProduct, SubscriptionStatus
+from ...services import WebhookEventDeduplicator
+from ...utils import QueryCounter, WebhookCorpus, percentile
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+
+    # Like gunicorn, the answers are not delayed by Nagle waiting for the client acknowledgements
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Replays a stream of signed subscription events against the Stripe webhook endpoint'
+
+    MODES = ('in-process', 'http')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default='', help='Events written by generate_webhook_corpus')
+        parser.add_argument('--events', type=int, default=2000, help='Events generated when there is no corpus')
+        parser.add_argument('--accounts', type=int, default=200, help='Accounts of the generated events')
+        parser.add_argument('--duplicate-ratio', type=float, default=0.05)
+        parser.add_argument('--out-of-order-ratio', type=float, default=0.1)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--mode', choices=self.MODES + ('both',), default='both')
+        parser.add_argument(
+            '--url', default='',
+            help='Webhook endpoint of a running server for the http mode, by default one is started in process')
+        parser.add_argument('--secret', default='whsec_benchmark', help='Secret the events are signed with')
+        parser.add_argument('--concurrency', type=int, default=4, help='Events delivered at the same time')
+
+    def handle(self, *args, **options):
+        if options['corpus']:
+            events = WebhookCorpus.load(options['corpus'])
+        else:
+            events = WebhookCorpus(
+                events=options['events'],
+                accounts=options['accounts'],
+                duplicate_ratio=options['duplicate_ratio'],
+                out_of_order_ratio=options['out_of_order_ratio'],
+                seed=options['seed']).generate()
+        if not events:
+            raise CommandError('There are no events to replay')
+
+        payloads = [json.dumps(event) for event in events]
+        event_ids = list({event['id'] for event in events})
+        customers = {event['data']['object']['customer'] for event in events}
+        self.stdout.write(
+            f'events={len(events)} duplicates={len(events) - len(event_ids)} accounts={len(customers)} '
+            f'inbox={settings.STRIPE_WEBHOOK_INBOX_ENABLED}')
+        self.report('signature', self.measure_signatures(payloads, options['secret']))
+
+        modes = self.MODES if options['mode'] == 'both' else (options['mode'],)
+        accounts = self.seed(customers)
+        try:
+            with override_settings(ALLOWED_HOSTS=['*'], STRIPE_WEBHOOK_SECRET=options['secret']):
+                for mode in modes:
+                    self.reset(accounts, event_ids)
+                    replay = self.replay_in_process if mode == 'in-process' else self.replay_over_http
+                    result = replay(payloads, options)
+                    # The view answers 200 even to the events it rejects, only the recorded ones were accepted
+                    result['recorded'] = WebhookEvent.objects.filter(event_id__in=event_ids).count()
+                    self.report(mode, result)
+        finally:
+            WebhookEvent.objects.filter(event_id__in=event_ids).delete()
+            Account.objects.filter(id__in=accounts).delete()
+
+    def seed(self, customers):
+        accounts = Account.objects.bulk_create([Account(name=f'Benchmark {customer}') for customer in customers])
+        Customer.objects.bulk_create([
+            Customer(is_active=True, id_reference=customer, account=account)
+            for customer, account in zip(customers, accounts)])
+        Subscription.objects.bulk_create([
+            Subscription(
+                status=SubscriptionStatus.PENDING,
+                price_reference=SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME),
+                account=account)
+            for account in accounts])
+        return [account.id for account in accounts]
+
+    def reset(self, accounts, event_ids):
+        # Every mode starts from pending subscriptions and events never seen before
+        WebhookEvent.objects.filter(event_id__in=event_ids).delete()
+        WebhookEventDeduplicator.recent_event_ids.clear()
+        Subscription.objects.filter(account_id__in=accounts).update(
+            status=SubscriptionStatus.PENDING, payment_gateway_status='', id_reference='',
+            last_event_created=0)
+
+    def measure_signatures(self, payloads, secret):
+        # The verification done by the view for every event, on its own
+        latencies = []
+        for payload in payloads:
+            signature = WebhookCorpus.sign(payload, secret)
+            started_at = time.perf_counter()
+            stripe.Webhook.construct_event(payload=payload, sig_header=signature, secret=secret)
+            latencies.append(time.perf_counter() - started_at)
+        return {'latencies': latencies, 'elapsed': sum(latencies), 'errors': 0, 'queries': None}
+
+    def replay_in_process(self, payloads, options):
+        url = reverse('stripe-webhook')
+        counter = QueryCounter()
+
+        def deliver(payload):
+            signature = WebhookCorpus.sign(payload, options['secret'])
+            started_at = time.perf_counter()
+            try:
+                with connection.execute_wrapper(counter):
+                    response = Client().post(
+                        url, data=payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+            finally:
+                close_old_connections()
+            return response.status_code, time.perf_counter() - started_at
+
+        return self.replay(deliver, payloads, options['concurrency'], counter)
+
+    def replay_over_http(self, payloads, options):
+        server = counter = None
+        url = options['url']
+        if not url:
+            server, counter = self.start_server()
+            url = f'http://127.0.0.1:{server.server_port}{reverse("stripe-webhook")}'
+
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_maxsize=options['concurrency']))
+        session.mount('https://', HTTPAdapter(pool_maxsize=options['concurrency']))
+
+        def deliver(payload):
+            headers = {
+                'Content-Type': 'application/json',
+                'Stripe-Signature': WebhookCorpus.sign(payload, options['secret']),
+            }
+            started_at = time.perf_counter()
+            response = session.post(url, data=payload, headers=headers, timeout=30)
+            return response.status_code, time.perf_counter() - started_at
+
+        try:
+            return self.replay(deliver, payloads, options['concurrency'], counter)
+        finally:
+            session.close()
+            if server:
+                server.shutdown()
+                server.server_close()
+
+    def start_server(self):
+        # The queries of every request are counted in the threads of the server
+        counter = QueryCounter()
+        handler = WSGIHandler()
+
+        def application(environ, start_response):
+            with connection.execute_wrapper(counter):
+                return handler(environ, start_response)
+
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietWSGIRequestHandler, allow_reuse_address=False)
+        server.set_app(application)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, counter
+
+    def replay(self, deliver, payloads, concurrency, counter):
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(deliver, payloads))
+        return {
+            'latencies': [latency for _, latency in results],
+            'elapsed': time.perf_counter() - started_at,
+            'errors': len([status for status, _ in results if status != 200]),
+            'queries': counter,
+        }
+
+    def report(self, name, result):
+        latencies = result['latencies']
+        queries = result['queries']
+        per_event = (
+            f'queries_per_event={queries.count / len(latencies):.2f} '
+            f'db_ms_per_event={queries.duration * 1000 / len(latencies):.2f} '
+            if queries else '')
+        self.stdout.write(
+            f'{name}: throughput={len(latencies) / result["elapsed"]:.1f} events/s {per_event}'
+            f'p50={percentile(latencies, 50) * 1000:.2f}ms p95={percentile(latencies, 95) * 1000:.2f}ms '
+            f'p99={percentile(latencies, 99) * 1000:.2f}ms max={max(latencies) * 1000:.2f}ms '
+            f'errors={result["errors"]}'
+            + (f' recorded={result["recorded"]}' if 'recorded' in result else ''))
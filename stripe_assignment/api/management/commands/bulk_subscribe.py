@@ -0,0 +1,174 @@
+import csv
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import stripe
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from ...exceptions import (PaymentsAlreadySubscribedError, PaymentsCardError,
+                           PaymentsGatewayError,
+                           PaymentsGatewayUnavailableError)
+from ...models import User
+from ...models.constants import SubscriptionProduct
+from ...services import PaymentsGateway
+
+
+class Pacer:
+
+    # Spreads the subscriptions evenly, at most `rate` of them start every second
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(self.next_start, now)
+            self.next_start = start + self.interval
+        time.sleep(max(start - now, 0))
+
+
+class Command(BaseCommand):
+    help = 'Subscribes the accounts of a CSV file (account_id, card_token, subscription_product), resuming from a checkpoint'
+
+    SUBSCRIBED = 'subscribed'
+    ALREADY_SUBSCRIBED = 'already_subscribed'
+    FAILED = 'failed'
+    # Stripe errors worth retrying, the rest fail the account
+    TRANSIENT_ERRORS = (stripe.error.RateLimitError, stripe.error.APIConnectionError)
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV file with an account_id, card_token and subscription_product header')
+        parser.add_argument(
+            '--checkpoint', help='File recording the processed accounts, by default the CSV file path with .checkpoint')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument(
+            '--rate', type=float, default=10,
+            help='Subscriptions started per second, every one of them makes up to five Stripe calls')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Attempts of the rate limited subscriptions')
+        parser.add_argument('--backoff', type=float, default=1.0, help='Seconds before the first retry, then doubled')
+        parser.add_argument('--product', default=SubscriptionProduct.BASIC_PRODUCT_NAME)
+        parser.add_argument('--retry-failed', action='store_true', help='Retry the accounts that failed in earlier runs')
+        parser.add_argument('--report-every', type=int, default=100)
+
+    def handle(self, *args, **options):
+        if options['max_attempts'] < 1:
+            raise CommandError('--max-attempts must be at least 1')
+        if not os.path.exists(options['file']):
+            raise CommandError(f'{options["file"]} does not exist')
+
+        checkpoint_path = options['checkpoint'] or f'{options["file"]}.checkpoint'
+        done = self.read_checkpoint(checkpoint_path, options['retry_failed'])
+        rows = [row for row in self.read_rows(options['file'], options['product']) if row['account_id'] not in done]
+        self.stdout.write(f'{len(done)} accounts already processed, {len(rows)} to subscribe')
+
+        self.options = options
+        self.pacer = Pacer(options['rate'])
+        self.results = Counter()
+        self.errors = Counter()
+        started_at = time.monotonic()
+
+        with open(checkpoint_path, mode='a') as checkpoint:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                # Only a few rows per worker are in flight, so the progress is checkpointed in order of completion
+                pending = set()
+                for row in rows:
+                    if len(pending) >= options['workers'] * 2:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self.record(checkpoint, finished, started_at)
+                    pending.add(executor.submit(self.subscribe, row))
+                self.record(checkpoint, wait(pending).done, started_at)
+
+        self.report(started_at, final=True)
+
+    def read_rows(self, path, default_product):
+        with open(path, newline='') as rows_file:
+            for row in csv.DictReader(rows_file):
+                yield {
+                    'account_id': row['account_id'].strip(),
+                    'card_token': row['card_token'].strip(),
+                    'subscription_product': (row.get('subscription_product') or default_product).strip(),
+                }
+
+    def read_checkpoint(self, path, retry_failed):
+        done = set()
+        if not os.path.exists(path):
+            return done
+
+        with open(path, mode='r') as checkpoint:
+            for line in checkpoint:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line may be incomplete after a crash
+                    continue
+                if entry['status'] != self.FAILED or not retry_failed:
+                    done.add(entry['account_id'])
+        return done
+
+    def subscribe(self, row):
+        close_old_connections()
+        try:
+            requester = User.objects.filter(account_id=row['account_id']).order_by('date_joined').first()
+            if requester is None:
+                return row['account_id'], self.FAILED, 'NoUser'
+
+            data = {'subscription_product': row['subscription_product'], 'card_token': row['card_token']}
+            error = None
+            for attempt in range(self.options['max_attempts']):
+                self.pacer.wait()
+                try:
+                    PaymentsGateway().create_subscription(requester, data)
+                    return row['account_id'], self.SUBSCRIBED, None
+                except PaymentsAlreadySubscribedError:
+                    return row['account_id'], self.ALREADY_SUBSCRIBED, None
+                except PaymentsCardError:
+                    return row['account_id'], self.FAILED, 'CardError'
+                except PaymentsGatewayUnavailableError as e:
+                    # The circuit breaker is open, the account is retried once it lets a probe through
+                    error = type(e).__name__
+                    time.sleep(e.retry_after)
+                except PaymentsGatewayError as e:
+                    # The gateway keeps the Stripe error as the context of its own
+                    error = type(e.__context__).__name__ if e.__context__ else 'PaymentsGatewayError'
+                    if not isinstance(e.__context__, self.TRANSIENT_ERRORS):
+                        return row['account_id'], self.FAILED, error
+                    time.sleep(self.options['backoff'] * 2 ** attempt)
+
+            return row['account_id'], self.FAILED, error
+        except Exception as e:
+            return row['account_id'], self.FAILED, type(e).__name__
+        finally:
+            close_old_connections()
+
+    def record(self, checkpoint, futures, started_at):
+        for future in futures:
+            account_id, status, error = future.result()
+            checkpoint.write(json.dumps({'account_id': account_id, 'status': status, 'error': error}) + '\n')
+            self.results[status] += 1
+            if error:
+                self.errors[error] += 1
+            if sum(self.results.values()) % self.options['report_every'] == 0:
+                self.report(started_at)
+        # Every completed account survives a crash of the command
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+
+    def report(self, started_at, final=False):
+        elapsed = time.monotonic() - started_at
+        processed = sum(self.results.values())
+        throughput = processed / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{"done" if final else "progress"}: processed={processed} '
+            f'subscribed={self.results[self.SUBSCRIBED]} '
+            f'already_subscribed={self.results[self.ALREADY_SUBSCRIBED]} '
+            f'failed={self.results[self.FAILED]} '
+            f'throughput={throughput:.1f}/s elapsed={elapsed:.1f}s')
+        if final and self.errors:
+            self.stdout.write('errors: ' + ' '.join(f'{error}={count}' for error, count in self.errors.most_common()))
@@ -0,0 +1,42 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services import KeySetTokenBackend
+
+
+class Command(BaseCommand):
+    help = 'Generates a JSON web token key pair and adds its public key to a JWKS key set file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kid', help='Key id of the new key pair')
+        parser.add_argument('--algorithm', default='ES256', choices=KeySetTokenBackend.ALGORITHMS)
+        parser.add_argument('--output-dir', default='.', help='Directory of the <kid>.key and <kid>.key.pub files')
+        parser.add_argument('--key-set', help='JWKS file the public key is added to, created if missing')
+
+    def handle(self, *args, **options):
+        kid = options['kid']
+        private_path = os.path.join(options['output_dir'], f'{kid}.key')
+        public_path = f'{private_path}.pub'
+        if os.path.exists(private_path):
+            raise CommandError(f'{private_path} already exists')
+
+        private_pem, public_pem = KeySetTokenBackend.generate_key_pair(options['algorithm'])
+        with open(private_path, mode='w') as private_key_file:
+            private_key_file.write(private_pem)
+        os.chmod(private_path, 0o600)
+        with open(public_path, mode='w') as public_key_file:
+            public_key_file.write(public_pem)
+        self.stdout.write(f'Wrote {private_path} and {public_path}')
+
+        if options['key_set']:
+            key_set = {'keys': []}
+            if os.path.exists(options['key_set']):
+                with open(options['key_set'], mode='r') as key_set_file:
+                    key_set = json.load(key_set_file)
+            key_set['keys'] = [key for key in key_set['keys'] if key.get('kid') != kid]
+            key_set['keys'].append(KeySetTokenBackend.jwk(options['algorithm'], public_pem, kid))
+            with open(options['key_set'], mode='w') as key_set_file:
+                json.dump(key_set, key_set_file, indent=2)
+            self.stdout.write(f'Added {kid} to {options["key_set"]}')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from ...utils import WebhookCorpus
+
+
+class Command(BaseCommand):
+    help = 'Writes a synthetic stream of customer.subscription.* events, one JSON event per line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='JSON lines file the events are written to')
+        parser.add_argument('--events', type=int, default=10000, help='Distinct events, before the duplicates')
+        parser.add_argument('--accounts', type=int, default=1000, help='Accounts the events are spread over')
+        parser.add_argument(
+            '--duplicate-ratio', type=float, default=0.05, help='Fraction of the events delivered twice')
+        parser.add_argument(
+            '--out-of-order-ratio', type=float, default=0.1,
+            help='Fraction of the events delivered after a newer one')
+        parser.add_argument('--seed', type=int, default=None, help='Seed of the generator, for repeatable corpora')
+        parser.add_argument('--prefix', default='corpus', help='Prefix of the event, customer and subscription ids')
+
+    def handle(self, *args, **options):
+        corpus = WebhookCorpus(
+            events=options['events'],
+            accounts=options['accounts'],
+            duplicate_ratio=options['duplicate_ratio'],
+            out_of_order_ratio=options['out_of_order_ratio'],
+            seed=options['seed'],
+            prefix=options['prefix'])
+        events = corpus.generate()
+        WebhookCorpus.dump(events, options['output'])
+
+        distinct = len({event['id'] for event in events})
+        self.stdout.write(
+            f'Wrote {len(events)} events to {options["output"]}: '
+            f'distinct={distinct} duplicates={len(events) - distinct} accounts={options["accounts"]}')
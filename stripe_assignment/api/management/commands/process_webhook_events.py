@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ...services import WebhookInbox
+from ...utils import metrics
+
+
+class Command(BaseCommand):
+    help = 'Applies the Stripe events stored in the webhook inbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait before polling again when the inbox is empty')
+        parser.add_argument(
+            '--report-interval', type=float, default=10.0,
+            help='Seconds between throughput and lag reports')
+        parser.add_argument('--once', action='store_true', help='Drain the inbox and exit')
+        parser.add_argument(
+            '--no-coalesce', action='store_true',
+            help='Apply every subscription event instead of only the newest one of each subscription in a batch')
+
+    def handle(self, *args, **options):
+        inbox = WebhookInbox()
+        self.report_started_at = time.monotonic()
+        self.report_processed = 0
+
+        try:
+            while True:
+                close_old_connections()
+                events = inbox.drain(options['batch_size'], coalesce=not options['no_coalesce'])
+                self.report_processed += len(events)
+
+                if time.monotonic() - self.report_started_at >= options['report_interval']:
+                    self.report(inbox)
+
+                if len(events) < options['batch_size']:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.report(inbox)
+
+    def report(self, inbox):
+        elapsed = time.monotonic() - self.report_started_at
+        throughput = self.report_processed / elapsed if elapsed else 0
+        stats = inbox.stats()
+        metrics.set_gauge('webhook_inbox.throughput', throughput)
+        metrics.set_gauge('webhook_inbox.backlog', stats['backlog'])
+        self.stdout.write(
+            f'processed={metrics.get("webhook_inbox.processed")} '
+            f'failed={metrics.get("webhook_inbox.failed")} '
+            f'retried={metrics.get("webhook_inbox.retried")} '
+            f'subscription_writes={metrics.get("webhook.subscription_writes")} '
+            f'throughput={throughput:.1f}/s '
+            f'lag={metrics.get_gauge("webhook_inbox.lag_seconds") or 0:.3f}s '
+            f'backlog={stats["backlog"]} '
+            f'oldest_pending={stats["lag_seconds"]:.3f}s')
+        self.report_started_at = time.monotonic()
+        self.report_processed = 0
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ...services import StripeOperations
+
+
+class Command(BaseCommand):
+    help = 'Deletes the stored steps of the failed subscription attempts whose idempotency keys Stripe forgot'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl', type=int, default=None,
+            help=f'Seconds to keep the operations, defaults to the {StripeOperations.KEY_TTL} of Stripe')
+
+    def handle(self, *args, **options):
+        deleted = StripeOperations.prune(options['ttl'])
+        self.stdout.write(f'Deleted {deleted} gateway operations')
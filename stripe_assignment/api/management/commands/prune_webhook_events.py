@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ...services import WebhookEventDeduplicator
+
+
+class Command(BaseCommand):
+    help = 'Deletes the applied webhook events older than the de-duplication TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl', type=int, default=None,
+            help='Seconds to keep the events, defaults to STRIPE_WEBHOOK_DEDUP_TTL')
+
+    def handle(self, *args, **options):
+        deleted = WebhookEventDeduplicator().prune(options['ttl'])
+        self.stdout.write(f'Deleted {deleted} webhook events')
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...services import SubscriptionReconciler
+
+
+class Command(BaseCommand):
+    help = 'Syncs the local subscriptions with their state in Stripe, for the webhooks that were lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='List every Stripe subscription instead of only the ones changed since the last run')
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Subscriptions matched and written at a time, defaults to STRIPE_RECONCILIATION_CHUNK_SIZE')
+        parser.add_argument('--page-size', type=int, default=100, help='Objects fetched per Stripe request')
+        parser.add_argument('--dry-run', action='store_true', help='Report the differences without writing them')
+        parser.add_argument(
+            '--report-interval', type=float, default=10.0,
+            help='Seconds between progress reports')
+
+    def handle(self, *args, **options):
+        reconciler = SubscriptionReconciler(
+            chunk_size=options['chunk_size'], page_size=options['page_size'], dry_run=options['dry_run'])
+        self.started_at = self.reported_at = time.monotonic()
+        self.report_interval = options['report_interval']
+
+        full = reconciler.run(full=options['full'], report=self.progress)
+
+        self.stdout.write(f'{"Full" if full else "Incremental"} run: {self.summary(reconciler.stats)}')
+
+    def progress(self, stats):
+        if time.monotonic() - self.reported_at >= self.report_interval:
+            self.stdout.write(self.summary(stats))
+            self.reported_at = time.monotonic()
+
+    def summary(self, stats):
+        elapsed = time.monotonic() - self.started_at
+        return (
+            f'fetched={stats["fetched"]} '
+            f'matched={stats["matched"]} '
+            f'updated={stats["updated"]} '
+            f'unmatched={stats["unmatched"]} '
+            f'elapsed={elapsed:.1f}s '
+            f'throughput={stats["fetched"] / elapsed if elapsed else 0:.1f} rows/s')
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...utils.stripe_stand_in import LatencyDistribution, StripeStandIn
+
+
+class Command(BaseCommand):
+    help = 'Serves a local stand-in of the Stripe API used by the gateway, for offline load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument('--latency', type=float, default=0.2, help='Mean, or median for lognormal, in seconds')
+        parser.add_argument(
+            '--latency-distribution', default='lognormal', choices=LatencyDistribution.DISTRIBUTIONS)
+        parser.add_argument('--latency-sigma', type=float, default=0.5, help='Shape of the lognormal tail')
+        parser.add_argument('--error-rate', type=float, default=0, help='Fraction of calls answered with a 500')
+        parser.add_argument('--decline-rate', type=float, default=0, help='Fraction of cards declined')
+        parser.add_argument(
+            '--rate-limit', type=int, default=0, help='Calls per second answered before the 429s, 0 for no limit')
+        parser.add_argument(
+            '--webhook-url', default='',
+            help='Where the subscription events are posted, like http://localhost:8000/api/stripe-webhook/')
+        parser.add_argument(
+            '--webhook-secret', default=None, help='Signing secret of the events, defaults to STRIPE_WEBHOOK_SECRET')
+        parser.add_argument('--webhook-delay', type=float, default=1.0, help='Seconds before posting every event')
+        parser.add_argument('--subscription-status', default='active')
+
+    def handle(self, *args, **options):
+        server = StripeStandIn(
+            (options['host'], options['port']),
+            latency=LatencyDistribution(
+                options['latency_distribution'], options['latency'], options['latency_sigma']),
+            error_rate=options['error_rate'],
+            decline_rate=options['decline_rate'],
+            rate_limit=options['rate_limit'],
+            webhook_url=options['webhook_url'],
+            webhook_secret=(
+                settings.STRIPE_WEBHOOK_SECRET if options['webhook_secret'] is None else options['webhook_secret']),
+            webhook_delay=options['webhook_delay'],
+            subscription_status=options['subscription_status'])
+
+        self.stdout.write(f'Stripe stand-in listening on {server.url}, run the app with STRIPE_API_BASE={server.url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(' '.join(f'{name}={value}' for name, value in server.stats().items()))
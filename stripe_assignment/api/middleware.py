@@ -0,0 +1,75 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .utils import QueryBudgets, QueryCounter, current_counter
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    # WhiteNoise only handles sync requests. A sync middleware makes Django run the rest of the chain of every
+    # request in a single thread under ASGI, so the async views would be served one at a time.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall(request)
+        return super().__call__(request)
+
+    async def __acall(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class QueryBudgetMiddleware:
+    # Counts the queries and database time of every request by view name, for the budgets of query_budgets.json.
+    # The counter lives in the request context, so the queries of the async workers are counted too.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budgets = QueryBudgets()
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall(request)
+
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.__record(request, response, counter)
+
+    async def __acall(self, request):
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.__record(request, response, counter)
+
+    def __record(self, request, response, counter):
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        if view_name:
+            self.budgets.record(view_name, counter)
+        # Read by the tests to check the budgets
+        response.db_view_name = view_name
+        response.db_queries = counter
+        return response
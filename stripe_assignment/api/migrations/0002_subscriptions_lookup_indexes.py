@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['account', 'created_at'], name='customer_active_account_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentmethod',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['account', 'created_at'], name='payment_method_active_acc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['account', 'created_at'], name='subscription_account_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.UniqueConstraint(fields=('id_reference',), name='customer_id_reference_uniq'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:20
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_subscriptions_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('event_id', models.CharField(blank=True, default=None, max_length=50, null=True, verbose_name='Event id')),
+                ('type', models.CharField(blank=True, default='', max_length=100, verbose_name='Type')),
+                ('payload', models.JSONField(verbose_name='Payload')),
+                ('status', models.CharField(default='pending', max_length=50, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Error')),
+                ('processed_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Processed at')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='webhook_event_pending_idx'),
+        ),
+    ]
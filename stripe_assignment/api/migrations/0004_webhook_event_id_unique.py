@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_webhook_inbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='event_id',
+            field=models.CharField(blank=True, default=None, max_length=50, null=True, unique=True, verbose_name='Event id'),
+        ),
+    ]
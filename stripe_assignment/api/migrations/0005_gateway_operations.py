@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_webhook_event_id_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GatewayOperation',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('idempotency_key', models.CharField(max_length=64, unique=True, verbose_name='Idempotency key')),
+                ('operation', models.CharField(max_length=50, verbose_name='Operation')),
+                ('result_reference', models.CharField(blank=True, default='', max_length=50, verbose_name='Result reference')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gateway_operations', to='api.account', verbose_name='GatewayOperation')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
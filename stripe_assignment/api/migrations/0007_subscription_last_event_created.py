@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_subscription_reconciliation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='last_event_created',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Last event created'),
+        ),
+    ]
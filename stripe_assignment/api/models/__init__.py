@@ -1,2 +1,4 @@
 from .auth import Account, User
-from .subscriptions import Customer, PaymentMethod, Subscription
+from .subscriptions import (Customer, GatewayOperation, PaymentMethod,
+                            ReconciliationCursor, Subscription)
+from .webhooks import WebhookEvent
@@ -12,6 +12,18 @@ class SubscriptionStatus:
     PENDING = 'pending'
 
 
+class WebhookEventStatus:
+    PENDING = 'pending'
+    PROCESSED = 'processed'
+    FAILED = 'failed'
+
+
+class StripeGatewayMode:
+    SEQUENTIAL = 'sequential'
+    CONCURRENT = 'concurrent'
+    COMPACT = 'compact'
+
+
 class SubscriptionProduct:
     BASIC_PRODUCT_NAME = 'basic_subscription'
     PRO_PRODUCT_NAME = 'pro_subscription'
@@ -15,6 +15,16 @@ class Customer(TimeStampMixin):
         verbose_name="Customer", on_delete=models.CASCADE
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['account', 'created_at'], condition=models.Q(is_active=True),
+                name='customer_active_account_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['id_reference'], name='customer_id_reference_uniq'),
+        ]
+
 
 class PaymentMethod(TimeStampMixin):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -26,6 +36,13 @@ class PaymentMethod(TimeStampMixin):
         verbose_name="PaymentMethod", on_delete=models.CASCADE
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['account', 'created_at'], condition=models.Q(is_active=True),
+                name='payment_method_active_acc_idx'),
+        ]
+
 
 class Subscription(TimeStampMixin):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -35,11 +52,35 @@ class Subscription(TimeStampMixin):
     current_period_end = models.DateTimeField('current_period_end', default=None, blank=True, null=True)
     id_reference = models.CharField('Id reference', max_length=50, blank=True, default='')
     price_reference = models.CharField('Price reference', max_length=50, blank=False, default='')
+    # Stripe `created` timestamp of the newest event applied, older events are not applied over it
+    last_event_created = models.PositiveBigIntegerField('Last event created', default=0)
     account = models.ForeignKey(
         'api.Account', null=False, related_name='subscriptions',
         verbose_name="Subscription", on_delete=models.CASCADE
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'created_at'], name='subscription_account_idx'),
+            models.Index(fields=['id_reference'], name='subscription_reference_idx'),
+        ]
+
     @property
     def purchase_date(self):
         return self.created_at.date()
+
+
+class GatewayOperation(TimeStampMixin):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    idempotency_key = models.CharField('Idempotency key', max_length=64, unique=True)
+    operation = models.CharField('Operation', max_length=50, blank=False)
+    result_reference = models.CharField('Result reference', max_length=50, blank=True, default='')
+    account = models.ForeignKey(
+        'api.Account', null=False, related_name='gateway_operations',
+        verbose_name="GatewayOperation", on_delete=models.CASCADE
+    )
+
+
+class ReconciliationCursor(TimeStampMixin):
+    name = models.CharField('Name', max_length=50, primary_key=True)
+    high_water_mark = models.PositiveBigIntegerField('High water mark', default=0)
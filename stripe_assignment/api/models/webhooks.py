@@ -0,0 +1,26 @@
+import uuid
+
+from django.db import models
+from django.utils import timezone
+
+from .constants import WebhookEventStatus
+from .mixins import TimeStampMixin
+
+
+class WebhookEvent(TimeStampMixin):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    event_id = models.CharField('Event id', max_length=50, blank=True, null=True, default=None, unique=True)
+    type = models.CharField('Type', max_length=100, blank=True, default='')
+    payload = models.JSONField('Payload')
+    status = models.CharField('Status', max_length=50, blank=False, default=WebhookEventStatus.PENDING)
+    attempts = models.PositiveIntegerField('Attempts', default=0)
+    error = models.TextField('Error', blank=True, default='')
+    processed_at = models.DateTimeField('Processed at', default=None, blank=True, null=True)
+    next_attempt_at = models.DateTimeField('Next attempt at', default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['created_at'], condition=models.Q(status=WebhookEventStatus.PENDING),
+                name='webhook_event_pending_idx'),
+        ]
@@ -1,2 +1,4 @@
+from . import async_subscriptions
+from .metrics import HealthView, MetricsView
 from .subscriptions import StripeWebookView, SubscriptionsViewSet
-from .token import ObtainTokenPairView
+from .token import ObtainTokenPairView, RefreshTokenView
@@ -0,0 +1,112 @@
+import json
+
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+
+from ..authentication import ClaimsJWTAuthentication
+from ..services import (BillingProfile, IdempotentRequests, PaymentsWebhook,
+                        SubscriptionStatusCache)
+from ..utils import run_in_worker
+from .conditional import not_modified, with_validators
+from .subscribe import (IDEMPOTENCY_ERRORS, create_subscription,
+                        error_answer, invalid_idempotency_key)
+
+# Async versions of the subscriptions endpoints, meant to be served by an ASGI server.
+# The blocking database and Stripe work runs in the async workers pool.
+
+
+def authenticate(request):
+    try:
+        result = ClaimsJWTAuthentication().authenticate(request)
+    except AuthenticationFailed as e:
+        return None, e
+
+    if result is None:
+        return None, NotAuthenticated()
+
+    user, _ = result
+    return user, None
+
+
+def unauthorized(error):
+    response = JsonResponse({'detail': error.detail}, status=error.status_code)
+    response['WWW-Authenticate'] = ClaimsJWTAuthentication().authenticate_header(None)
+    return response
+
+
+def answer(result):
+    status_code, body, headers = result
+    response = HttpResponse(status=status_code) if body is None else JsonResponse(body, status=status_code)
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def subscribe_once(user, idempotency_key, data):
+    try:
+        return IdempotentRequests(user, idempotency_key).run(data, lambda: answer(create_subscription(user, data)))
+
+    except IDEMPOTENCY_ERRORS as e:
+        return answer(error_answer(e))
+
+
+async def subscribe(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    user, error = await run_in_worker(authenticate, request)
+    if user is None:
+        return unauthorized(error)
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError as e:
+        return JsonResponse({'detail': f'JSON parse error - {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if not idempotency_key:
+        return answer(await run_in_worker(create_subscription, user, data))
+
+    invalid = invalid_idempotency_key(idempotency_key)
+    if invalid:
+        return answer(invalid)
+
+    return await run_in_worker(subscribe_once, user, idempotency_key, data)
+
+
+async def subscription_status(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    user, error = await run_in_worker(authenticate, request)
+    if user is None:
+        return unauthorized(error)
+
+    response = await run_in_worker(not_modified, request, user.account_id)
+    if response is not None:
+        return response
+
+    entry = await run_in_worker(
+        SubscriptionStatusCache().get, user.account_id, lambda: BillingProfile.load(user).subscription)
+    if entry is not None:
+        return with_validators(JsonResponse(entry['payload']), entry['validators'])
+
+    return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+
+
+async def stripe_webhook(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    # The webhook reads the event like the sync view, from a rest framework request
+    await run_in_worker(PaymentsWebhook().handle_event, Request(request, parsers=[JSONParser()]))
+    return JsonResponse("OK", safe=False)
+
+
+# Authentication is done with the JWT header, so the CSRF protection is not needed
+subscribe.csrf_exempt = True
+subscription_status.csrf_exempt = True
+stripe_webhook.csrf_exempt = True
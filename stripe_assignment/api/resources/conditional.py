@@ -0,0 +1,29 @@
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from ..services import SubscriptionStatusCache
+from ..utils import metrics
+
+
+def not_modified(request, account_id):
+    # Polling clients send the validators of their last response, answered without loading the subscription
+    if not request.META.get('HTTP_IF_NONE_MATCH') and not request.META.get('HTTP_IF_MODIFIED_SINCE'):
+        return None
+
+    validators = SubscriptionStatusCache().get_validators(account_id)
+    if validators is None:
+        return None
+
+    response = get_conditional_response(
+        request, etag=validators['etag'], last_modified=int(validators['last_modified']))
+    if response is None:
+        return None
+
+    metrics.increment('subscription_status.not_modified')
+    return with_validators(response, validators)
+
+
+def with_validators(response, validators):
+    response['ETag'] = validators['etag']
+    response['Last-Modified'] = http_date(validators['last_modified'])
+    return response
@@ -0,0 +1,48 @@
+from drf_spectacular.utils import extend_schema
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ..authentication import ClaimsJWTAuthentication
+from ..services import (StripeCircuitBreaker, StripeClient,
+                        WebhookEventDeduplicator, WebhookInbox)
+from ..utils import QueryBudgets, metrics
+
+
+class MetricsView(APIView):
+
+    permission_classes = (permissions.IsAdminUser,)
+
+    @extend_schema(
+        description="""
+            Endpoint to return the counters collected by the current process. Only available for staff users.
+        """
+    )
+    def get(self, request, format=None):
+        return Response({
+            **metrics.snapshot(),
+            'webhook_inbox': WebhookInbox().stats(),
+            'webhook_dedup': WebhookEventDeduplicator().stats(),
+            'stripe_http': StripeClient.stats(),
+            'jwt_token_cache': ClaimsJWTAuthentication.stats(),
+            'stripe_circuit': StripeCircuitBreaker().stats(),
+            'db_budgets': QueryBudgets().stats(),
+        })
+
+
+class HealthView(APIView):
+
+    authentication_classes = ()
+    permission_classes = (permissions.AllowAny,)
+
+    @extend_schema(
+        description="""
+            Endpoint for the load balancer health checks. Answers 200 while the process is alive and reports the
+            state of its Stripe circuit breaker, the status and webhook endpoints keep working while it is open.
+        """
+    )
+    def get(self, request, format=None):
+        # The circuit is per process, failing the check would take the whole instance out of rotation
+        circuit = StripeCircuitBreaker().stats()
+        is_open = circuit['state'] == StripeCircuitBreaker.OPEN
+        return Response({'status': 'degraded' if is_open else 'ok', 'stripe_circuit': circuit})
@@ -0,0 +1,55 @@
+from rest_framework import status
+
+from ..exceptions import (IdempotencyKeyInProgressError,
+                          IdempotencyKeyMismatchError,
+                          PaymentsAlreadySubscribedError, PaymentsCardError,
+                          PaymentsGatewayError,
+                          PaymentsGatewayUnavailableError)
+from ..serializers import SubscribeSerializer
+from ..services import PaymentsGateway
+
+# The subscribe logic shared by the sync and async endpoints. Every answer is a (status, body, headers) tuple,
+# rendered by each endpoint with its own response class.
+
+ERROR_STATUSES = {
+    PaymentsCardError: status.HTTP_400_BAD_REQUEST,
+    PaymentsGatewayError: status.HTTP_400_BAD_REQUEST,
+    PaymentsAlreadySubscribedError: status.HTTP_409_CONFLICT,
+    PaymentsGatewayUnavailableError: status.HTTP_503_SERVICE_UNAVAILABLE,
+    IdempotencyKeyInProgressError: status.HTTP_409_CONFLICT,
+    IdempotencyKeyMismatchError: status.HTTP_422_UNPROCESSABLE_ENTITY,
+}
+GATEWAY_ERRORS = (
+    PaymentsCardError, PaymentsGatewayError, PaymentsAlreadySubscribedError, PaymentsGatewayUnavailableError)
+IDEMPOTENCY_ERRORS = (IdempotencyKeyInProgressError, IdempotencyKeyMismatchError)
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def create_subscription(user, data):
+    serializer = SubscribeSerializer(data=data)
+    if not serializer.is_valid():
+        return status.HTTP_400_BAD_REQUEST, serializer.errors, {}
+
+    try:
+        PaymentsGateway().create_subscription(user, serializer.validated_data)
+    except GATEWAY_ERRORS as e:
+        return error_answer(e)
+
+    return status.HTTP_200_OK, None, {}
+
+
+def error_answer(error):
+    headers = {}
+    if isinstance(error, PaymentsGatewayUnavailableError):
+        headers['Retry-After'] = str(error.retry_after)
+    return ERROR_STATUSES[type(error)], {"non_field_errors": [error.message]}, headers
+
+
+def invalid_idempotency_key(idempotency_key):
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return (
+            status.HTTP_400_BAD_REQUEST,
+            {"non_field_errors": [f"The Idempotency-Key must have at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters"]},
+            {})
+    return None
@@ -1,13 +1,22 @@
-from drf_spectacular.utils import extend_schema
+import json
+
+from django.http import StreamingHttpResponse
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 
-from ..exceptions import (PaymentsAlreadySubscribedError, PaymentsCardError,
-                          PaymentsGatewayError)
-from ..serializers import StatusSerializer, SubscribeSerializer
-from ..services import PaymentsGateway, PaymentsWebhook
+from ..authentication import ServiceKeyAuthentication
+from ..serializers import (BulkStatusSerializer, StatusSerializer,
+                           SubscribeSerializer)
+from ..services import (BillingProfile, BulkSubscriptionStatus,
+                        IdempotentRequests, PaymentsWebhook,
+                        SubscriptionStatusCache)
+from .conditional import not_modified, with_validators
+from .subscribe import (IDEMPOTENCY_ERRORS, create_subscription,
+                        error_answer, invalid_idempotency_key)
 
 
 class SubscriptionsViewSet(viewsets.ViewSet):
@@ -15,38 +24,55 @@ class SubscriptionsViewSet(viewsets.ViewSet):
     @extend_schema(
         request=SubscribeSerializer,
         responses=SubscribeSerializer,
+        parameters=[
+            OpenApiParameter(
+                name='Idempotency-Key',
+                type=str,
+                location=OpenApiParameter.HEADER,
+                required=False,
+                description='Unique key of the request, repeated requests with the same key replay the first response'
+            )
+        ],
         description="""
             Endpoint to subscribe to stripe when passing the valid data.
             If there is an existing customer, payment method or subscription for the
             requester user, it will be not created again.
+            Requests sent with an Idempotency-Key header are only processed once, repeated
+            requests with the same key receive the first response.
         """
     )
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated], url_path='subscribe')
     def subscribe(self, request):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            return self.__subscribe(request)
+
+        invalid = invalid_idempotency_key(idempotency_key)
+        if invalid:
+            return self.__answer(invalid)
+
+        try:
+            return IdempotentRequests(request.user, idempotency_key).run(
+                request.data, lambda: self.__render(request, self.__subscribe))
+
+        except IDEMPOTENCY_ERRORS as e:
+            return self.__answer(error_answer(e))
+
+    def __subscribe(self, request):
+        return self.__answer(create_subscription(request.user, request.data))
 
-        serializer = SubscribeSerializer(data=request.data)
-        if serializer.is_valid(raise_exception=True):
-            try:
-                gateway = PaymentsGateway()
-                gateway.create_subscription(request.user, serializer.validated_data)
-
-            except PaymentsCardError as e:
-                return Response(
-                    {"non_field_errors": [e.message]},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            except PaymentsGatewayError as e:
-                return Response(
-                    {"non_field_errors": [e.message]},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            except PaymentsAlreadySubscribedError as e:
-                return Response(
-                    {"non_field_errors": [e.message]},
-                    status=status.HTTP_409_CONFLICT
-                )
-
-        return Response(status=status.HTTP_200_OK)
+    def __answer(self, answer):
+        status_code, body, headers = answer
+        return Response(body, status=status_code, headers=headers)
+
+    def __render(self, request, handler):
+        # Stored responses are replayed byte for byte, so they are rendered here instead of after the action
+        try:
+            response = handler(request)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        return self.finalize_response(request, response).render()
 
     @extend_schema(
         request=StatusSerializer,
@@ -57,17 +83,57 @@ class SubscriptionsViewSet(viewsets.ViewSet):
         description="""
             Endpoint to return the current subscription for the requester user, if any.
             If there is not a created subscription the response status will be 404.
+            The response has ETag and Last-Modified headers. Requests sending them back in the
+            If-None-Match or If-Modified-Since headers get a 304 while the subscription is unchanged.
         """
     )
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated], url_path='status')
     def status(self, request):
-        subscription = request.user.get_subscription()
-        if subscription:
-            serializer = StatusSerializer(instance=subscription)
-            return Response(serializer.data)
+        response = not_modified(request, request.user.account_id)
+        if response is not None:
+            return response
+
+        entry = SubscriptionStatusCache().get(
+            request.user.account_id, lambda: BillingProfile.load(request.user).subscription)
+        if entry is not None:
+            return with_validators(Response(entry['payload']), entry['validators'])
 
         return Response(status=status.HTTP_404_NOT_FOUND)
 
+    @extend_schema(
+        request=BulkStatusSerializer,
+        responses={
+            200: {},
+            400: {},
+        },
+        description="""
+            Endpoint for internal services to return the current subscription of several accounts.
+            Authenticated with an "Authorization: Service <key>" header.
+            The response is streamed as {"results": [{"account_id": ..., "subscription": ...}]}, in the
+            order of the requested account ids. The subscription is null for accounts without one.
+        """
+    )
+    @action(
+        detail=False,
+        methods=['post'],
+        authentication_classes=[ServiceKeyAuthentication],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path='bulk-status')
+    def bulk_status(self, request):
+        serializer = BulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        account_ids = list(dict.fromkeys(serializer.validated_data['account_ids']))
+
+        def results():
+            yield '{"results": ['
+            for index, (account_id, payload) in enumerate(BulkSubscriptionStatus().iterate(account_ids)):
+                separator = ', ' if index else ''
+                yield separator + json.dumps(
+                    {'account_id': f'{account_id}', 'subscription': payload}, cls=JSONEncoder)
+            yield ']}'
+
+        return StreamingHttpResponse(results(), content_type='application/json')
+
 
 class StripeWebookView(APIView):
 
@@ -1,9 +1,15 @@
 from rest_framework import permissions
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import (TokenObtainPairView,
+                                            TokenRefreshView)
 
-from ..serializers import MyTokenObtainPairSerializer
+from ..serializers import MyTokenObtainPairSerializer, MyTokenRefreshSerializer
 
 
 class ObtainTokenPairView(TokenObtainPairView):
     permission_classes = (permissions.AllowAny,)
     serializer_class = MyTokenObtainPairSerializer
+
+
+class RefreshTokenView(TokenRefreshView):
+    permission_classes = (permissions.AllowAny,)
+    serializer_class = MyTokenRefreshSerializer
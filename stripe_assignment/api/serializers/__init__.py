@@ -1,2 +1,3 @@
-from .subscriptions import StatusSerializer, SubscribeSerializer
-from .token import MyTokenObtainPairSerializer
+from .subscriptions import (BulkStatusSerializer, StatusSerializer,
+                            SubscribeSerializer)
+from .token import MyTokenObtainPairSerializer, MyTokenRefreshSerializer
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.utils import timezone
 from rest_framework import serializers
 
@@ -56,3 +57,10 @@ class StatusSerializer(serializers.ModelSerializer):
             'price_reference',
             'purchase_date',
         ]
+
+
+class BulkStatusSerializer(serializers.Serializer):
+    account_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=settings.SUBSCRIPTION_BULK_STATUS_MAX_ACCOUNTS)
@@ -1,4 +1,17 @@
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,
+                                                  TokenRefreshSerializer)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..services import AuthUserCache
+
+
+def set_user_claims(token, account_id, is_active):
+    # Enough to authenticate the requests without reading the user from the database
+    token['account_id'] = f'{account_id}'
+    token['is_active'] = is_active
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -7,5 +20,29 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     def get_token(cls, user):
         token = super(MyTokenObtainPairSerializer, cls).get_token(user)
         token['app_name'] = "Stripe Assignment"
+        set_user_claims(token, user.account_id, user.is_active)
 
         return token
+
+
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+
+        # The claims of the refresh token were copied when it was issued, the user is read again
+        # so deactivated users cannot keep refreshing their tokens
+        user = AuthUserCache().reload(refresh.get(api_settings.USER_ID_CLAIM))
+        if user is None or not user['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        set_user_claims(refresh, user['account_id'], user['is_active'])
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+
+            data['refresh'] = str(refresh)
+
+        return data
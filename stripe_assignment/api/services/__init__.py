@@ -1,2 +1,15 @@
+from .auth_user_cache import AuthUserCache
+from .billing_profile import BillingProfile
+from .bulk_subscription_status import BulkSubscriptionStatus
+from .idempotent_requests import IdempotentRequests
 from .payments_gateway import PaymentsGateway
 from .payments_webhook import PaymentsWebhook
+from .stripe_circuit_breaker import StripeCircuitBreaker
+from .stripe_client import StripeClient
+from .stripe_operations import StripeOperations
+from .stripe_rate_limiter import StripeRateLimiter
+from .subscription_reconciler import SubscriptionReconciler
+from .subscription_status_cache import SubscriptionStatusCache
+from .token_backend import KeySetTokenBackend
+from .webhook_deduplication import WebhookEventDeduplicator
+from .webhook_inbox import WebhookInbox
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from ..models import User
+from ..utils import metrics
+
+
+class AuthUserCache:
+
+    FIELDS = ('id', 'account_id', 'is_active', 'is_staff')
+
+    def __init__(self):
+        self.cache = caches[settings.AUTH_USER_CACHE_ALIAS]
+
+    def get(self, user_id):
+        claims = self.cache.get(self.__key(user_id))
+        if claims is not None:
+            metrics.increment('auth_user_cache.hits')
+            return claims
+
+        metrics.increment('auth_user_cache.misses')
+        return self.reload(user_id)
+
+    def reload(self, user_id):
+        claims = User.objects.filter(id=user_id).values(*self.FIELDS).first()
+        if claims is None:
+            self.invalidate(user_id)
+        else:
+            self.cache.set(self.__key(user_id), claims, settings.AUTH_USER_CACHE_TTL)
+        return claims
+
+    def invalidate(self, user_id):
+        self.cache.delete(self.__key(user_id))
+
+    def __key(self, user_id):
+        return f'auth_user:{user_id}'
@@ -0,0 +1,62 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import OuterRef, Subquery
+
+from ..models import Account, Customer, PaymentMethod, Subscription
+
+
+class BillingProfile:
+
+    # Fields loaded for every model, the rest are deferred and loaded on access
+    FIELDS = {
+        'customer': (Customer, ['id', 'is_active', 'id_reference']),
+        'payment_method': (PaymentMethod, ['id', 'is_active', 'id_reference', 'type']),
+        'subscription': (
+            Subscription,
+            [field.attname for field in Subscription._meta.concrete_fields if field.attname != 'account_id']),
+    }
+
+    def __init__(self, account_id, customer=None, payment_method=None, subscription=None):
+        self.account_id = account_id
+        self.customer = customer
+        self.payment_method = payment_method
+        self.subscription = subscription
+
+    @classmethod
+    def load(cls, user):
+        # Memoised on the authenticated user, which only lives for one request
+        profile = getattr(user, '_billing_profile', None)
+        if profile is None:
+            profile = cls.fetch(user.account_id)
+            user._billing_profile = profile
+        return profile
+
+    @classmethod
+    def fetch(cls, account_id):
+        # A single query, every column is an index seek on the account of the earliest matching row
+        querysets = {
+            'customer': Customer.objects.filter(account=OuterRef('pk'), is_active=True),
+            'payment_method': PaymentMethod.objects.filter(account=OuterRef('pk'), is_active=True),
+            'subscription': Subscription.objects.filter(account=OuterRef('pk')),
+        }
+        annotations = {
+            f'{name}_{field}': Subquery(querysets[name].order_by('created_at').values(field)[:1])
+            for name, (_, fields) in cls.FIELDS.items()
+            for field in fields
+        }
+        row = Account.objects.filter(pk=account_id).values(**annotations).first() or {}
+
+        return cls(account_id, **{
+            name: cls.__instance(model, {
+                'account_id': account_id,
+                **{field: row.get(f'{name}_{field}') for field in fields},
+            })
+            for name, (model, fields) in cls.FIELDS.items()
+        })
+
+    @staticmethod
+    def __instance(model, values):
+        if values['id'] is None:
+            return None
+
+        ordered_fields = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+        return model.from_db(DEFAULT_DB_ALIAS, ordered_fields, [values[field] for field in ordered_fields])
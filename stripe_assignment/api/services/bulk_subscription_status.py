@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import connection
+
+from ..models import Subscription
+from ..serializers import StatusSerializer
+
+
+class BulkSubscriptionStatus:
+
+    # The columns read by the StatusSerializer, purchase_date comes from created_at
+    FIELDS = (
+        'account_id',
+        'created_at',
+        'status',
+        'payment_gateway_status',
+        'current_period_start',
+        'current_period_end',
+        'id_reference',
+        'price_reference',
+    )
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or settings.SUBSCRIPTION_BULK_STATUS_CHUNK_SIZE
+
+    def iterate(self, account_ids):
+        # One query per chunk keeps the memory bounded however many accounts are requested
+        for offset in range(0, len(account_ids), self.chunk_size):
+            chunk = account_ids[offset:offset + self.chunk_size]
+            subscriptions = self.fetch(chunk)
+            for account_id in chunk:
+                subscription = subscriptions.get(account_id)
+                yield account_id, dict(StatusSerializer(instance=subscription).data) if subscription else None
+
+    def fetch(self, account_ids):
+        # The earliest subscription of each account, like User.get_subscription
+        queryset = Subscription.objects.filter(account_id__in=account_ids).only(*self.FIELDS)
+        if connection.features.can_distinct_on_fields:
+            return {
+                subscription.account_id: subscription
+                for subscription in queryset.order_by('account_id', 'created_at').distinct('account_id')
+            }
+
+        subscriptions = {}
+        for subscription in queryset.order_by('created_at'):
+            subscriptions.setdefault(subscription.account_id, subscription)
+        return subscriptions
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from ..exceptions import (IdempotencyKeyInProgressError,
+                          IdempotencyKeyMismatchError)
+from ..utils import metrics
+
+
+class IdempotentRequests:
+
+    def __init__(self, requester, idempotency_key):
+        self.cache = caches[settings.IDEMPOTENCY_CACHE_ALIAS]
+        self.key = f'idempotency:{requester.id}:{idempotency_key}'
+        self.lock_key = f'{self.key}:lock'
+
+    def run(self, data, handler):
+        fingerprint = self.fingerprint(data)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+        token = uuid.uuid4().hex
+
+        while True:
+            stored = self.cache.get(self.key)
+            if stored is not None:
+                return self.__replay(stored, fingerprint)
+
+            if self.cache.add(self.lock_key, token, settings.IDEMPOTENCY_LOCK_TTL):
+                break
+
+            # A concurrent duplicate is running the gateway calls, wait for its response
+            if time.monotonic() >= deadline:
+                raise IdempotencyKeyInProgressError(
+                    message='A request with the same Idempotency-Key is still in progress')
+            metrics.increment('idempotency.waits')
+            time.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+
+        try:
+            # The response may have been stored between the first read and taking the lock
+            stored = self.cache.get(self.key)
+            if stored is not None:
+                return self.__replay(stored, fingerprint)
+
+            response = handler()
+            if response.status_code < 500:
+                self.cache.set(self.key, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'content': response.content,
+                    'content_type': response.get('Content-Type'),
+                }, settings.IDEMPOTENCY_KEY_TTL)
+            return response
+        finally:
+            if self.cache.get(self.lock_key) == token:
+                self.cache.delete(self.lock_key)
+
+    def fingerprint(self, data):
+        return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+    def __replay(self, stored, fingerprint):
+        if stored['fingerprint'] != fingerprint:
+            raise IdempotencyKeyMismatchError(
+                message='The Idempotency-Key was already used with a different request')
+
+        metrics.increment('idempotency.replays')
+        response = HttpResponse(stored['content'], status=stored['status'])
+        # Empty responses are rendered without a content type
+        if stored['content_type']:
+            response['Content-Type'] = stored['content_type']
+        else:
+            del response['Content-Type']
+        response['Idempotent-Replayed'] = 'true'
+        return response
@@ -1,30 +1,42 @@
 import stripe
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 
 from ..exceptions import (PaymentsAlreadySubscribedError, PaymentsCardError,
                           PaymentsGatewayError)
-from ..models import Customer, PaymentMethod, Subscription
-from ..models.constants import (PaymentMethodType, SubscriptionProduct,
-                                SubscriptionStatus)
+from ..models import Account, Customer, PaymentMethod, Subscription
+from ..models.constants import (PaymentMethodType, StripeGatewayMode,
+                                SubscriptionProduct, SubscriptionStatus)
+from .billing_profile import BillingProfile
+from .stripe_call_graph import StripeCallGraph
+from .stripe_circuit_breaker import StripeCircuitBreaker
+from .stripe_operations import StripeOperations
+from .subscription_status_cache import SubscriptionStatusCache
 
 
 class PaymentsGateway:
 
     def __init__(self):
-        stripe.api_key = settings.STRIPE_API_SECRET
+        self.stripe_calls = 0
 
     def create_subscription(self, requester, data):
-        try:
-            customer = requester.get_customer()
-            if customer:
-                customer_reference = customer.id_reference
-            else:
-                customer_reference = self.__create_customer(requester)
-
-            if not requester.get_payment_method():
-                self.__create_payment_method(requester, customer_reference, data)
+        profile = BillingProfile.load(requester)
+        if profile.subscription:
+            raise PaymentsAlreadySubscribedError(message="Already subscribed!")
 
-            self.__create_subscription(requester, customer_reference, data)
+        # Fails fast while Stripe is degraded, before creating any local row
+        breaker = StripeCircuitBreaker()
+        probe = breaker.allow()
+        operations = StripeOperations(requester, data)
+        try:
+            with operations:
+                if settings.STRIPE_GATEWAY_MODE == StripeGatewayMode.CONCURRENT:
+                    self.__create_subscription_concurrently(operations, requester, profile, data)
+                elif settings.STRIPE_GATEWAY_MODE == StripeGatewayMode.COMPACT:
+                    self.__create_subscription_compactly(operations, requester, profile, data)
+                else:
+                    self.__create_subscription_sequentially(operations, requester, profile, data)
 
         except stripe.error.CardError as e:
             raise PaymentsCardError(message=e.user_message)
@@ -49,68 +61,226 @@ class PaymentsGateway:
             self.__delete_temporal_subscription(requester)
             raise PaymentsGatewayError(message=f'{e}')
 
-    def __create_customer(self, requester):
-        customer = stripe.Customer.create(
-            name=requester.name,
-            email=requester.email,
-            metadata={'user_id': f'{requester.id}'}
+        finally:
+            breaker.release(probe)
+            self.stripe_calls = operations.calls
+
+    def __create_subscription_sequentially(self, operations, requester, profile, data):
+        if profile.customer:
+            customer_reference = profile.customer.id_reference
+        else:
+            customer_reference = self.__create_customer(operations, requester, profile)
+
+        if not profile.payment_method:
+            self.__create_payment_method(operations, requester, profile, customer_reference, data)
+
+        self.__create_subscription(operations, requester, profile, customer_reference, data)
+
+    def __create_subscription_concurrently(self, operations, requester, profile, data):
+        # Stripe calls run in the graph thread pool as soon as their inputs are known,
+        # the database work stays on the request thread
+        graph = StripeCallGraph()
+        if profile.customer:
+            graph.add('customer', lambda results: profile.customer.id_reference, local=True)
+        else:
+            # The requester name and email may be read from the database
+            customer_params = self.__customer_params(requester)
+            graph.add('customer', lambda results: operations.call(
+                'customer.create', stripe.Customer.create, **customer_params))
+            graph.add(
+                'customer_record',
+                lambda results: self.__save_customer(requester, profile, results['customer']),
+                depends_on=['customer'],
+                local=True,
+                record=True)
+
+        subscription_dependencies = ['customer']
+        if not profile.payment_method:
+            graph.add('payment_method', lambda results: operations.call(
+                'payment_method.create', stripe.PaymentMethod.create, **self.__payment_method_params(data)))
+            graph.add(
+                'payment_method.attach',
+                lambda results: operations.call(
+                    'payment_method.attach',
+                    stripe.PaymentMethod.attach,
+                    sid=results['payment_method'],
+                    customer=results['customer']),
+                depends_on=['customer', 'payment_method'])
+            graph.add(
+                'customer.modify',
+                lambda results: operations.call(
+                    'customer.modify',
+                    stripe.Customer.modify,
+                    **self.__default_payment_method_params(results['customer'], results['payment_method'])),
+                depends_on=['customer', 'payment_method', 'payment_method.attach'])
+            graph.add(
+                'payment_method_record',
+                lambda results: self.__save_payment_method(requester, profile, results['payment_method']),
+                depends_on=['customer.modify'],
+                local=True,
+                record=True)
+            subscription_dependencies.append('customer.modify')
+
+        # The temporal subscription is only created once every previous step succeeded, like the sequential mode
+        graph.add(
+            'temporal_subscription',
+            lambda results: self.__create_temporal_subscription(requester, profile, data),
+            depends_on=subscription_dependencies,
+            local=True)
+        graph.add(
+            'subscription',
+            lambda results: operations.call(
+                'subscription.create',
+                stripe.Subscription.create,
+                **self.__subscription_params(results['customer'], data)),
+            depends_on=['customer', 'temporal_subscription'])
+
+        graph.run()
+
+    def __create_subscription_compactly(self, operations, requester, profile, data):
+        # The payment method is attached and set as default by the calls creating the customer and the
+        # subscription, instead of the separate attach and modify calls
+        payment_method_reference = None
+        if not profile.payment_method:
+            payment_method_reference = operations.call(
+                'payment_method.create', stripe.PaymentMethod.create, **self.__payment_method_params(data))
+
+        if profile.customer:
+            customer_reference = profile.customer.id_reference
+            if payment_method_reference:
+                operations.call(
+                    'payment_method.attach',
+                    stripe.PaymentMethod.attach,
+                    sid=payment_method_reference,
+                    customer=customer_reference
+                )
+        elif payment_method_reference:
+            customer_reference = operations.call(
+                'customer.create_with_payment_method',
+                stripe.Customer.create,
+                payment_method=payment_method_reference,
+                invoice_settings={
+                    'default_payment_method': payment_method_reference
+                },
+                **self.__customer_params(requester)
+            )
+            self.__save_customer(requester, profile, customer_reference)
+        else:
+            customer_reference = self.__create_customer(operations, requester, profile)
+
+        if payment_method_reference:
+            self.__save_payment_method(requester, profile, payment_method_reference)
+
+        self.__create_temporal_subscription(requester, profile, data)
+        subscription_params = self.__subscription_params(customer_reference, data)
+        if payment_method_reference:
+            subscription_params['default_payment_method'] = payment_method_reference
+
+        operations.call('subscription.create', stripe.Subscription.create, **subscription_params)
+
+    def __create_customer(self, operations, requester, profile):
+        customer_reference = operations.call(
+            'customer.create', stripe.Customer.create, **self.__customer_params(requester))
+        self.__save_customer(requester, profile, customer_reference)
+
+        return customer_reference
+
+    def __create_payment_method(self, operations, requester, profile, customer_reference, data):
+        payment_method_reference = operations.call(
+            'payment_method.create', stripe.PaymentMethod.create, **self.__payment_method_params(data))
+
+        operations.call(
+            'payment_method.attach',
+            stripe.PaymentMethod.attach,
+            sid=payment_method_reference,
+            customer=customer_reference
         )
-        Customer.objects.create(
-            is_active=True,
-            id_reference=customer.id,
-            account=requester.account)
 
-        return customer.id
+        operations.call(
+            'customer.modify',
+            stripe.Customer.modify,
+            **self.__default_payment_method_params(customer_reference, payment_method_reference)
+        )
+
+        self.__save_payment_method(requester, profile, payment_method_reference)
+
+    def __create_subscription(self, operations, requester, profile, customer_reference, data):
+        self.__create_temporal_subscription(requester, profile, data)
+
+        return operations.call(
+            'subscription.create', stripe.Subscription.create, **self.__subscription_params(customer_reference, data))
+
+    def __customer_params(self, requester):
+        return {
+            'name': requester.name,
+            'email': requester.email,
+            'metadata': {'user_id': f'{requester.id}'},
+        }
+
+    def __payment_method_params(self, data):
+        if data.get('card_token'):
+            # Cards tokenized by Stripe, used by the bulk subscriptions
+            return {'type': "card", 'card': {'token': data['card_token']}}
 
-    def __create_payment_method(self, requester, customer_reference, data):
-        payment_method = stripe.PaymentMethod.create(
-            type="card",
-            card={
+        return {
+            'type': "card",
+            'card': {
                 "number": data.get('card_number'),
                 "exp_month": data.get('card_expiration_month'),
                 "exp_year": data.get('card_expiration_year'),
                 "cvc": data.get('card_cvc'),
             },
-        )
+        }
 
-        stripe.PaymentMethod.attach(
-            sid=payment_method.id,
-            customer=customer_reference
-        )
+    def __default_payment_method_params(self, customer_reference, payment_method_reference):
+        return {
+            'sid': customer_reference,
+            'invoice_settings': {
+                'default_payment_method': payment_method_reference
+            },
+        }
 
-        stripe.Customer.modify(
-            sid=customer_reference,
-            invoice_settings={
-                'default_payment_method': payment_method.id
-            }
-        )
+    def __subscription_params(self, customer_reference, data):
+        return {
+            'customer': customer_reference,
+            'items': [{
+                'price': SubscriptionProduct.price_by_product(data.get('subscription_product'))
+            }],
+        }
+
+    def __save_customer(self, requester, profile, customer_reference):
+        profile.customer = Customer.objects.create(
+            is_active=True,
+            id_reference=customer_reference,
+            account_id=requester.account_id)
 
-        PaymentMethod.objects.create(
+    def __save_payment_method(self, requester, profile, payment_method_reference):
+        profile.payment_method = PaymentMethod.objects.create(
             is_active=True,
             type=PaymentMethodType.CARD,
-            id_reference=payment_method.id,
-            account=requester.account)
+            id_reference=payment_method_reference,
+            account_id=requester.account_id)
 
-    def __create_subscription(self, requester, customer_reference, data):
-        if Subscription.objects.filter(account=requester.account).exists():
-            raise PaymentsAlreadySubscribedError(message="Already subscribed!")
+    def __create_temporal_subscription(self, requester, profile, data):
+        # The billing profile was read before the Stripe calls, a concurrent request of the same account
+        # may have subscribed since. The account row is locked so only one of them inserts.
+        with transaction.atomic():
+            subscribed = Account.objects.select_for_update().filter(pk=requester.account_id).values_list(
+                Exists(Subscription.objects.filter(account=OuterRef('pk'))), flat=True).first()
+            if subscribed:
+                raise PaymentsAlreadySubscribedError(message="Already subscribed!")
 
-        Subscription.objects.create(
-            status=SubscriptionStatus.PENDING,
-            price_reference=SubscriptionProduct.price_by_product(data.get('subscription_product')),
-            account=requester.account
-        )
-
-        return stripe.Subscription.create(
-            customer=customer_reference,
-            items=[{
-                'price': SubscriptionProduct.price_by_product(data.get('subscription_product'))
-            }],
-        )
+            profile.subscription = Subscription.objects.create(
+                status=SubscriptionStatus.PENDING,
+                price_reference=SubscriptionProduct.price_by_product(data.get('subscription_product')),
+                account_id=requester.account_id
+            )
+        SubscriptionStatusCache().invalidate(requester.account_id)
 
     def __delete_temporal_subscription(self, requester):
-        subscription = Subscription.objects.filter(
+        deleted, _ = Subscription.objects.filter(
             status=SubscriptionStatus.PENDING,
-            account=requester.account)
-        if subscription:
-            subscription.delete()
+            account_id=requester.account_id).delete()
+        if deleted:
+            BillingProfile.load(requester).subscription = None
+            SubscriptionStatusCache().invalidate(requester.account_id)
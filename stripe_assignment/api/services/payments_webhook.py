@@ -3,53 +3,168 @@ from datetime import datetime
 import pytz
 import stripe
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone as django_timezone
 
-from ..models import Customer, Subscription
-from ..models.constants import SubscriptionStatus
+from ..models import Customer, Subscription, WebhookEvent
+from ..models.constants import SubscriptionStatus, WebhookEventStatus
+from ..utils import metrics
+from .subscription_status_cache import SubscriptionStatusCache
+from .webhook_deduplication import WebhookEventDeduplicator
 
 
 class PaymentsWebhook:
 
+    SUBSCRIPTION_EVENTS = ('customer.subscription.created', 'customer.subscription.updated')
+    SUBSCRIPTION_FIELDS = [
+        'status',
+        'payment_gateway_status',
+        'id_reference',
+        'current_period_start',
+        'current_period_end',
+        'last_event_created',
+        'updated_at',
+    ]
+
     def __init__(self):
-        stripe.api_key = settings.STRIPE_API_SECRET
         self.webhook_secret = settings.STRIPE_WEBHOOK_SECRET
 
     def handle_event(self, request):
-        if self.webhook_secret:
-            signature = request.headers.get('stripe-signature')
-            try:
-                event = stripe.Webhook.construct_event(
-                    payload=request.body, sig_header=signature, secret=self.webhook_secret)
-                data = event['data']
-            except Exception as e:
-                return e
-            event_type = event['type']
-        else:
-            data = request.data['data']
-            event_type = request.data['type']
+        event = self.construct_event(request)
+        if event is None:
+            return
 
-        if event_type == 'customer.subscription.created':
-            self.__update_subscription_info(data)
+        # Stripe delivers at least once, already recorded events are acknowledged without touching anything
+        deduplicator = WebhookEventDeduplicator()
+        if deduplicator.is_known(event.get('id')):
             return
 
-        if event_type == 'customer.subscription.updated':
-            self.__update_subscription_info(data)
+        if settings.STRIPE_WEBHOOK_INBOX_ENABLED:
+            recorded = self.enqueue_event(event)
+        else:
+            with transaction.atomic():
+                recorded = self.__record_event(event, WebhookEventStatus.PROCESSED)
+                if recorded:
+                    self.process_event(event)
+
+        deduplicator.record(event.get('id'), duplicate=recorded is None)
+
+    def construct_event(self, request):
+        if not self.webhook_secret:
+            return request.data
+
+        signature = request.headers.get('stripe-signature')
+        try:
+            event = stripe.Webhook.construct_event(
+                payload=request.body, sig_header=signature, secret=self.webhook_secret)
+        except Exception:
+            return None
+
+        return event.to_dict_recursive()
+
+    def enqueue_event(self, event):
+        return self.__record_event(event, WebhookEventStatus.PENDING)
+
+    def process_event(self, event):
+        data = event['data']
+        event_type = event['type']
+
+        if event_type in self.SUBSCRIPTION_EVENTS:
+            self.__update_subscription_info(data, event['created'])
             return
 
-    def __update_subscription_info(self, data):
+    def is_subscription_event(self, event):
+        return event.get('type') in self.SUBSCRIPTION_EVENTS
+
+    def update_subscriptions(self, events):
+        # Applies only the newest state of every subscription with a single bulk update,
+        # unless a newer event was already applied by a previous batch.
+        # Returns the error of every event that could not be read, None for the rest.
+        errors = [None] * len(events)
+        newest = {}
+        for index, event in enumerate(events):
+            try:
+                data_object = event['data']['object']
+                changes = self.subscription_changes(data_object)
+                order = (event['created'], index)
+            except Exception as e:
+                errors[index] = e
+                continue
+            reference = data_object['id']
+            if reference not in newest or newest[reference][0] < order:
+                newest[reference] = (order, data_object['customer'], changes)
+
+        accounts = dict(Customer.objects.filter(
+            id_reference__in={customer for _, customer, _ in newest.values()},
+        ).values_list('id_reference', 'account_id'))
+        subscriptions = {}
+        for subscription in Subscription.objects.select_for_update().filter(
+                account_id__in=set(accounts.values())).order_by('created_at'):
+            subscriptions.setdefault(subscription.account_id, subscription)
+
+        updates = {}
+        for (created, _), customer, changes in sorted(newest.values(), key=lambda update: update[0]):
+            subscription = subscriptions.get(accounts.get(customer))
+            if subscription is None or self.__is_stale(subscription, created):
+                continue
+            for field, value in changes.items():
+                setattr(subscription, field, value)
+            subscription.last_event_created = created
+            updates[subscription.id] = subscription
+
+        if updates:
+            Subscription.objects.bulk_update(updates.values(), fields=self.SUBSCRIPTION_FIELDS)
+            for subscription in updates.values():
+                SubscriptionStatusCache().refresh(subscription)
+
+        metrics.increment('webhook.subscription_writes', len(updates))
+        return errors
+
+    def __record_event(self, event, status):
+        processed = status == WebhookEventStatus.PROCESSED
+        try:
+            with transaction.atomic():
+                return WebhookEvent.objects.create(
+                    event_id=event.get('id'),
+                    type=event.get('type', ''),
+                    payload=event,
+                    status=status,
+                    attempts=1 if processed else 0,
+                    processed_at=django_timezone.now() if processed else None)
+        except IntegrityError:
+            return None
+
+    def __update_subscription_info(self, data, created):
         subscription = None
         customer = Customer.objects.filter(id_reference=data['object']['customer']).first()
         if customer:
-            subscription = Subscription.objects.filter(account=customer.account).first()
-
-        if subscription:
-            status = SubscriptionStatus.SUCCESSFUL if data['object']['status'] == 'active' else SubscriptionStatus.FAILED
-            timezone = pytz.timezone("UTC")
-            current_period_start = timezone.localize(datetime.fromtimestamp(data['object']['current_period_start']))
-            current_period_end = timezone.localize(datetime.fromtimestamp(data['object']['current_period_end']))
-            subscription.status = status
-            subscription.payment_gateway_status = data['object']['status']
-            subscription.id_reference = data['object']['id']
-            subscription.current_period_start = current_period_start
-            subscription.current_period_end = current_period_end
-            subscription.save()
+            # Locked so concurrent deliveries compare against the watermark one at a time
+            subscription = Subscription.objects.select_for_update().filter(
+                account_id=customer.account_id).order_by('created_at').first()
+
+        if subscription and not self.__is_stale(subscription, created):
+            for field, value in self.subscription_changes(data['object']).items():
+                setattr(subscription, field, value)
+            subscription.last_event_created = created
+            subscription.save(update_fields=self.SUBSCRIPTION_FIELDS)
+            SubscriptionStatusCache().refresh(subscription)
+            metrics.increment('webhook.subscription_writes')
+
+    def __is_stale(self, subscription, created):
+        # Events of the same second are applied in arrival order
+        if subscription.last_event_created > created:
+            metrics.increment('webhook.stale_events')
+            return True
+        return False
+
+    def subscription_changes(self, data_object):
+        status = SubscriptionStatus.SUCCESSFUL if data_object['status'] == 'active' else SubscriptionStatus.FAILED
+        timezone = pytz.timezone("UTC")
+        return {
+            'status': status,
+            'payment_gateway_status': data_object['status'],
+            'id_reference': data_object['id'],
+            'current_period_start': timezone.localize(datetime.fromtimestamp(data_object['current_period_start'])),
+            'current_period_end': timezone.localize(datetime.fromtimestamp(data_object['current_period_end'])),
+            'updated_at': django_timezone.now(),
+        }
@@ -0,0 +1,66 @@
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+Node = namedtuple('Node', ['name', 'call', 'depends_on', 'local', 'record'])
+
+
+class StripeCallGraph:
+
+    # Bounded and shared by every request of the process, nodes never wait on each other inside the pool
+    executor = ThreadPoolExecutor(
+        max_workers=settings.STRIPE_GATEWAY_MAX_WORKERS, thread_name_prefix='stripe-call')
+
+    def __init__(self):
+        self.nodes = []
+
+    def add(self, name, call, depends_on=(), local=False, record=False):
+        # Local nodes run on the calling thread, they are used for the database work.
+        # Record nodes are local nodes that still run after a failure, to keep what Stripe already created.
+        self.nodes.append(Node(name, call, tuple(depends_on), local, local and record))
+
+    def run(self):
+        results = {}
+        running = {}
+        pending = list(self.nodes)
+        error = None
+
+        while pending or running:
+            ready = [
+                node for node in pending
+                if (error is None or node.record) and all(name in results for name in node.depends_on)]
+            for node in ready:
+                pending.remove(node)
+                if not node.local:
+                    running[self.executor.submit(node.call, dict(results))] = node.name
+
+            local_nodes = [node for node in ready if node.local]
+            for node in local_nodes:
+                if error is not None and not node.record:
+                    continue
+                try:
+                    results[node.name] = node.call(dict(results))
+                except Exception as e:
+                    error = error or e
+            if local_nodes:
+                continue
+
+            if not running:
+                break
+
+            # On failure the calls already sent are awaited, so their results can be recorded
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    error = error or e
+
+        if error is not None:
+            raise error
+        if pending:
+            raise ValueError(f'Unresolved dependencies: {[node.name for node in pending]}')
+
+        return results
@@ -0,0 +1,114 @@
+import math
+import threading
+import time
+from collections import deque
+
+import stripe
+from django.conf import settings
+
+from ..exceptions import PaymentsGatewayUnavailableError
+from ..utils import metrics
+
+
+class StripeCircuitBreaker:
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    # Errors telling Stripe or the network is degraded, the rest are answers about the request itself
+    FAILURES = (stripe.error.APIConnectionError, stripe.error.APIError)
+
+    # Shared by every thread of the process
+    lock = threading.Lock()
+    state = CLOSED
+    opened_at = 0
+    probing = False
+    calls = deque()
+
+    def allow(self):
+        # Returns whether the request is the half-open probe, or fails fast while the circuit is open
+        if not settings.STRIPE_BREAKER_ENABLED:
+            return False
+
+        cls = type(self)
+        with cls.lock:
+            if cls.state == self.OPEN and time.monotonic() - cls.opened_at >= settings.STRIPE_BREAKER_OPEN_SECONDS:
+                self.__transition(self.HALF_OPEN)
+
+            if cls.state == self.CLOSED:
+                return False
+            if cls.state == self.HALF_OPEN and not cls.probing:
+                cls.probing = True
+                return True
+
+        metrics.increment('stripe_breaker.rejected')
+        raise PaymentsGatewayUnavailableError(
+            message="The payments gateway is unavailable, try again later.", retry_after=self.retry_after())
+
+    def release(self, probe):
+        # A probe finishing without any Stripe call leaves the circuit half-open for the next one
+        if probe:
+            with type(self).lock:
+                type(self).probing = False
+
+    def record(self, duration, error=None):
+        if not settings.STRIPE_BREAKER_ENABLED:
+            return
+
+        failed = isinstance(error, self.FAILURES) or (
+            settings.STRIPE_BREAKER_SLOW_CALL_SECONDS > 0 and duration >= settings.STRIPE_BREAKER_SLOW_CALL_SECONDS)
+        metrics.increment('stripe_breaker.failures' if failed else 'stripe_breaker.successes')
+
+        cls = type(self)
+        with cls.lock:
+            now = time.monotonic()
+            if cls.state == self.HALF_OPEN:
+                self.__transition(self.OPEN if failed else self.CLOSED)
+                return
+
+            cls.calls.append((now, failed))
+            while cls.calls and now - cls.calls[0][0] > settings.STRIPE_BREAKER_WINDOW_SECONDS:
+                cls.calls.popleft()
+            if cls.state == self.CLOSED and len(cls.calls) >= settings.STRIPE_BREAKER_MIN_CALLS and \
+                    self.__failure_rate() >= settings.STRIPE_BREAKER_FAILURE_RATE:
+                self.__transition(self.OPEN)
+
+    def retry_after(self):
+        remaining = settings.STRIPE_BREAKER_OPEN_SECONDS - (time.monotonic() - type(self).opened_at)
+        return max(math.ceil(remaining), 1)
+
+    def stats(self):
+        cls = type(self)
+        with cls.lock:
+            return {
+                'state': cls.state,
+                'failure_rate': self.__failure_rate(),
+                'calls': len(cls.calls),
+                'retry_after': self.retry_after() if cls.state == self.OPEN else 0,
+                'opened': metrics.get('stripe_breaker.opened'),
+                'rejected': metrics.get('stripe_breaker.rejected'),
+            }
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.state = cls.CLOSED
+            cls.opened_at = 0
+            cls.probing = False
+            cls.calls.clear()
+
+    def __failure_rate(self):
+        calls = type(self).calls
+        return sum(1 for _, failed in calls if failed) / len(calls) if calls else 0
+
+    def __transition(self, state):
+        cls = type(self)
+        cls.state = state
+        cls.probing = False
+        if state == self.OPEN:
+            cls.opened_at = time.monotonic()
+            cls.calls.clear()
+            metrics.increment('stripe_breaker.opened')
+        elif state == self.CLOSED:
+            cls.calls.clear()
+        metrics.set_gauge('stripe_breaker.state', state)
@@ -0,0 +1,69 @@
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from stripe.http_client import RequestsClient
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from ..utils import metrics
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+
+    def _new_conn(self):
+        metrics.increment('stripe_http.connections')
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+
+    def _new_conn(self):
+        # Every new HTTPS connection pays for a TCP and TLS handshake
+        metrics.increment('stripe_http.connections')
+        return super()._new_conn()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+
+class StripeClient(RequestsClient):
+
+    def __init__(self, pool_size, connect_timeout, read_timeout, **kwargs):
+        # A single session shared by every thread, its connection pool is thread safe
+        session = requests.Session()
+        adapter = PooledHTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        super().__init__(timeout=(connect_timeout, read_timeout), session=session, **kwargs)
+
+    def request(self, method, url, headers, post_data=None):
+        metrics.increment('stripe_http.requests')
+        return super().request(method, url, headers, post_data)
+
+    @staticmethod
+    def configure():
+        stripe.api_key = settings.STRIPE_API_SECRET
+        stripe.api_base = settings.STRIPE_API_BASE
+        stripe.default_http_client = StripeClient(
+            pool_size=settings.STRIPE_HTTP_POOL_SIZE,
+            connect_timeout=settings.STRIPE_HTTP_CONNECT_TIMEOUT,
+            read_timeout=settings.STRIPE_HTTP_READ_TIMEOUT)
+
+    @staticmethod
+    def stats():
+        requests_count = metrics.get('stripe_http.requests')
+        connections = metrics.get('stripe_http.connections')
+        reused = max(requests_count - connections, 0)
+        return {
+            'requests': requests_count,
+            'connections': connections,
+            'reused_connections': reused,
+            'reuse_rate': reused / requests_count if requests_count else 0,
+        }
@@ -0,0 +1,123 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import GatewayOperation
+from ..utils import metrics
+from .stripe_circuit_breaker import StripeCircuitBreaker
+from .stripe_rate_limiter import StripeRateLimiter
+
+
+class StripeOperations:
+
+    OPERATIONS = (
+        'customer.create',
+        'customer.create_with_payment_method',
+        'payment_method.create',
+        'payment_method.attach',
+        'customer.modify',
+        'subscription.create',
+    )
+
+    # Stored with the completed steps of a failed attempt, the retries of the same request reuse its nonce
+    ATTEMPT = 'attempt'
+    # Stripe forgets the idempotency keys after 24 hours, older attempts start over with a new nonce
+    KEY_TTL = 24 * 3600
+
+    def __init__(self, requester, data):
+        self.account_id = requester.account_id
+        # The request data identifies the attempt, a retry with a different card or product is a new one
+        self.scope = json.dumps(data, sort_keys=True, default=str)
+        self.attempt_key = self.__sign(f'{self.account_id}:{self.ATTEMPT}:{self.scope}')
+        self.nonce = None
+        self.resumed = False
+        self.recorded = {}
+        self.completed = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.rate_limiter = StripeRateLimiter()
+        self.breaker = StripeCircuitBreaker()
+        # Every Stripe call of the request, and its retries, must finish within the budget
+        self.deadline = time.monotonic() + settings.STRIPE_RETRY_BUDGET
+
+    def __enter__(self):
+        # Only the failed attempts of the account have rows, they are read at once
+        expired_before = self.expired_before()
+        stored = {}
+        expired = False
+        for key, reference, created_at in GatewayOperation.objects.filter(
+                account_id=self.account_id).values_list('idempotency_key', 'result_reference', 'created_at'):
+            if created_at < expired_before:
+                expired = True
+            else:
+                stored[key] = reference
+        if expired:
+            # Their keys would clash with the rows of the new attempt
+            GatewayOperation.objects.filter(account_id=self.account_id, created_at__lt=expired_before).delete()
+        self.resumed = self.attempt_key in stored
+        # Every new attempt gets new keys, so Stripe does not replay the objects of a previous subscription
+        self.nonce = stored[self.attempt_key] if self.resumed else uuid.uuid4().hex
+        keys = {self.key(operation) for operation in self.OPERATIONS}
+        self.recorded = {key: reference for key, reference in stored.items() if key in keys}
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        metrics.increment('stripe.subscribe_requests')
+        metrics.increment('stripe.subscribe_calls', self.calls)
+        if exc_type is None:
+            if self.resumed:
+                GatewayOperation.objects.filter(idempotency_key__in=[self.attempt_key, *self.recorded]).delete()
+        elif issubclass(exc_type, stripe.error.StripeError):
+            # Only failed attempts keep their nonce and completed steps, so the retry resends the same keys
+            # and skips the completed steps. The failed call may have reached Stripe, so the nonce is always kept.
+            completed = {self.attempt_key: (self.ATTEMPT, self.nonce), **self.completed}
+            GatewayOperation.objects.bulk_create([
+                GatewayOperation(
+                    idempotency_key=key,
+                    operation=operation,
+                    result_reference=result_reference,
+                    account_id=self.account_id)
+                for key, (operation, result_reference) in completed.items()
+            ], ignore_conflicts=True)
+        return False
+
+    def call(self, operation, method, **params):
+        key = self.key(operation)
+        if key in self.recorded:
+            metrics.increment('stripe.skipped_calls')
+            return self.recorded[key]
+
+        with self.lock:
+            self.calls += 1
+        started_at = time.monotonic()
+        try:
+            result = self.rate_limiter.call(lambda: method(idempotency_key=key, **params), self.deadline)
+        except stripe.error.StripeError as e:
+            self.breaker.record(time.monotonic() - started_at, e)
+            raise
+        self.breaker.record(time.monotonic() - started_at)
+        self.completed[key] = (operation, result.id)
+        return result.id
+
+    @classmethod
+    def prune(cls, ttl=None):
+        deleted, _ = GatewayOperation.objects.filter(created_at__lt=cls.expired_before(ttl)).delete()
+        return deleted
+
+    @classmethod
+    def expired_before(cls, ttl=None):
+        return timezone.now() - timedelta(seconds=cls.KEY_TTL if ttl is None else ttl)
+
+    def key(self, operation):
+        return self.__sign(f'{self.account_id}:{operation}:{self.nonce}')
+
+    def __sign(self, message):
+        return hmac.new(settings.SECRET_KEY.encode(), message.encode(), hashlib.sha256).hexdigest()
@@ -0,0 +1,133 @@
+import random
+import threading
+import time
+
+import stripe
+from django.conf import settings
+from django.core.cache import caches
+
+from ..utils import metrics
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                delay = (1 - self.tokens) / self.rate
+
+            if now + delay > deadline:
+                return False
+            time.sleep(delay)
+
+
+class SharedWindow:
+
+    # Every worker counts its calls in the same one second windows of a shared cache, atomically with incr
+    def __init__(self, cache):
+        self.cache = cache
+
+    @property
+    def rate(self):
+        return self.cache.get('stripe_rate_limit:rate') or settings.STRIPE_RATE_LIMIT
+
+    @rate.setter
+    def rate(self, rate):
+        self.cache.set('stripe_rate_limit:rate', rate, None)
+
+    def acquire(self, deadline):
+        while True:
+            now = time.time()
+            window = int(now)
+            key = f'stripe_rate_limit:{window}'
+            self.cache.add(key, 0, 2)
+            try:
+                calls = self.cache.incr(key)
+            except ValueError:
+                # The window expired between add and incr
+                continue
+            if calls <= self.rate:
+                return True
+
+            delay = window + 1 - now
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+
+
+class StripeRateLimiter:
+
+    lock = threading.Lock()
+    local = None
+
+    def __init__(self):
+        if settings.STRIPE_RATE_LIMIT_SHARED:
+            self.limiter = SharedWindow(caches[settings.STRIPE_RATE_LIMIT_CACHE_ALIAS])
+        else:
+            self.limiter = self.local_bucket()
+
+    @classmethod
+    def local_bucket(cls):
+        with cls.lock:
+            if cls.local is None:
+                cls.local = TokenBucket(settings.STRIPE_RATE_LIMIT, settings.STRIPE_RATE_LIMIT_BURST)
+            return cls.local
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.local = None
+
+    def call(self, function, deadline):
+        # Rate limited calls are retried with the same idempotency key until the deadline of the request
+        enabled = settings.STRIPE_RATE_LIMIT > 0
+        attempt = 0
+        while True:
+            if enabled and not self.limiter.acquire(deadline):
+                metrics.increment('stripe_rate_limit.exhausted')
+                raise stripe.error.RateLimitError('Stripe rate limit budget exhausted')
+
+            try:
+                result = function()
+            except stripe.error.RateLimitError:
+                if enabled:
+                    self.throttled()
+                delay = random.uniform(0, min(
+                    settings.STRIPE_RETRY_MAX_DELAY, settings.STRIPE_RETRY_BASE_DELAY * 2 ** attempt))
+                if time.monotonic() + delay > deadline:
+                    metrics.increment('stripe_rate_limit.exhausted')
+                    raise
+                metrics.increment('stripe_rate_limit.retries')
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if enabled:
+                self.succeeded()
+            return result
+
+    def throttled(self):
+        # Multiplicative decrease on every 429, additive increase on every success
+        metrics.increment('stripe_rate_limit.throttled')
+        self.set_rate(max(settings.STRIPE_RATE_LIMIT_MIN, self.limiter.rate / 2))
+
+    def succeeded(self):
+        if self.limiter.rate < settings.STRIPE_RATE_LIMIT:
+            self.set_rate(min(settings.STRIPE_RATE_LIMIT, self.limiter.rate + settings.STRIPE_RATE_LIMIT_RECOVERY))
+
+    def set_rate(self, rate):
+        self.limiter.rate = rate
+        metrics.set_gauge('stripe_rate_limit.rate', rate)
@@ -0,0 +1,120 @@
+import time
+from itertools import islice
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+
+from ..models import Customer, ReconciliationCursor, Subscription
+from ..utils import metrics
+from .payments_webhook import PaymentsWebhook
+from .subscription_status_cache import SubscriptionStatusCache
+
+
+class SubscriptionReconciler:
+
+    CURSOR = 'stripe_subscriptions'
+    SUBSCRIPTION_EVENTS = 'customer.subscription.*'
+    # Stripe only lists the events of the last 30 days, older cursors need a full run
+    EVENTS_RETENTION = 30 * 24 * 3600
+    COMPARED_FIELDS = [
+        field for field in PaymentsWebhook.SUBSCRIPTION_FIELDS if field not in ('last_event_created', 'updated_at')]
+
+    def __init__(self, chunk_size=None, page_size=100, dry_run=False):
+        self.chunk_size = chunk_size or settings.STRIPE_RECONCILIATION_CHUNK_SIZE
+        self.page_size = page_size
+        self.dry_run = dry_run
+        self.newest_event = None
+        self.webhook = PaymentsWebhook()
+        self.stats = {'fetched': 0, 'matched': 0, 'updated': 0, 'unmatched': 0}
+
+    def run(self, full=False, report=None):
+        started_at = time.time()
+        cursor, _ = ReconciliationCursor.objects.get_or_create(name=self.CURSOR)
+        full = full or not cursor.high_water_mark or started_at - cursor.high_water_mark > self.EVENTS_RETENTION
+        if full:
+            subscriptions, high_water_mark = self.__all_subscriptions(int(started_at)), int(started_at)
+        else:
+            subscriptions, high_water_mark = self.__changed_subscriptions(cursor.high_water_mark), None
+
+        # Only one chunk of Stripe objects and their rows are held at a time
+        while True:
+            chunk = list(islice(subscriptions, self.chunk_size))
+            if not chunk:
+                break
+            # The rows stay locked until written, so a webhook applied meanwhile is not overwritten
+            with transaction.atomic():
+                self.__apply(chunk)
+            if report:
+                report(self.stats)
+
+        if not self.dry_run:
+            cursor.high_water_mark = high_water_mark or self.newest_event or cursor.high_water_mark
+            cursor.save(update_fields=['high_water_mark', 'updated_at'])
+        return full
+
+    def __all_subscriptions(self, started_at):
+        # The listed states are at least as new as the start of the run
+        for subscription in stripe.Subscription.list(status='all', limit=self.page_size).auto_paging_iter():
+            yield started_at, subscription.to_dict_recursive()
+
+    def __changed_subscriptions(self, since):
+        # The created filter includes the cursor second, re-applying one of its events is harmless.
+        events = stripe.Event.list(type=self.SUBSCRIPTION_EVENTS, created={'gte': since}, limit=self.page_size)
+        for event in events.auto_paging_iter():
+            self.newest_event = max(self.newest_event or 0, event.created)
+            yield event.created, event.data.object.to_dict_recursive()
+
+    def __apply(self, chunk):
+        # The events come newest first, so the first state of a subscription in the chunk is its newest one.
+        # Older states in the next chunks are skipped by the last event applied to the row.
+        newest = {}
+        for created, data_object in chunk:
+            newest.setdefault(data_object['id'], (created, data_object))
+        chunk = list(newest.values())
+
+        references = set(newest)
+        by_reference = {
+            subscription.id_reference: subscription
+            for subscription in Subscription.objects.select_for_update().filter(id_reference__in=references)
+        }
+        # Subscriptions whose creation webhook was lost have no reference yet, they are found by customer
+        customers = {
+            subscription['customer'] for _, subscription in chunk if subscription['id'] not in by_reference}
+        accounts = dict(Customer.objects.filter(
+            id_reference__in=customers).values_list('id_reference', 'account_id')) if customers else {}
+        by_account = {}
+        for subscription in Subscription.objects.select_for_update().filter(
+                account_id__in=set(accounts.values())).order_by('created_at'):
+            by_account.setdefault(subscription.account_id, subscription)
+
+        updates = {}
+        for created, data_object in chunk:
+            subscription = by_reference.get(data_object['id'])
+            if subscription is None:
+                # Only rows not linked to a Stripe subscription yet, the newest one of the customer wins
+                subscription = by_account.pop(accounts.get(data_object['customer']), None)
+                if subscription is not None and subscription.id_reference:
+                    subscription = None
+            if subscription is None:
+                self.stats['unmatched'] += 1
+                continue
+
+            self.stats['matched'] += 1
+            if subscription.last_event_created > created:
+                continue
+            changes = self.webhook.subscription_changes(data_object)
+            if any(getattr(subscription, field) != changes[field] for field in self.COMPARED_FIELDS):
+                for field, value in changes.items():
+                    setattr(subscription, field, value)
+                subscription.last_event_created = created
+                updates[subscription.id] = subscription
+
+        self.stats['fetched'] += len(chunk)
+        self.stats['updated'] += len(updates)
+        metrics.increment('reconciliation.fetched', len(chunk))
+        metrics.increment('reconciliation.updated', len(updates))
+        if updates and not self.dry_run:
+            Subscription.objects.bulk_update(updates.values(), fields=PaymentsWebhook.SUBSCRIPTION_FIELDS)
+            for subscription in updates.values():
+                SubscriptionStatusCache().refresh(subscription)
@@ -0,0 +1,63 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from ..models import Subscription
+from ..serializers import StatusSerializer
+from ..utils import metrics
+
+
+class SubscriptionStatusCache:
+
+    NOT_FOUND = 'not_found'
+
+    def __init__(self):
+        self.cache = caches[settings.SUBSCRIPTION_STATUS_CACHE_ALIAS]
+
+    def get(self, account_id, loader):
+        entry = self.cache.get(self.__key(account_id))
+        if entry is not None:
+            metrics.increment('subscription_status_cache.hits')
+            return None if entry == self.NOT_FOUND else entry
+
+        metrics.increment('subscription_status_cache.misses')
+        return self.__store(account_id, loader())
+
+    def get_validators(self, account_id):
+        entry = self.cache.get(self.__key(account_id))
+        if entry is not None:
+            return None if entry == self.NOT_FOUND else entry['validators']
+
+        # Only the id and updated_at columns of the subscription found through the account index
+        row = Subscription.objects.filter(account_id=account_id).order_by('created_at').values_list(
+            'id', 'updated_at').first()
+        return self.validators(*row) if row else None
+
+    def refresh(self, subscription):
+        self.__store(subscription.account_id, subscription)
+
+    def invalidate(self, account_id):
+        self.cache.delete(self.__key(account_id))
+
+    @staticmethod
+    def validators(subscription_id, updated_at):
+        # updated_at changes with every write of the subscription, so the ETag is strong
+        digest = hashlib.sha256(f'{subscription_id}:{updated_at.isoformat()}'.encode()).hexdigest()
+        return {'etag': f'"{digest[:32]}"', 'last_modified': updated_at.timestamp()}
+
+    def __store(self, account_id, subscription):
+        if subscription is None:
+            self.cache.set(self.__key(account_id), self.NOT_FOUND, settings.SUBSCRIPTION_STATUS_CACHE_NOT_FOUND_TTL)
+            return None
+
+        entry = {
+            'payload': dict(StatusSerializer(instance=subscription).data),
+            'validators': self.validators(subscription.id, subscription.updated_at),
+        }
+        self.cache.set(self.__key(account_id), entry, settings.SUBSCRIPTION_STATUS_CACHE_TTL)
+        return entry
+
+    def __key(self, account_id):
+        # The entries hold the validators along with the payload since v2
+        return f'subscription_status:v2:{account_id}'
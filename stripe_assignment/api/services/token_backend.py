@@ -0,0 +1,137 @@
+import json
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.translation import gettext_lazy as _
+from jwt.algorithms import get_default_algorithms
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.tokens import Token
+
+
+class KeySetTokenBackend(TokenBackend):
+
+    ALGORITHMS = ('RS256', 'RS384', 'RS512', 'ES256', 'ES384', 'ES512', 'EdDSA')
+
+    def __init__(self, algorithm, signing_key, signing_key_id=None, verifying_keys=None,
+                 default_key_id=None, audience=None, issuer=None, leeway=0):
+        super().__init__(algorithm, audience=audience, issuer=issuer, leeway=leeway)
+        # The keys are parsed once, instead of on every signature
+        self.signing_key = self.prepare_key(algorithm, signing_key)
+        self.signing_key_id = signing_key_id or None
+        # Key id -> (algorithm, key) of every active verifying key, the algorithm is pinned per key
+        self.verifying_keys = verifying_keys or {}
+        # Tokens without a kid header, issued before the key ids were used
+        self.default_key_id = default_key_id or self.signing_key_id
+
+    def _validate_algorithm(self, algorithm):
+        if algorithm not in self.ALGORITHMS:
+            raise TokenBackendError(_(f"Unrecognized algorithm type '{algorithm}'"))
+
+    @staticmethod
+    def prepare_key(algorithm, key):
+        if isinstance(key, str):
+            return get_default_algorithms()[algorithm].prepare_key(key)
+        return key
+
+    def get_verifying_key(self, token):
+        try:
+            key_id = jwt.get_unverified_header(token).get('kid', self.default_key_id)
+        except jwt.InvalidTokenError:
+            raise TokenBackendError(_('Token is invalid or expired'))
+
+        if key_id not in self.verifying_keys:
+            raise TokenBackendError(_('Token is signed with an unknown key'))
+        return self.verifying_keys[key_id]
+
+    def encode(self, payload):
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload['aud'] = self.audience
+        if self.issuer is not None:
+            jwt_payload['iss'] = self.issuer
+
+        headers = {'kid': self.signing_key_id} if self.signing_key_id else None
+        return jwt.encode(jwt_payload, self.signing_key, algorithm=self.algorithm, headers=headers)
+
+    def decode(self, token, verify=True):
+        algorithm, key = self.get_verifying_key(token)
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={
+                    'verify_aud': self.audience is not None,
+                    'verify_signature': verify,
+                },
+            )
+        except jwt.InvalidAlgorithmError as ex:
+            raise TokenBackendError(_('Invalid algorithm specified')) from ex
+        except jwt.InvalidTokenError:
+            raise TokenBackendError(_('Token is invalid or expired'))
+
+    @staticmethod
+    def load_key_set(data):
+        verifying_keys = {}
+        for jwk in jwt.PyJWKSet.from_dict(data).keys:
+            if not jwk.key_id or not jwk.algorithm_name:
+                raise ImproperlyConfigured('Every key of the JWT key set needs a kid and an alg')
+            verifying_keys[jwk.key_id] = (jwk.algorithm_name, jwk.key)
+        return verifying_keys
+
+    @staticmethod
+    def jwk(algorithm, verifying_key, key_id):
+        key = KeySetTokenBackend.prepare_key(algorithm, verifying_key)
+        jwk = get_default_algorithms()[algorithm].to_jwk(key, as_dict=True)
+        return {**jwk, 'kid': key_id, 'alg': algorithm, 'use': 'sig'}
+
+    @staticmethod
+    def generate_key_pair(algorithm):
+        if algorithm.startswith('RS'):
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        elif algorithm.startswith('ES'):
+            curve = {'ES256': ec.SECP256R1, 'ES384': ec.SECP384R1, 'ES512': ec.SECP521R1}[algorithm]
+            private_key = ec.generate_private_key(curve())
+        else:
+            private_key = ed25519.Ed25519PrivateKey.generate()
+
+        private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+        return private_pem.decode(), public_pem.decode()
+
+    @staticmethod
+    def from_settings():
+        verifying_keys = {}
+        if settings.JWT_KEY_SET_FILE:
+            with open(settings.JWT_KEY_SET_FILE, mode='r') as key_set_file:
+                verifying_keys = KeySetTokenBackend.load_key_set(json.load(key_set_file))
+
+        # The key pair signing the new tokens is always active
+        signing_key_id = settings.JWT_SIGNING_KEY_ID or None
+        verifying_keys[signing_key_id] = (
+            settings.JWT_ALGORITHM,
+            KeySetTokenBackend.prepare_key(settings.JWT_ALGORITHM, settings.JWT_VERIFYING_KEY))
+
+        return KeySetTokenBackend(
+            settings.JWT_ALGORITHM,
+            settings.JWT_SIGNING_KEY,
+            signing_key_id=signing_key_id,
+            verifying_keys=verifying_keys,
+            default_key_id=settings.JWT_DEFAULT_KEY_ID,
+            audience=settings.SIMPLE_JWT.get('AUDIENCE'),
+            issuer=settings.SIMPLE_JWT.get('ISSUER'),
+            leeway=settings.SIMPLE_JWT.get('LEEWAY', 0))
+
+    @staticmethod
+    def configure():
+        # Every simplejwt token class signs and verifies with this backend
+        Token._token_backend = KeySetTokenBackend.from_settings()
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import WebhookEvent
+from ..models.constants import WebhookEventStatus
+from ..utils import LRUCache, metrics
+
+
+class WebhookEventDeduplicator:
+
+    # Event ids recorded by this process, checked before going to the database
+    recent_event_ids = LRUCache(settings.STRIPE_WEBHOOK_DEDUP_LRU_SIZE)
+
+    def is_known(self, event_id):
+        if event_id is None or event_id not in self.recent_event_ids:
+            return False
+
+        metrics.increment('webhook_dedup.hits')
+        metrics.increment('webhook_dedup.lru_hits')
+        return True
+
+    def record(self, event_id, duplicate):
+        if event_id is None:
+            return
+
+        metrics.increment('webhook_dedup.hits' if duplicate else 'webhook_dedup.misses')
+        self.recent_event_ids.set(event_id, True)
+
+    def prune(self, ttl=None):
+        ttl = settings.STRIPE_WEBHOOK_DEDUP_TTL if ttl is None else ttl
+        deleted, _ = WebhookEvent.objects.filter(
+            created_at__lt=timezone.now() - timedelta(seconds=ttl),
+        ).exclude(status=WebhookEventStatus.PENDING).delete()
+        return deleted
+
+    def stats(self):
+        hits = metrics.get('webhook_dedup.hits')
+        misses = metrics.get('webhook_dedup.misses')
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0,
+        }
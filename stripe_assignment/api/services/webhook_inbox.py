@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import WebhookEvent
+from ..models.constants import WebhookEventStatus
+from ..utils import metrics
+from .payments_webhook import PaymentsWebhook
+
+
+class WebhookInbox:
+
+    def __init__(self):
+        self.webhook = PaymentsWebhook()
+        self.max_attempts = settings.STRIPE_WEBHOOK_INBOX_MAX_ATTEMPTS
+        self.retry_backoff = settings.STRIPE_WEBHOOK_INBOX_RETRY_BACKOFF
+
+    def drain(self, batch_size, coalesce=False):
+        with transaction.atomic():
+            # Rows locked by another worker are skipped, so several workers can drain in parallel.
+            # Failed events wait for their backoff before being retried.
+            events = list(
+                WebhookEvent.objects.select_for_update(skip_locked=True)
+                .filter(status=WebhookEventStatus.PENDING, next_attempt_at__lte=timezone.now())
+                .order_by('created_at')[:batch_size])
+            if not events:
+                return events
+
+            if coalesce:
+                self.__process_coalesced(events)
+            else:
+                for event in events:
+                    self.__process(event)
+
+            now = timezone.now()
+            for event in events:
+                event.updated_at = now
+            WebhookEvent.objects.bulk_update(
+                events, ['status', 'attempts', 'error', 'processed_at', 'next_attempt_at', 'updated_at'])
+
+        self.__record_metrics(events)
+        return events
+
+    def stats(self):
+        pending = WebhookEvent.objects.filter(status=WebhookEventStatus.PENDING)
+        oldest = pending.order_by('created_at').values_list('created_at', flat=True).first()
+        return {
+            'backlog': pending.count(),
+            'lag_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0,
+        }
+
+    def __process(self, event):
+        try:
+            with transaction.atomic():
+                self.webhook.process_event(event.payload)
+        except Exception as e:
+            self.__mark_as_failed(event, e)
+            return
+
+        self.__mark_as_processed(event)
+
+    def __process_coalesced(self, events):
+        subscription_events = [event for event in events if self.webhook.is_subscription_event(event.payload)]
+        for event in events:
+            if event not in subscription_events:
+                self.__process(event)
+
+        try:
+            with transaction.atomic():
+                errors = self.webhook.update_subscriptions([event.payload for event in subscription_events])
+        except Exception:
+            # Something failed for the whole batch, apply the events one by one to isolate the culprit
+            for event in subscription_events:
+                self.__process(event)
+            return
+
+        for event, error in zip(subscription_events, errors):
+            if error is None:
+                self.__mark_as_processed(event)
+            else:
+                self.__mark_as_failed(event, error)
+
+    def __mark_as_processed(self, event):
+        event.attempts += 1
+        event.status = WebhookEventStatus.PROCESSED
+        event.error = ''
+        event.processed_at = timezone.now()
+
+    def __mark_as_failed(self, event, error):
+        event.attempts += 1
+        event.error = f'{error}'
+        if event.attempts >= self.max_attempts:
+            event.status = WebhookEventStatus.FAILED
+        else:
+            backoff = self.retry_backoff * 2 ** (event.attempts - 1)
+            event.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+
+    def __record_metrics(self, events):
+        processed = [event for event in events if event.status == WebhookEventStatus.PROCESSED]
+        failed = [event for event in events if event.status == WebhookEventStatus.FAILED]
+        metrics.increment('webhook_inbox.processed', len(processed))
+        metrics.increment('webhook_inbox.failed', len(failed))
+        metrics.increment('webhook_inbox.retried', len(events) - len(processed) - len(failed))
+        if processed:
+            lag = max((event.processed_at - event.created_at).total_seconds() for event in processed)
+            metrics.set_gauge('webhook_inbox.lag_seconds', lag)
@@ -1,30 +1,76 @@
-from rest_framework.test import APITestCase
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.db import connection
+from rest_framework.test import APITestCase, APITransactionTestCase
 
+from ..serializers import MyTokenObtainPairSerializer
+from ..utils import QueryBudgets
 
-class BaseAPITestCase(APITestCase):
+
+class TestTransactionSavepoints:
+    # The test case wraps every test in a transaction, so the outermost atomic blocks of the views
+    # send SAVEPOINT and RELEASE statements that the production requests never send
+    STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+    def __init__(self):
+        self.depth = len(connection.savepoint_ids) if connection.in_atomic_block else None
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Django runs them while the savepoints of the enclosing blocks are the only ones listed.
+        # A request made while serving another one counts its own statements.
+        if (self.depth is not None and sql.startswith(self.STATEMENTS)
+                and len(connection.savepoint_ids) == self.depth and self.is_innermost()):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def is_innermost(self):
+        return [wrapper for wrapper in connection.execute_wrappers if isinstance(wrapper, type(self))][-1] is self
+
+
+class BaseAPIClientMixin:
 
     def post(self, url, data, user=None, **extra):
         self._authenticate_user(user)
-        return self.client.post(path=url, data=data, format='json', **extra)
+        return self._check_query_budget(self.client.post, path=url, data=data, format='json', **extra)
 
     def get(self, url, user=None, **extra):
         self._authenticate_user(user)
-        return self.client.get(path=url, format='json', **extra)
+        return self._check_query_budget(self.client.get, path=url, format='json', **extra)
 
     def put(self, url, data, user=None, **extra):
         self._authenticate_user(user)
-        return self.client.put(path=url, data=data, format='json', **extra)
+        return self._check_query_budget(self.client.put, path=url, data=data, format='json', **extra)
 
     def patch(self, url, data, user=None, **extra):
         self._authenticate_user(user)
-        return self.client.patch(path=url, data=data, format='json', **extra)
+        return self._check_query_budget(self.client.patch, path=url, data=data, format='json', **extra)
 
     def delete(self, url, user=None, **extra):
         self._authenticate_user(user)
-        return self.client.delete(path=url, **extra)
+        return self._check_query_budget(self.client.delete, path=url, **extra)
 
     def _authenticate_user(self, user):
         if user is not None:
-            refresh = RefreshToken.for_user(user)
+            refresh = MyTokenObtainPairSerializer.get_token(user)
             self.client.credentials(HTTP_AUTHORIZATION=f'JWT {str(refresh.access_token)}')
+
+    def _check_query_budget(self, request, **kwargs):
+        # Every request of the tests must stay within the queries budget of its view in query_budgets.json,
+        # counting only the queries the request makes in production
+        savepoints = TestTransactionSavepoints()
+        with connection.execute_wrapper(savepoints):
+            response = request(**kwargs)
+        view_name = getattr(response, 'db_view_name', None)
+        if view_name:
+            response.db_queries.count -= savepoints.count
+            exceeded = QueryBudgets().exceeded(view_name, response.db_queries, include_time=False)
+            if exceeded:
+                self.fail(f'{view_name} went over its budget: {", ".join(exceeded)}')
+        return response
+
+
+class BaseAPITestCase(BaseAPIClientMixin, APITestCase):
+    pass
+
+
+class BaseAPITransactionTestCase(BaseAPIClientMixin, APITransactionTestCase):
+    pass
@@ -0,0 +1,40 @@
+import json
+from urllib.parse import parse_qsl, urlsplit
+
+import stripe
+from stripe.http_client import HTTPClient
+
+from ..utils.stripe_stand_in import StripeObjects
+
+
+class FakeStripe(StripeObjects, HTTPClient):
+
+    # Answers the Stripe calls in process with the objects of the stand-in server
+    name = 'fake'
+
+    def __init__(self):
+        StripeObjects.__init__(self, subscription_status='incomplete')
+        HTTPClient.__init__(self)
+        self.requests = []
+
+    def __enter__(self):
+        self.previous_client = stripe.default_http_client
+        self.previous_api_key = stripe.api_key
+        stripe.default_http_client = self
+        stripe.api_key = 'sk_test_fake'
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stripe.default_http_client = self.previous_client
+        stripe.api_key = self.previous_api_key
+        return False
+
+    def request(self, method, url, headers, post_data=None):
+        path, query = urlsplit(url).path, urlsplit(url).query
+        params = dict(parse_qsl(post_data or query))
+        self.requests.append((method, path, params))
+        status, body = self.route(method, path, params)
+        return json.dumps(body), status, {'Request-Id': f'req_{len(self.requests)}'}
+
+    def close(self):
+        pass
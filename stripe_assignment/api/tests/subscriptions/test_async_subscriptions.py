@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+from expects import be_above, be_below, equal, expect
+from mock import patch
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+from stripe.error import APIConnectionError, CardError
+
+from ...models import Account, Customer, PaymentMethod, Subscription, User
+from ...models.constants import (PaymentMethodType, SubscriptionProduct,
+                                 SubscriptionStatus)
+from ...services import (BillingProfile, StripeCircuitBreaker,
+                         WebhookEventDeduplicator)
+from ..base import BaseAPITransactionTestCase
+
+
+class AsyncSubscriptionsTestCase(BaseAPITransactionTestCase):
+
+    def setUp(self):
+        self.subscribe_url = reverse('async-subscriptions-subscribe')
+        self.status_url = reverse('async-subscriptions-status')
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(
+            username='goku',
+            password='goku1234',
+            first_name='Son',
+            last_name='Goku',
+            email='goku@dragonball.com',
+            account=self.account
+        )
+        Customer.objects.create(is_active=True, id_reference='cus_whatever', account=self.account)
+        PaymentMethod.objects.create(
+            is_active=True, id_reference='pm_whatever', type=PaymentMethodType.CARD, account=self.account)
+        self.data = {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767}
+        cache.clear()
+        WebhookEventDeduplicator.recent_event_ids.clear()
+
+    def test_it_returns_not_authorized_with_no_credentials(self):
+        response = self.client.post(self.subscribe_url, data=self.data, format='json')
+
+        expect(response.status_code).to(equal(status.HTTP_401_UNAUTHORIZED))
+        expect(response.json()).to(equal({'detail': 'Authentication credentials were not provided.'}))
+
+    def test_it_validates_the_subscription_data(self):
+        response = self.post(url=self.subscribe_url, user=self.user, data=dict(self.data, card_number='42'))
+
+        expect(response.status_code).to(equal(status.HTTP_400_BAD_REQUEST))
+        expect(list(response.json())).to(equal(['card_number']))
+
+    @patch('stripe.Subscription.create')
+    def test_it_creates_the_subscription(self, subscription_create):
+        response = self.post(url=self.subscribe_url, user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        _, kwargs = subscription_create.call_args
+        expect(kwargs['customer']).to(equal('cus_whatever'))
+        expect(self.user.get_subscription().status).to(equal(SubscriptionStatus.PENDING))
+
+        response = self.get(url=self.status_url, user=self.user)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.json()['status']).to(equal(SubscriptionStatus.PENDING))
+
+    @patch('stripe.Subscription.create')
+    def test_it_maps_the_gateway_errors_like_the_sync_endpoint(self, subscription_create):
+        subscription_create.side_effect = CardError(message="Card error", param="number", code="whatever")
+
+        response = self.post(url=self.subscribe_url, user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_400_BAD_REQUEST))
+        expect(response.json()).to(equal({'non_field_errors': ['Card error']}))
+
+    @patch('stripe.Subscription.create')
+    def test_it_fails_fast_with_a_503_while_the_circuit_is_open(self, subscription_create):
+        StripeCircuitBreaker.reset()
+        for _ in range(settings.STRIPE_BREAKER_MIN_CALLS):
+            StripeCircuitBreaker().record(0.1, APIConnectionError('Connection refused'))
+
+        response = self.post(url=self.subscribe_url, user=self.user, data=self.data)
+        StripeCircuitBreaker.reset()
+
+        expect(response.status_code).to(equal(status.HTTP_503_SERVICE_UNAVAILABLE))
+        expect(int(response['Retry-After'])).to(be_above(0))
+        expect(subscription_create.called).to(equal(False))
+
+    @patch('stripe.Subscription.create')
+    def test_it_replays_requests_with_the_same_idempotency_key(self, subscription_create):
+        self.post(url=self.subscribe_url, user=self.user, data=self.data, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        response = self.post(url=self.subscribe_url, user=self.user, data=self.data, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response['Idempotent-Replayed']).to(equal('true'))
+        expect(subscription_create.call_count).to(equal(1))
+
+    def test_it_returns_not_found_without_subscription(self):
+        response = self.get(url=self.status_url, user=self.user)
+
+        expect(response.status_code).to(equal(status.HTTP_404_NOT_FOUND))
+
+    @override_settings(STRIPE_WEBHOOK_SECRET='')
+    def test_the_webhook_applies_the_events(self):
+        Subscription.objects.create(
+            status=SubscriptionStatus.PENDING,
+            price_reference=SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME),
+            account=self.account
+        )
+
+        response = self.post(url=reverse('async-stripe-webhook'), data={
+            'id': 'evt_1Jgi50KBAHswNGjYg6mOHDr0',
+            'type': 'customer.subscription.created',
+            'created': 1633318985,
+            'data': {
+                'object': {
+                    'id': 'sub_1Jgi4xKBAHswNGjYuEORMJpB',
+                    'current_period_end': 1635997383,
+                    'current_period_start': 1633318983,
+                    'customer': 'cus_whatever',
+                    'status': 'active',
+                }
+            }
+        })
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.json()).to(equal('OK'))
+        expect(self.user.get_subscription().status).to(equal(SubscriptionStatus.SUCCESSFUL))
+
+    def test_the_status_returns_not_modified_for_the_current_etag(self):
+        Subscription.objects.create(
+            status=SubscriptionStatus.PENDING,
+            price_reference=SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME),
+            account=self.account)
+        etag = self.get(url=self.status_url, user=self.user)['ETag']
+
+        response = self.get(url=self.status_url, user=self.user, HTTP_IF_NONE_MATCH=etag)
+
+        expect(response.status_code).to(equal(status.HTTP_304_NOT_MODIFIED))
+        expect(response['ETag']).to(equal(etag))
+
+    def test_the_queries_of_the_worker_threads_count_toward_the_request(self):
+        Subscription.objects.create(
+            status=SubscriptionStatus.PENDING,
+            price_reference=SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME),
+            account=self.account)
+
+        response = self.get(url=self.status_url, user=self.user)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.db_view_name).to(equal('async-subscriptions-status'))
+        expect(response.db_queries.count).to(equal(1))
+
+    def test_slow_status_requests_are_served_concurrently(self):
+        authorization = f'JWT {RefreshToken.for_user(self.user).access_token}'
+        in_flight = []
+        lock = threading.Lock()
+
+        def slow_billing_profile(account_id):
+            with lock:
+                in_flight.append(threading.get_ident())
+            time.sleep(0.2)
+            return BillingProfile(account_id)
+
+        async def request_concurrently():
+            client = AsyncClient()
+            return await asyncio.gather(*[
+                client.get(self.status_url, authorization=authorization) for _ in range(10)])
+
+        with patch.object(BillingProfile, 'fetch', side_effect=slow_billing_profile):
+            started_at = time.monotonic()
+            responses = async_to_sync(request_concurrently)()
+            elapsed = time.monotonic() - started_at
+
+        expect([response.status_code for response in responses]).to(equal([status.HTTP_404_NOT_FOUND] * 10))
+        expect(len(in_flight)).to(equal(10))
+        expect(elapsed).to(be_below(1))
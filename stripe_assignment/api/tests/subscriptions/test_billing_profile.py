@@ -0,0 +1,104 @@
+from django.core.cache import cache
+from django.urls import reverse
+from expects import be_none, equal, expect
+from mock import patch
+from rest_framework import status
+
+from ...models import Account, Customer, PaymentMethod, Subscription, User
+from ...models.constants import (PaymentMethodType, SubscriptionProduct,
+                                 SubscriptionStatus)
+from ...services import BillingProfile
+from ..base import BaseAPITestCase
+
+
+class BillingProfileTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(
+            username='goku',
+            password='goku1234',
+            first_name='Son',
+            last_name='Goku',
+            email='goku@dragonball.com',
+            account=self.account
+        )
+        self.customer = Customer.objects.create(is_active=True, id_reference='cus_whatever', account=self.account)
+        Customer.objects.create(is_active=False, id_reference='cus_inactive', account=self.account)
+        self.payment_method = PaymentMethod.objects.create(
+            is_active=True, id_reference='pm_whatever', type=PaymentMethodType.CARD, account=self.account)
+        self.data = {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767}
+        cache.clear()
+
+    def create_subscription(self):
+        return Subscription.objects.create(
+            status=SubscriptionStatus.PENDING,
+            price_reference=SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME),
+            account=self.account
+        )
+
+    def test_it_loads_the_billing_profile_with_a_single_query(self):
+        subscription = self.create_subscription()
+        self.create_subscription()
+        user = User.objects.get(pk=self.user.pk)
+
+        with self.assertNumQueries(1):
+            profile = BillingProfile.load(user)
+            expect(profile.customer).to(equal(self.customer))
+            expect(profile.customer.id_reference).to(equal('cus_whatever'))
+            expect(profile.payment_method).to(equal(self.payment_method))
+            expect(profile.payment_method.type).to(equal(PaymentMethodType.CARD))
+            expect(profile.subscription).to(equal(subscription))
+            expect(profile.subscription.status).to(equal(SubscriptionStatus.PENDING))
+            expect(profile.subscription.purchase_date).to(equal(subscription.created_at.date()))
+
+    def test_it_is_memoised_for_the_requester(self):
+        user = User.objects.get(pk=self.user.pk)
+        BillingProfile.load(user)
+
+        with self.assertNumQueries(0):
+            profile = BillingProfile.load(user)
+
+        expect(profile.subscription).to(be_none)
+
+    def test_an_account_without_billing_data_has_an_empty_profile(self):
+        account = Account.objects.create(name="Other account")
+
+        profile = BillingProfile.fetch(account.id)
+
+        expect(profile.customer).to(be_none)
+        expect(profile.payment_method).to(be_none)
+        expect(profile.subscription).to(be_none)
+
+    @patch('stripe.Subscription.create')
+    def test_subscribing_reads_the_billing_data_with_a_single_query(self, subscription_create):
+        # Billing profile, recorded gateway operations, and the locked re-check and insert of the temporal
+        # subscription within a savepoint
+        with self.assertNumQueries(6):
+            response = self.post(url=reverse('subscriptions-subscribe'), user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+
+    @patch('stripe.Subscription.create')
+    def test_already_subscribed_requesters_are_rejected_before_calling_stripe(self, subscription_create):
+        self.create_subscription()
+
+        with self.assertNumQueries(1):
+            response = self.post(url=reverse('subscriptions-subscribe'), user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_409_CONFLICT))
+        expect(subscription_create.called).to(equal(False))
+
+    def test_the_status_reads_the_subscription_with_a_single_query(self):
+        self.create_subscription()
+
+        with self.assertNumQueries(1):
+            response = self.get(url=reverse('subscriptions-status'), user=self.user)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.json()['status']).to(equal(SubscriptionStatus.PENDING))
@@ -0,0 +1,88 @@
+import json
+import uuid
+
+from django.test import override_settings
+from django.urls import reverse
+from expects import equal, expect
+from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+
+from ...models import Account, Subscription, User
+from ...models.constants import SubscriptionProduct, SubscriptionStatus
+from ...serializers import StatusSerializer
+from ..base import BaseAPITestCase
+
+
+@override_settings(SERVICE_API_KEYS=['first-service-key', 'second-service-key'])
+class BulkStatusTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        self.url = reverse('subscriptions-bulk-status')
+        self.accounts = [Account.objects.create(name=f"Account {i}") for i in range(3)]
+        self.subscriptions = [
+            Subscription.objects.create(
+                status=SubscriptionStatus.SUCCESSFUL,
+                price_reference=SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME),
+                account=account)
+            for account in self.accounts[:2]
+        ]
+        # A later subscription of the first account, the earliest one is returned
+        Subscription.objects.create(
+            status=SubscriptionStatus.FAILED,
+            price_reference=SubscriptionProduct.price_by_product(SubscriptionProduct.PRO_PRODUCT_NAME),
+            account=self.accounts[0])
+
+    def bulk_status(self, account_ids, key='second-service-key'):
+        return self.client.post(
+            self.url, data={'account_ids': account_ids}, format='json', HTTP_AUTHORIZATION=f'Service {key}')
+
+    def payload(self, subscription):
+        return json.loads(json.dumps(StatusSerializer(instance=subscription).data, cls=JSONEncoder))
+
+    def results(self, response):
+        return json.loads(b''.join(response.streaming_content))['results']
+
+    def test_it_rejects_requests_without_a_service_key(self):
+        user = User.objects.create_user(username='goku', password='goku1234', account=self.accounts[0])
+
+        response = self.post(url=self.url, user=user, data={'account_ids': [f'{self.accounts[0].id}']})
+
+        expect(response.status_code).to(equal(status.HTTP_401_UNAUTHORIZED))
+
+    def test_it_rejects_unknown_service_keys(self):
+        response = self.bulk_status([f'{self.accounts[0].id}'], key='unknown-key')
+
+        expect(response.status_code).to(equal(status.HTTP_401_UNAUTHORIZED))
+
+    def test_it_returns_the_earliest_subscription_of_every_account(self):
+        account_ids = [f'{account.id}' for account in reversed(self.accounts)]
+
+        response = self.bulk_status(account_ids)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(self.results(response)).to(equal([
+            {'account_id': account_ids[0], 'subscription': None},
+            {'account_id': account_ids[1], 'subscription': self.payload(self.subscriptions[1])},
+            {'account_id': account_ids[2], 'subscription': self.payload(self.subscriptions[0])},
+        ]))
+
+    @override_settings(SUBSCRIPTION_BULK_STATUS_CHUNK_SIZE=2)
+    def test_it_reads_the_accounts_with_a_query_per_chunk(self):
+        account_ids = [f'{account.id}' for account in self.accounts] + [f'{uuid.uuid4()}']
+
+        with self.assertNumQueries(2):
+            response = self.bulk_status(account_ids)
+            results = self.results(response)
+
+        expect([result['account_id'] for result in results]).to(equal(account_ids))
+
+    def test_it_validates_the_account_ids(self):
+        response = self.bulk_status(['not an uuid'])
+
+        expect(response.status_code).to(equal(status.HTTP_400_BAD_REQUEST))
+        expect(list(response.json())).to(equal(['account_ids']))
+
+    def test_it_limits_the_accounts_of_a_request(self):
+        response = self.bulk_status([f'{uuid.uuid4()}' for _ in range(1001)])
+
+        expect(response.status_code).to(equal(status.HTTP_400_BAD_REQUEST))
@@ -1,12 +1,20 @@
+import tempfile
 from datetime import timedelta
 
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
-from expects import equal, expect
+from django.utils.http import http_date
+from expects import equal, expect, start_with
 from rest_framework import status
 
 from ...models import Account, Subscription, User
 from ...models.constants import SubscriptionProduct, SubscriptionStatus
+from ...services import SubscriptionStatusCache
+from ...utils import metrics
 from ..base import BaseAPITestCase
 
 
@@ -23,6 +31,16 @@ class StatusTestCase(BaseAPITestCase):
             email='goku@dragonball.com',
             account=self.account
         )
+        cache.clear()
+        metrics.reset()
+
+    def create_subscription(self, **fields):
+        return Subscription.objects.create(**{
+            'status': SubscriptionStatus.PENDING,
+            'price_reference': SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME),
+            'account': self.account,
+            **fields,
+        })
 
     def test_it_returns_not_authorized_with_no_credentials(self):
         response = self.get(url=self.url, user=None)
@@ -39,15 +57,12 @@ class StatusTestCase(BaseAPITestCase):
         now = timezone.now()
         price_reference = SubscriptionProduct.price_by_product(
             SubscriptionProduct.BASIC_PRODUCT_NAME)
-        subscription = Subscription.objects.create(
+        subscription = self.create_subscription(
             created_at=now,
-            status=SubscriptionStatus.PENDING,
             payment_gateway_status='super status',
             current_period_start=now,
             current_period_end=now + timedelta(days=30),
             id_reference='subscription reference id',
-            price_reference=price_reference,
-            account=self.account
         )
 
         response = self.get(url=self.url, user=self.user)
@@ -68,3 +83,93 @@ class StatusTestCase(BaseAPITestCase):
             'price_reference': price_reference,
             'purchase_date': subscription.created_at.strftime('%Y-%m-%d')
         }))
+
+    def test_it_serves_repeated_requests_from_the_cache(self):
+        self.create_subscription()
+        first_response = self.get(url=self.url, user=self.user)
+
+        with self.assertNumQueries(0):
+            response = self.get(url=self.url, user=self.user)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.json()).to(equal(first_response.json()))
+        expect(metrics.get('subscription_status_cache.misses')).to(equal(1))
+        expect(metrics.get('subscription_status_cache.hits')).to(equal(1))
+
+    def test_it_caches_the_not_found_response(self):
+        self.get(url=self.url, user=self.user)
+
+        with self.assertNumQueries(0):
+            response = self.get(url=self.url, user=self.user)
+
+        expect(response.status_code).to(equal(status.HTTP_404_NOT_FOUND))
+        expect(metrics.get('subscription_status_cache.hits')).to(equal(1))
+
+    def test_it_works_with_a_shared_cache_backend(self):
+        self.create_subscription()
+        with tempfile.TemporaryDirectory() as location:
+            with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }}):
+                first_response = self.get(url=self.url, user=self.user)
+                response = self.get(url=self.url, user=self.user)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.json()).to(equal(first_response.json()))
+        expect(metrics.get('subscription_status_cache.hits')).to(equal(1))
+
+    def test_it_returns_the_validators_of_the_subscription(self):
+        subscription = self.create_subscription()
+
+        response = self.get(url=self.url, user=self.user)
+
+        expect(response['ETag']).to(equal(
+            SubscriptionStatusCache.validators(subscription.id, subscription.updated_at)['etag']))
+        expect(response['Last-Modified']).to(equal(http_date(subscription.updated_at.timestamp())))
+
+    def test_it_returns_not_modified_for_the_current_etag(self):
+        self.create_subscription()
+        etag = self.get(url=self.url, user=self.user)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.get(url=self.url, user=self.user, HTTP_IF_NONE_MATCH=etag)
+
+        expect(response.status_code).to(equal(status.HTTP_304_NOT_MODIFIED))
+        expect(response.content).to(equal(b''))
+        expect(response['ETag']).to(equal(etag))
+        expect(metrics.get('subscription_status.not_modified')).to(equal(1))
+
+    def test_it_returns_not_modified_reading_only_the_validator_columns(self):
+        self.create_subscription()
+        etag = self.get(url=self.url, user=self.user)['ETag']
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(url=self.url, user=self.user, HTTP_IF_NONE_MATCH=etag)
+
+        expect(response.status_code).to(equal(status.HTTP_304_NOT_MODIFIED))
+        expect(len(queries.captured_queries)).to(equal(1))
+        expect(queries.captured_queries[0]['sql']).to(start_with('SELECT "api_subscription"."id", "api_subscription"."updated_at" FROM'))
+        expect(metrics.get('subscription_status_cache.misses')).to(equal(1))
+
+    def test_it_returns_not_modified_since_the_last_modification(self):
+        self.create_subscription()
+        last_modified = self.get(url=self.url, user=self.user)['Last-Modified']
+
+        response = self.get(url=self.url, user=self.user, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        expect(response.status_code).to(equal(status.HTTP_304_NOT_MODIFIED))
+
+    def test_it_returns_the_new_status_once_the_subscription_changes(self):
+        subscription = self.create_subscription()
+        etag = self.get(url=self.url, user=self.user)['ETag']
+        subscription.status = SubscriptionStatus.SUCCESSFUL
+        subscription.save()
+        SubscriptionStatusCache().refresh(subscription)
+
+        response = self.get(url=self.url, user=self.user, HTTP_IF_NONE_MATCH=etag)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.json()['status']).to(equal(SubscriptionStatus.SUCCESSFUL))
+        expect(response['ETag']).not_to(equal(etag))
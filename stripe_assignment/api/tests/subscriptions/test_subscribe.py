@@ -1,12 +1,19 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.urls import reverse
 from django.utils import timezone
 from doublex import Stub
 from expects import be_above, be_false, be_true, equal, expect, have_len
-from mock import patch
+from mock import ANY, Mock, patch
 from rest_framework import status
-from stripe.error import AuthenticationError, CardError, InvalidRequestError
+from stripe.error import (APIConnectionError, AuthenticationError, CardError,
+                          InvalidRequestError)
 
-from ...models import Account, Customer, PaymentMethod, Subscription, User
+from ...models import (Account, Customer, GatewayOperation, PaymentMethod,
+                       Subscription, User)
 from ...models.constants import (PaymentMethodType, SubscriptionProduct,
                                  SubscriptionStatus)
 from ..base import BaseAPITestCase
@@ -25,6 +32,7 @@ class SubscibeTestCase(BaseAPITestCase):
             email='goku@dragonball.com',
             account=self.account
         )
+        cache.clear()
 
     def test_it_returns_not_authorized_with_no_credentials(self):
         response = self.post(url=self.url, user=None, data={})
@@ -147,7 +155,8 @@ class SubscibeTestCase(BaseAPITestCase):
         expect(kwargs).to(equal({
             'name': self.user.name,
             'email': self.user.email,
-            'metadata': {'user_id': f'{self.user.id}'}
+            'metadata': {'user_id': f'{self.user.id}'},
+            'idempotency_key': ANY
         }))
         customer = self.user.get_customer()
         expect(customer.id_reference).to(equal('cus_whatever'))
@@ -230,12 +239,14 @@ class SubscibeTestCase(BaseAPITestCase):
                 "exp_year": 2100,
                 "cvc": 767,
             },
+            'idempotency_key': ANY
         }))
         expect(payment_method_attach.called).to(be_true)
         _, kwargs = payment_method_attach.call_args
         expect(kwargs).to(equal({
             'sid': 'pm_whatever',
             'customer': 'cus_whatever',
+            'idempotency_key': ANY
         }))
         expect(customer_modify.called).to(be_true)
         _, kwargs = customer_modify.call_args
@@ -243,7 +254,8 @@ class SubscibeTestCase(BaseAPITestCase):
             'sid': 'cus_whatever',
             'invoice_settings': {
                 'default_payment_method': 'pm_whatever'
-            }
+            },
+            'idempotency_key': ANY
         }))
         payment_method = self.user.get_payment_method()
         expect(payment_method.id_reference).to(equal('pm_whatever'))
@@ -354,7 +366,8 @@ class SubscibeTestCase(BaseAPITestCase):
             'customer': 'cus_whatever',
             'items': [{
                 'price': SubscriptionProduct.BASIC_PRODUCT_PRICE_ID,
-            }]
+            }],
+            'idempotency_key': ANY
         }))
         subscription = self.user.get_subscription()
         expect(subscription.status).to(equal(SubscriptionStatus.PENDING))
@@ -362,6 +375,35 @@ class SubscibeTestCase(BaseAPITestCase):
             SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME)))
         expect(subscription.account).to(equal(self.account))
 
+    @patch('stripe.Subscription.create')
+    def test_it_invalidates_the_cached_subscription_status(
+        self,
+        subscription_create
+    ):
+        data = {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767}
+        Customer.objects.create(
+            is_active=True,
+            id_reference='cus_whatever',
+            account=self.user.account)
+        PaymentMethod.objects.create(
+            is_active=True,
+            id_reference='cus_whatever',
+            type=PaymentMethodType.CARD,
+            account=self.user.account)
+        status_url = reverse('subscriptions-status')
+        self.get(url=status_url, user=self.user)
+
+        self.post(url=self.url, user=self.user, data=data)
+
+        response = self.get(url=status_url, user=self.user)
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.json()['status']).to(equal(SubscriptionStatus.PENDING))
+
     @patch('stripe.Subscription.create')
     def test_it_does_not_creates_a_subscription_if_already_exist_and_returns_a_409_error(
         self,
@@ -397,6 +439,37 @@ class SubscibeTestCase(BaseAPITestCase):
         expect(Subscription.objects.filter(account=self.account)).to(have_len(1))
         expect(self.user.get_subscription().id).to(equal(subscription.id))
 
+    @patch('stripe.Subscription.create')
+    @patch('stripe.Customer.create')
+    def test_it_returns_a_409_error_if_a_concurrent_request_subscribed_during_the_stripe_calls(
+        self,
+        customer_create,
+        subscription_create
+    ):
+        data = {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767}
+        PaymentMethod.objects.create(
+            is_active=True,
+            id_reference='pm_whatever',
+            type=PaymentMethodType.CARD,
+            account=self.user.account)
+
+        def subscribe_concurrently(**kwargs):
+            Subscription.objects.create(status=SubscriptionStatus.PENDING, account=self.account)
+            return Mock(id='cus_whatever')
+        customer_create.side_effect = subscribe_concurrently
+
+        response = self.post(url=self.url, user=self.user, data=data)
+
+        expect(response.status_code).to(equal(status.HTTP_409_CONFLICT))
+        expect(response.json()).to(equal({'non_field_errors': ['Already subscribed!']}))
+        expect(subscription_create.called).to(be_false)
+        expect(Subscription.objects.filter(account=self.account)).to(have_len(1))
+
     @patch('stripe.Subscription.create')
     def test_it_does_not_create_a_temporal_subscription_if_subscription_creation_fails(
         self,
@@ -448,3 +521,121 @@ class SubscibeTestCase(BaseAPITestCase):
 
         expect(response.status_code).to(equal(status.HTTP_400_BAD_REQUEST))
         expect(response.json()).to(equal({'non_field_errors': ['AuthenticationError']}))
+
+    @patch('stripe.Subscription.create')
+    @patch('stripe.PaymentMethod.attach')
+    @patch('stripe.PaymentMethod.create')
+    @patch('stripe.Customer.modify')
+    @patch('stripe.Customer.create')
+    def test_it_sends_the_same_idempotency_keys_when_the_request_is_retried(
+        self,
+        customer_create,
+        customer_modify,
+        payment_method_create,
+        payment_method_attach,
+        subscription_create
+    ):
+        data = {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767}
+        with Stub() as StubCustomer:
+            StubCustomer.id = "cus_whatever"
+        customer_create.return_value = StubCustomer
+        with Stub() as StubPaymentMethod:
+            StubPaymentMethod.id = "pm_whatever"
+        payment_method_create.return_value = StubPaymentMethod
+        payment_method_attach.side_effect = [APIConnectionError(message="APIConnectionError"), StubPaymentMethod]
+
+        response = self.post(url=self.url, user=self.user, data=data)
+
+        expect(response.status_code).to(equal(status.HTTP_400_BAD_REQUEST))
+        # The attempt nonce and the completed customer and payment method
+        expect(GatewayOperation.objects.filter(account=self.account)).to(have_len(3))
+        _, first_attach_kwargs = payment_method_attach.call_args
+
+        response = self.post(url=self.url, user=self.user, data=data)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(customer_create.call_count).to(equal(1))
+        expect(payment_method_create.call_count).to(equal(1))
+        expect(payment_method_attach.call_count).to(equal(2))
+        _, kwargs = payment_method_attach.call_args
+        expect(kwargs['idempotency_key']).to(equal(first_attach_kwargs['idempotency_key']))
+        expect(self.user.get_customer().id_reference).to(equal('cus_whatever'))
+        expect(self.user.get_payment_method().id_reference).to(equal('pm_whatever'))
+        expect(GatewayOperation.objects.filter(account=self.account)).to(have_len(0))
+
+    @patch('stripe.Subscription.create')
+    def test_every_new_attempt_sends_new_idempotency_keys(
+        self,
+        subscription_create
+    ):
+        data = {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767}
+        other_account = Account.objects.create(name="Other account")
+        other_user = User.objects.create_user(username='vegeta', password='vegeta1234', account=other_account)
+        for user in (self.user, other_user):
+            Customer.objects.create(is_active=True, id_reference=f'cus_{user.username}', account=user.account)
+            PaymentMethod.objects.create(
+                is_active=True,
+                id_reference='pm_whatever',
+                type=PaymentMethodType.CARD,
+                account=user.account)
+        subscription_create.side_effect = [APIConnectionError(message="APIConnectionError"), Mock(id='sub_1'),
+                                           Mock(id='sub_2'), Mock(id='sub_3')]
+
+        self.post(url=self.url, user=self.user, data=data)
+        self.post(url=self.url, user=self.user, data=data)
+        # A completed subscription is not replayed when subscribing again with the same data
+        self.user.get_subscription().delete()
+        self.post(url=self.url, user=self.user, data=data)
+        self.post(url=self.url, user=other_user, data=data)
+
+        keys = [kwargs['idempotency_key'] for _, kwargs in subscription_create.call_args_list]
+        expect(keys[0]).to(equal(keys[1]))
+        expect(len(set(keys))).to(equal(3))
+        expect(GatewayOperation.objects.filter(account__in=[self.account, other_account])).to(have_len(0))
+
+    @patch('stripe.Subscription.create')
+    def test_a_retry_after_stripe_forgot_the_keys_starts_a_new_attempt(self, subscription_create):
+        data = {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767}
+        Customer.objects.create(is_active=True, id_reference='cus_whatever', account=self.account)
+        PaymentMethod.objects.create(
+            is_active=True, id_reference='pm_whatever', type=PaymentMethodType.CARD, account=self.account)
+        subscription_create.side_effect = [
+            APIConnectionError(message="APIConnectionError"), APIConnectionError(message="APIConnectionError")]
+
+        self.post(url=self.url, user=self.user, data=data)
+        GatewayOperation.objects.update(created_at=timezone.now() - timedelta(hours=25))
+        self.post(url=self.url, user=self.user, data=data)
+
+        keys = [kwargs['idempotency_key'] for _, kwargs in subscription_create.call_args_list]
+        expect(keys[0]).not_to(equal(keys[1]))
+        # Only the nonce of the new attempt is kept
+        operations = GatewayOperation.objects.filter(account=self.account)
+        expect(operations).to(have_len(1))
+        expect(operations.get().created_at).to(be_above(timezone.now() - timedelta(hours=1)))
+
+    def test_it_prunes_the_operations_older_than_the_stripe_keys(self):
+        for index, age in enumerate((timedelta(hours=25), timedelta(hours=1))):
+            operation = GatewayOperation.objects.create(
+                idempotency_key=f'key_{index}', operation='attempt', account=self.account)
+            GatewayOperation.objects.filter(pk=operation.pk).update(created_at=timezone.now() - age)
+
+        output = StringIO()
+        call_command('prune_gateway_operations', stdout=output)
+
+        expect(list(GatewayOperation.objects.values_list('idempotency_key', flat=True))).to(equal(['key_1']))
+        expect(output.getvalue()).to(equal('Deleted 1 gateway operations\n'))
@@ -0,0 +1,87 @@
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from expects import equal, expect
+from rest_framework import status
+
+from ...models import Account, Customer, User
+from ...models.constants import StripeGatewayMode, SubscriptionProduct
+from ...services import PaymentsGateway
+from ...utils import metrics
+from ..base import BaseAPITestCase
+from ..fake_stripe import FakeStripe
+
+
+class SubscribeCompactlyTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        self.url = reverse('subscriptions-subscribe')
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(
+            username='goku',
+            password='goku1234',
+            first_name='Son',
+            last_name='Goku',
+            email='goku@dragonball.com',
+            account=self.account
+        )
+        self.data = {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767}
+        cache.clear()
+        metrics.reset()
+
+    def subscribe(self, mode):
+        with override_settings(STRIPE_GATEWAY_MODE=mode), FakeStripe() as fake_stripe:
+            response = self.post(url=self.url, user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        return fake_stripe
+
+    def test_a_first_time_subscriber_needs_five_calls_in_sequential_mode(self):
+        fake_stripe = self.subscribe(StripeGatewayMode.SEQUENTIAL)
+
+        expect([path for _, path, _ in fake_stripe.requests]).to(equal([
+            '/v1/customers',
+            '/v1/payment_methods',
+            '/v1/payment_methods/pm_2/attach',
+            '/v1/customers/cus_1',
+            '/v1/subscriptions',
+        ]))
+        expect(metrics.get('stripe.subscribe_calls')).to(equal(5))
+
+    def test_a_first_time_subscriber_needs_three_calls_in_compact_mode(self):
+        fake_stripe = self.subscribe(StripeGatewayMode.COMPACT)
+
+        expect([path for _, path, _ in fake_stripe.requests]).to(equal([
+            '/v1/payment_methods',
+            '/v1/customers',
+            '/v1/subscriptions',
+        ]))
+        expect(metrics.get('stripe.subscribe_calls')).to(equal(3))
+        expect(fake_stripe.payment_methods['pm_1']['customer']).to(equal('cus_2'))
+        expect(fake_stripe.customers['cus_2']['invoice_settings']).to(equal({'default_payment_method': 'pm_1'}))
+        expect(fake_stripe.subscriptions['sub_3']['default_payment_method']).to(equal('pm_1'))
+        expect(self.user.get_customer().id_reference).to(equal('cus_2'))
+        expect(self.user.get_payment_method().id_reference).to(equal('pm_1'))
+        expect(self.user.get_subscription().price_reference).to(equal(SubscriptionProduct.BASIC_PRODUCT_PRICE_ID))
+
+    def test_an_existing_customer_skips_the_default_payment_method_call_in_compact_mode(self):
+        Customer.objects.create(is_active=True, id_reference='cus_existing', account=self.account)
+
+        with override_settings(STRIPE_GATEWAY_MODE=StripeGatewayMode.COMPACT), FakeStripe() as fake_stripe:
+            fake_stripe.customers['cus_existing'] = {'id': 'cus_existing', 'object': 'customer'}
+            gateway = PaymentsGateway()
+            gateway.create_subscription(self.user, self.data)
+
+        expect(gateway.stripe_calls).to(equal(3))
+        expect([path for _, path, _ in fake_stripe.requests]).to(equal([
+            '/v1/payment_methods',
+            '/v1/payment_methods/pm_1/attach',
+            '/v1/subscriptions',
+        ]))
+        expect(fake_stripe.payment_methods['pm_1']['customer']).to(equal('cus_existing'))
+        expect(fake_stripe.subscriptions['sub_2']['default_payment_method']).to(equal('pm_1'))
@@ -0,0 +1,182 @@
+import threading
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from doublex import Stub
+from expects import be_false, be_none, equal, expect, have_len
+from mock import patch
+from rest_framework import status
+from stripe.error import APIConnectionError, CardError
+
+from ...models import (Account, Customer, GatewayOperation, PaymentMethod,
+                       Subscription, User)
+from ...models.constants import (PaymentMethodType, StripeGatewayMode,
+                                 SubscriptionProduct, SubscriptionStatus)
+from ..base import BaseAPITestCase
+
+
+@override_settings(STRIPE_GATEWAY_MODE=StripeGatewayMode.CONCURRENT)
+class SubscribeConcurrentlyTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        self.url = reverse('subscriptions-subscribe')
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(
+            username='goku',
+            password='goku1234',
+            first_name='Son',
+            last_name='Goku',
+            email='goku@dragonball.com',
+            account=self.account
+        )
+        self.data = {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767}
+        with Stub() as StubCustomer:
+            StubCustomer.id = "cus_whatever"
+        self.customer = StubCustomer
+        with Stub() as StubPaymentMethod:
+            StubPaymentMethod.id = "pm_whatever"
+        self.payment_method = StubPaymentMethod
+        cache.clear()
+
+    @patch('stripe.Subscription.create')
+    @patch('stripe.PaymentMethod.attach')
+    @patch('stripe.PaymentMethod.create')
+    @patch('stripe.Customer.modify')
+    @patch('stripe.Customer.create')
+    def test_it_creates_the_customer_and_the_payment_method_at_the_same_time(
+        self,
+        customer_create,
+        customer_modify,
+        payment_method_create,
+        payment_method_attach,
+        subscription_create
+    ):
+        # Both calls must be in flight at the same time to cross the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def create_customer(**kwargs):
+            barrier.wait()
+            return self.customer
+
+        def create_payment_method(**kwargs):
+            barrier.wait()
+            return self.payment_method
+
+        customer_create.side_effect = create_customer
+        payment_method_create.side_effect = create_payment_method
+
+        response = self.post(url=self.url, user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        _, kwargs = payment_method_attach.call_args
+        expect(kwargs['sid']).to(equal('pm_whatever'))
+        expect(kwargs['customer']).to(equal('cus_whatever'))
+        _, kwargs = customer_modify.call_args
+        expect(kwargs['invoice_settings']).to(equal({'default_payment_method': 'pm_whatever'}))
+        _, kwargs = subscription_create.call_args
+        expect(kwargs['customer']).to(equal('cus_whatever'))
+        expect(self.user.get_customer().id_reference).to(equal('cus_whatever'))
+        expect(self.user.get_payment_method().id_reference).to(equal('pm_whatever'))
+        expect(self.user.get_subscription().status).to(equal(SubscriptionStatus.PENDING))
+
+    @patch('stripe.Subscription.create')
+    @patch('stripe.PaymentMethod.attach')
+    @patch('stripe.PaymentMethod.create')
+    @patch('stripe.Customer.modify')
+    @patch('stripe.Customer.create')
+    def test_it_records_the_completed_calls_when_a_later_call_fails(
+        self,
+        customer_create,
+        customer_modify,
+        payment_method_create,
+        payment_method_attach,
+        subscription_create
+    ):
+        customer_create.return_value = self.customer
+        payment_method_create.return_value = self.payment_method
+        payment_method_attach.side_effect = APIConnectionError(message="APIConnectionError")
+
+        response = self.post(url=self.url, user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_400_BAD_REQUEST))
+        expect(response.json()).to(equal({'non_field_errors': ['APIConnectionError']}))
+        expect(customer_modify.called).to(be_false)
+        expect(subscription_create.called).to(be_false)
+        expect(self.user.get_subscription()).to(be_none)
+        operations = GatewayOperation.objects.filter(account=self.account)
+        expect(sorted(operations.values_list('operation', flat=True))).to(
+            equal(['attempt', 'customer.create', 'payment_method.create']))
+
+    @patch('stripe.Subscription.create')
+    @patch('stripe.PaymentMethod.attach')
+    @patch('stripe.PaymentMethod.create')
+    @patch('stripe.Customer.modify')
+    @patch('stripe.Customer.create')
+    def test_it_does_not_create_a_temporal_subscription_on_card_errors(
+        self,
+        customer_create,
+        customer_modify,
+        payment_method_create,
+        payment_method_attach,
+        subscription_create
+    ):
+        customer_create.return_value = self.customer
+        payment_method_create.side_effect = CardError(message="Card error", param="number", code="whatever")
+
+        response = self.post(url=self.url, user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_400_BAD_REQUEST))
+        expect(response.json()).to(equal({'non_field_errors': ['Card error']}))
+        expect(payment_method_attach.called).to(be_false)
+        expect(subscription_create.called).to(be_false)
+        expect(self.user.get_subscription()).to(be_none)
+
+    @patch('stripe.PaymentMethod.create')
+    @patch('stripe.Customer.create')
+    def test_it_records_the_created_customer_on_card_errors(self, customer_create, payment_method_create):
+        customer_create.return_value = self.customer
+        payment_method_create.side_effect = CardError(message="Card error", param="number", code="whatever")
+
+        self.post(url=self.url, user=self.user, data=self.data)
+        self.post(url=self.url, user=self.user, data=self.data)
+
+        # The retry with another card reuses the customer created by the declined attempt
+        expect(list(Customer.objects.filter(account=self.account).values_list('id_reference', flat=True))).to(
+            equal(['cus_whatever']))
+        expect(customer_create.call_count).to(equal(1))
+
+    @patch('stripe.Subscription.create')
+    def test_it_deletes_the_temporal_subscription_if_the_subscription_creation_fails(self, subscription_create):
+        Customer.objects.create(is_active=True, id_reference='cus_whatever', account=self.account)
+        PaymentMethod.objects.create(
+            is_active=True, id_reference='pm_whatever', type=PaymentMethodType.CARD, account=self.account)
+        subscription_create.side_effect = APIConnectionError(message="APIConnectionError")
+
+        response = self.post(url=self.url, user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_400_BAD_REQUEST))
+        expect(subscription_create.called).to(equal(True))
+        expect(self.user.get_subscription()).to(be_none)
+
+    @patch('stripe.Subscription.create')
+    def test_it_returns_a_409_error_if_already_subscribed(self, subscription_create):
+        Customer.objects.create(is_active=True, id_reference='cus_whatever', account=self.account)
+        PaymentMethod.objects.create(
+            is_active=True, id_reference='pm_whatever', type=PaymentMethodType.CARD, account=self.account)
+        Subscription.objects.create(
+            status=SubscriptionStatus.PENDING,
+            price_reference=SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME),
+            account=self.account
+        )
+
+        response = self.post(url=self.url, user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_409_CONFLICT))
+        expect(subscription_create.called).to(be_false)
+        expect(Subscription.objects.filter(account=self.account)).to(have_len(1))
@@ -0,0 +1,129 @@
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from expects import be_false, equal, expect
+from mock import patch
+from rest_framework import status
+from stripe.error import CardError
+
+from ...models import Account, Customer, PaymentMethod, Subscription, User
+from ...models.constants import PaymentMethodType, SubscriptionProduct
+from ...services import IdempotentRequests
+from ..base import BaseAPITestCase
+
+
+class SubscribeIdempotencyTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        self.url = reverse('subscriptions-subscribe')
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(
+            username='goku',
+            password='goku1234',
+            first_name='Son',
+            last_name='Goku',
+            email='goku@dragonball.com',
+            account=self.account
+        )
+        Customer.objects.create(
+            is_active=True,
+            id_reference='cus_whatever',
+            account=self.user.account)
+        PaymentMethod.objects.create(
+            is_active=True,
+            id_reference='pm_whatever',
+            type=PaymentMethodType.CARD,
+            account=self.user.account)
+        self.data = {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767}
+        cache.clear()
+
+    @patch('stripe.Subscription.create')
+    def test_it_replays_the_first_response_for_repeated_requests(self, subscription_create):
+        first_response = self.post(url=self.url, user=self.user, data=self.data, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        response = self.post(url=self.url, user=self.user, data=self.data, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        expect(first_response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.content).to(equal(first_response.content))
+        expect(response.get('Content-Type')).to(equal(first_response.get('Content-Type')))
+        expect(response['Idempotent-Replayed']).to(equal('true'))
+        expect(subscription_create.call_count).to(equal(1))
+        expect(Subscription.objects.filter(account=self.account).count()).to(equal(1))
+
+    @patch('stripe.Subscription.create')
+    def test_it_replays_error_responses_without_calling_the_gateway_again(self, subscription_create):
+        subscription_create.side_effect = CardError(message="Card error", param="number", code="whatever")
+        first_response = self.post(url=self.url, user=self.user, data=self.data, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        response = self.post(url=self.url, user=self.user, data=self.data, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        expect(response.status_code).to(equal(status.HTTP_400_BAD_REQUEST))
+        expect(response.content).to(equal(first_response.content))
+        expect(response.json()).to(equal({'non_field_errors': ['Card error']}))
+        expect(subscription_create.call_count).to(equal(1))
+
+    @patch('stripe.Subscription.create')
+    def test_it_rejects_a_key_reused_with_a_different_request(self, subscription_create):
+        self.post(url=self.url, user=self.user, data=self.data, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        response = self.post(
+            url=self.url,
+            user=self.user,
+            data=dict(self.data, subscription_product=SubscriptionProduct.PRO_PRODUCT_NAME),
+            HTTP_IDEMPOTENCY_KEY='key-1')
+
+        expect(response.status_code).to(equal(status.HTTP_422_UNPROCESSABLE_ENTITY))
+        expect(subscription_create.call_count).to(equal(1))
+
+    @patch('stripe.Subscription.create')
+    def test_keys_are_scoped_to_the_requester(self, subscription_create):
+        other_account = Account.objects.create(name="Other account")
+        other_user = User.objects.create_user(username='vegeta', password='vegeta1234', account=other_account)
+        Customer.objects.create(is_active=True, id_reference='cus_vegeta', account=other_account)
+        PaymentMethod.objects.create(
+            is_active=True, id_reference='pm_vegeta', type=PaymentMethodType.CARD, account=other_account)
+        self.post(url=self.url, user=self.user, data=self.data, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        response = self.post(url=self.url, user=other_user, data=self.data, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        expect(response.has_header('Idempotent-Replayed')).to(be_false)
+        expect(subscription_create.call_count).to(equal(2))
+
+    @patch('stripe.Subscription.create')
+    def test_a_concurrent_duplicate_waits_for_the_first_response(self, subscription_create):
+        idempotent_requests = IdempotentRequests(self.user, 'key-1')
+        cache.add(idempotent_requests.lock_key, 'first-request')
+
+        def finish_first_request(seconds):
+            with patch('stripe.Subscription.create'):
+                self.post(url=self.url, user=self.user, data=self.data)
+            cache.set(idempotent_requests.key, {
+                'fingerprint': idempotent_requests.fingerprint(self.data),
+                'status': status.HTTP_200_OK,
+                'content': b'',
+                'content_type': None,
+            })
+
+        with patch('api.services.idempotent_requests.time.sleep', side_effect=finish_first_request):
+            response = self.post(url=self.url, user=self.user, data=self.data, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response['Idempotent-Replayed']).to(equal('true'))
+        expect(subscription_create.called).to(be_false)
+        expect(Subscription.objects.filter(account=self.account).count()).to(equal(1))
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0)
+    @patch('stripe.Subscription.create')
+    def test_a_concurrent_duplicate_gets_a_conflict_if_the_first_request_does_not_finish(self, subscription_create):
+        cache.add(IdempotentRequests(self.user, 'key-1').lock_key, 'first-request')
+
+        response = self.post(url=self.url, user=self.user, data=self.data, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        expect(response.status_code).to(equal(status.HTTP_409_CONFLICT))
+        expect(subscription_create.called).to(be_false)
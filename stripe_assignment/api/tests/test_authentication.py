@@ -0,0 +1,176 @@
+import time
+from io import StringIO
+
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory
+from django.urls import reverse
+from expects import contain, equal, expect
+from mock import patch
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..admin import UserAdmin
+from ..authentication import ClaimsJWTAuthentication
+from ..models import Account, User
+from ..models.constants import SubscriptionProduct
+from ..serializers import MyTokenObtainPairSerializer
+from ..utils import metrics
+from .base import BaseAPITestCase
+
+
+class ClaimsJWTAuthenticationTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        self.url = reverse('subscriptions-status')
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(
+            username='goku',
+            password='goku1234',
+            first_name='Son',
+            last_name='Goku',
+            email='goku@dragonball.com',
+            account=self.account
+        )
+        cache.clear()
+        metrics.reset()
+        ClaimsJWTAuthentication.verified_tokens.clear()
+
+    def authorize(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {token}')
+
+    def test_the_token_contains_the_user_claims(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+
+        expect(token['id']).to(equal(f'{self.user.id}'))
+        expect(token['account_id']).to(equal(f'{self.account.id}'))
+        expect(token['is_active']).to(equal(True))
+        expect('is_staff' in token).to(equal(False))
+
+    def test_it_authenticates_from_the_claims_without_reading_the_user(self):
+        self.get(url=self.url, user=self.user)
+
+        with self.assertNumQueries(0):
+            response = self.get(url=self.url, user=self.user)
+
+        expect(response.status_code).to(equal(status.HTTP_404_NOT_FOUND))
+        expect(metrics.get('auth_user_cache.misses')).to(equal(0))
+
+    def test_it_rejects_tokens_of_inactive_users(self):
+        self.user.is_active = False
+
+        response = self.get(url=self.url, user=self.user)
+
+        expect(response.status_code).to(equal(status.HTTP_401_UNAUTHORIZED))
+
+    def test_tokens_without_the_claims_read_the_user_once(self):
+        self.authorize(RefreshToken.for_user(self.user).access_token)
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        expect(response.status_code).to(equal(status.HTTP_404_NOT_FOUND))
+        expect(metrics.get('auth_user_cache.misses')).to(equal(1))
+        expect(metrics.get('auth_user_cache.hits')).to(equal(1))
+
+    def test_tokens_without_the_claims_of_missing_users_are_rejected(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.user.delete()
+        self.authorize(token)
+
+        response = self.client.get(self.url)
+
+        expect(response.status_code).to(equal(status.HTTP_401_UNAUTHORIZED))
+
+    def test_saving_the_user_in_the_admin_invalidates_the_cached_user(self):
+        self.authorize(RefreshToken.for_user(self.user).access_token)
+        self.client.get(self.url)
+        self.user.is_active = False
+        form = type('Form', (), {'changed_data': ['is_active']})()
+
+        UserAdmin(User, site).save_model(RequestFactory().post('/'), self.user, form, True)
+        response = self.client.get(self.url)
+
+        expect(response.status_code).to(equal(status.HTTP_401_UNAUTHORIZED))
+
+    @patch('stripe.Subscription.create')
+    @patch('stripe.Customer.modify')
+    @patch('stripe.PaymentMethod.attach')
+    @patch('stripe.PaymentMethod.create')
+    @patch('stripe.Customer.create')
+    def test_the_fields_missing_in_the_claims_are_read_from_the_user(
+            self, customer_create, payment_method_create, payment_method_attach, customer_modify, subscription_create):
+        customer_create.return_value.id = 'cus_whatever'
+        payment_method_create.return_value.id = 'pm_whatever'
+        subscription_create.return_value.id = 'sub_whatever'
+
+        response = self.post(url=reverse('subscriptions-subscribe'), user=self.user, data={
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767
+        })
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(customer_create.call_args[1]['name']).to(equal('Son Goku'))
+        expect(customer_create.call_args[1]['email']).to(equal('goku@dragonball.com'))
+
+    def test_repeated_tokens_are_verified_once(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        self.authorize(token)
+        self.client.get(self.url)
+
+        with patch('rest_framework_simplejwt.tokens.AccessToken.__init__') as verify:
+            response = self.client.get(self.url)
+
+        expect(response.status_code).to(equal(status.HTTP_404_NOT_FOUND))
+        expect(verify.called).to(equal(False))
+        expect(metrics.get('jwt_token_cache.misses')).to(equal(1))
+        expect(metrics.get('jwt_token_cache.hits')).to(equal(1))
+
+    def test_expired_tokens_are_verified_again(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        self.authorize(token)
+        self.client.get(self.url)
+
+        with patch('api.authentication.time.time', return_value=time.time() + token.lifetime.total_seconds() + 1):
+            self.client.get(self.url)
+
+        expect(metrics.get('jwt_token_cache.expirations')).to(equal(1))
+        expect(metrics.get('jwt_token_cache.misses')).to(equal(2))
+
+    def test_the_staff_flag_is_read_from_the_user_not_from_the_token(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.authorize(MyTokenObtainPairSerializer.get_token(self.user).access_token)
+        expect(self.client.get(reverse('metrics')).status_code).to(equal(status.HTTP_200_OK))
+        self.user.is_staff = False
+        form = type('Form', (), {'changed_data': ['is_staff']})()
+
+        UserAdmin(User, site).save_model(RequestFactory().post('/'), self.user, form, True)
+        response = self.client.get(reverse('metrics'))
+
+        expect(response.status_code).to(equal(status.HTTP_403_FORBIDDEN))
+
+    def test_the_metrics_include_the_token_cache(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.authorize(MyTokenObtainPairSerializer.get_token(self.user).access_token)
+
+        self.client.get(reverse('metrics'))
+        response = self.client.get(reverse('metrics'))
+
+        expect(response.json()['jwt_token_cache']['hits']).to(equal(1))
+        expect(response.json()['jwt_token_cache']['size']).to(equal(1))
+
+    def test_the_benchmark_compares_the_authentication_with_and_without_the_cache(self):
+        output = StringIO()
+
+        call_command('benchmark_token_verification', requests=20, clients=4, cache_size=2, stdout=output)
+
+        expect(output.getvalue()).to(contain('without cache: 20 requests'))
+        expect(output.getvalue()).to(contain('with cache: 20 requests'))
+        expect(output.getvalue()).to(contain('evictions=18'))
@@ -0,0 +1,23 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from expects import contain, equal, expect
+
+from ..models import Account
+
+
+class BenchmarkDeploymentsTestCase(TransactionTestCase):
+
+    def test_it_subscribes_through_both_deployments_and_cleans_up(self):
+        output = StringIO()
+
+        # One request at a time, the in-memory SQLite test database does not take concurrent writes
+        call_command('benchmark_deployments', requests=4, concurrency=1, stripe_latency=0.01, stdout=output)
+
+        expect(output.getvalue()).to(contain('Both deployments serve at most 1 requests at a time'))
+        expect(output.getvalue()).to(contain('WSGI: concurrency=1 '))
+        expect(output.getvalue()).to(contain('ASGI: concurrency=1 '))
+        expect(output.getvalue()).to(contain('stripe_calls_in_flight=1 '))
+        expect(output.getvalue().count('errors=0')).to(equal(2))
+        expect(Account.objects.count()).to(equal(0))
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase
+from expects import contain, equal, expect, raise_error
+from mock import patch
+from rest_framework.exceptions import AuthenticationFailed
+
+from ..models import Account
+
+
+class BenchmarkEndpointsTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.results = os.path.join(self.directory.name, 'results.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def benchmark(self, **options):
+        output = StringIO()
+        call_command(
+            'benchmark_endpoints', accounts=3, concurrency=1, status_rounds=2, stripe_latency=0.001,
+            stdout=output, **options)
+        return output.getvalue()
+
+    def test_it_writes_the_results_of_every_endpoint_and_cleans_up(self):
+        self.benchmark(output=self.results)
+
+        with open(self.results) as results_file:
+            results = json.load(results_file)
+        expect(sorted(results['endpoints'])).to(equal(['status', 'subscribe', 'token']))
+        expect(results['endpoints']['token']['requests']).to(equal(3))
+        expect(results['endpoints']['status']['requests']).to(equal(6))
+        for endpoint in results['endpoints'].values():
+            expect(endpoint['errors']).to(equal(0))
+            expect(sorted(endpoint)).to(contain('p99_ms', 'queries_per_request', 'throughput'))
+        expect(Account.objects.count()).to(equal(0))
+
+    def test_it_fails_when_a_metric_regressed_against_the_baseline(self):
+        self.benchmark(output=self.results)
+        with open(self.results) as results_file:
+            baseline = json.load(results_file)
+        baseline['endpoints']['subscribe']['queries_per_request'] = 0.01
+        baseline_path = os.path.join(self.directory.name, 'baseline.json')
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump(baseline, baseline_file)
+
+        expect(lambda: self.benchmark(baseline=baseline_path, threshold=50)).to(raise_error(CommandError))
+
+    def test_it_fails_when_an_endpoint_has_more_errors_than_the_baseline(self):
+        self.benchmark(output=self.results)
+        output = StringIO()
+
+        # Every authenticated request is rejected quickly, only the error count shows it
+        with patch('api.authentication.ClaimsJWTAuthentication.authenticate', side_effect=AuthenticationFailed()):
+            expect(lambda: call_command(
+                'benchmark_endpoints', accounts=3, concurrency=1, status_rounds=2, stripe_latency=0.001,
+                baseline=self.results, threshold=1000, stdout=output)).to(raise_error(CommandError))
+
+        expect(output.getvalue()).to(contain('REGRESSION subscribe errors 0 -> 3'))
+        expect(output.getvalue()).to(contain('REGRESSION status errors 0 -> 6'))
@@ -0,0 +1,72 @@
+import os
+import tempfile
+from io import StringIO
+
+import stripe
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase
+from expects import be_above, contain, equal, expect
+
+from ..management.commands.benchmark_webhooks import \
+    Command as BenchmarkWebhooksCommand
+from ..models import Account, Subscription, WebhookEvent
+from ..utils import WebhookCorpus
+
+
+class WebhookCorpusTestCase(SimpleTestCase):
+
+    def test_it_generates_duplicated_and_reordered_subscription_events(self):
+        events = WebhookCorpus(events=500, accounts=20, duplicate_ratio=0.1, out_of_order_ratio=0.2, seed=1).generate()
+
+        ids = [event['id'] for event in events]
+        expect(len(set(ids))).to(equal(500))
+        expect(len(ids) - len(set(ids))).to(be_above(20))
+        created = [event['created'] for event in events]
+        expect(created).not_to(equal(sorted(created)))
+        expect({event['data']['object']['customer'] for event in events}).to(
+            equal(set(WebhookCorpus(events=0, accounts=20).customers())))
+        expect({event['type'] for event in events}).to(contain(
+            'customer.subscription.created', 'customer.subscription.updated'))
+
+    def test_the_same_seed_generates_the_same_corpus(self):
+        expect(WebhookCorpus(events=50, accounts=5, duplicate_ratio=0.2, seed=7).generate()).to(
+            equal(WebhookCorpus(events=50, accounts=5, duplicate_ratio=0.2, seed=7).generate()))
+
+    def test_the_signatures_are_the_stripe_ones(self):
+        payload = '{"id": "evt_1", "object": "event"}'
+
+        event = stripe.Webhook.construct_event(payload, WebhookCorpus.sign(payload, 'whsec_test'), 'whsec_test')
+
+        expect(event.id).to(equal('evt_1'))
+
+
+class BenchmarkWebhooksTestCase(TransactionTestCase):
+
+    def test_it_replays_a_corpus_in_process_and_over_http_and_cleans_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = os.path.join(directory, 'corpus.jsonl')
+            call_command(
+                'generate_webhook_corpus', corpus, events=40, accounts=5, duplicate_ratio=0.2, seed=3,
+                stdout=StringIO())
+            output = StringIO()
+
+            call_command('benchmark_webhooks', corpus=corpus, concurrency=1, stdout=output)
+
+        expect(output.getvalue()).to(contain('accounts=5'))
+        for mode in ('signature', 'in-process', 'http'):
+            expect(output.getvalue()).to(contain(f'{mode}: throughput='))
+        expect(output.getvalue()).to(contain('queries_per_event='))
+        expect(output.getvalue().count('errors=0')).to(equal(3))
+        expect(output.getvalue().count('recorded=40')).to(equal(2))
+        expect(Account.objects.count()).to(equal(0))
+        expect(WebhookEvent.objects.count()).to(equal(0))
+
+    def test_every_mode_starts_from_subscriptions_without_applied_events(self):
+        command = BenchmarkWebhooksCommand()
+        accounts = command.seed({'cus_1', 'cus_2'})
+        Subscription.objects.update(payment_gateway_status='active', last_event_created=1633318999)
+
+        command.reset(accounts, [])
+
+        expect(list(Subscription.objects.values_list('payment_gateway_status', 'last_event_created'))).to(
+            equal([('', 0), ('', 0)]))
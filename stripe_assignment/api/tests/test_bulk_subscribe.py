@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from expects import contain, equal, expect
+from mock import patch
+
+from ..exceptions import PaymentsGatewayUnavailableError
+from ..models import Account, Subscription, User
+from ..services import StripeCircuitBreaker, StripeRateLimiter
+from .fake_stripe import FakeStripe
+
+
+class RateLimitedStripe(FakeStripe):
+
+    def __init__(self, rate_limited_requests):
+        super().__init__()
+        self.rate_limited_requests = rate_limited_requests
+
+    def request(self, method, url, headers, post_data=None):
+        if self.rate_limited_requests > 0:
+            self.rate_limited_requests -= 1
+            body = {'error': {'type': 'invalid_request_error', 'message': 'Too many requests'}}
+            return json.dumps(body), 429, {}
+        return super().request(method, url, headers, post_data)
+
+
+# The fake Stripe is not rate limited, and the command retries the rate limited subscriptions without
+# waiting inside the gateway
+@override_settings(STRIPE_RATE_LIMIT=0, STRIPE_RETRY_BUDGET=0)
+class BulkSubscribeTestCase(TransactionTestCase):
+
+    def setUp(self):
+        StripeRateLimiter.reset()
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, 'accounts.csv')
+        self.checkpoint = f'{self.file}.checkpoint'
+        self.accounts = []
+        for i in range(4):
+            account = Account.objects.create(name=f'Partner account {i}')
+            User.objects.create_user(username=f'user{i}', password='goku1234', account=account)
+            self.accounts.append(account)
+        with open(self.file, mode='w') as accounts_file:
+            accounts_file.write('account_id,card_token,subscription_product\n')
+            for account in self.accounts:
+                accounts_file.write(f'{account.id},tok_visa,\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def bulk_subscribe(self, **options):
+        output = StringIO()
+        # A single worker, the in-memory SQLite test database does not take concurrent writes
+        call_command('bulk_subscribe', self.file, workers=1, rate=0, backoff=0, stdout=output, **options)
+        return output.getvalue()
+
+    def checkpointed(self):
+        with open(self.checkpoint) as checkpoint:
+            return [json.loads(line) for line in checkpoint]
+
+    def test_it_subscribes_every_account_with_its_card_token(self):
+        with FakeStripe() as fake_stripe:
+            output = self.bulk_subscribe()
+
+        expect(Subscription.objects.count()).to(equal(4))
+        expect(output).to(contain('done: processed=4 subscribed=4 already_subscribed=0 failed=0'))
+        payment_method_requests = [params for _, path, params in fake_stripe.requests if path == '/v1/payment_methods']
+        expect({params['card[token]'] for params in payment_method_requests}).to(equal({'tok_visa'}))
+        expect(sorted(entry['account_id'] for entry in self.checkpointed())).to(
+            equal(sorted(f'{account.id}' for account in self.accounts)))
+
+    def test_it_resumes_from_the_checkpoint(self):
+        with open(self.checkpoint, mode='w') as checkpoint:
+            checkpoint.write(json.dumps({'account_id': f'{self.accounts[0].id}', 'status': 'subscribed', 'error': None}) + '\n')
+            # Incomplete line written by a crashed run
+            checkpoint.write('{"account_id": "')
+
+        with FakeStripe():
+            output = self.bulk_subscribe()
+
+        expect(output).to(contain('1 accounts already processed, 3 to subscribe'))
+        expect(Subscription.objects.filter(account=self.accounts[0]).exists()).to(equal(False))
+        expect(Subscription.objects.count()).to(equal(3))
+
+    def test_it_retries_the_rate_limited_subscriptions(self):
+        with RateLimitedStripe(rate_limited_requests=2):
+            output = self.bulk_subscribe()
+
+        expect(Subscription.objects.count()).to(equal(4))
+        expect(output).to(contain('subscribed=4'))
+
+    def test_it_waits_for_the_open_circuit_instead_of_failing_the_accounts(self):
+        unavailable = PaymentsGatewayUnavailableError(message='The payments gateway is unavailable', retry_after=7)
+
+        with FakeStripe(), \
+                patch.object(StripeCircuitBreaker, 'allow', side_effect=[unavailable, unavailable, False, False, False, False]), \
+                patch('api.management.commands.bulk_subscribe.time.sleep') as sleep:
+            output = self.bulk_subscribe()
+
+        expect(Subscription.objects.count()).to(equal(4))
+        expect(output).to(contain('subscribed=4 already_subscribed=0 failed=0'))
+        expect([call.args[0] for call in sleep.call_args_list if call.args[0]]).to(equal([7, 7]))
+
+    def test_it_reports_the_errors_by_type(self):
+        User.objects.filter(account=self.accounts[0]).delete()
+        Subscription.objects.create(account=self.accounts[1])
+
+        with RateLimitedStripe(rate_limited_requests=1000):
+            output = self.bulk_subscribe(max_attempts=2)
+
+        expect(output).to(contain('already_subscribed=1 failed=3'))
+        expect(output).to(contain('errors: RateLimitError=2 NoUser=1'))
+        expect([entry['status'] for entry in self.checkpointed()].count('failed')).to(equal(3))
+
+    def test_it_retries_the_failed_accounts_when_asked(self):
+        with RateLimitedStripe(rate_limited_requests=1000):
+            self.bulk_subscribe(max_attempts=1)
+
+        with FakeStripe():
+            output = self.bulk_subscribe(retry_failed=True)
+
+        expect(output).to(contain('0 accounts already processed, 4 to subscribe'))
+        expect(Subscription.objects.count()).to(equal(4))
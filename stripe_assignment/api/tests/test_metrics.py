@@ -0,0 +1,44 @@
+from django.urls import reverse
+from expects import equal, expect
+from rest_framework import status
+
+from ..models import Account, User
+from ..utils import metrics
+from .base import BaseAPITestCase
+
+
+class MetricsTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        self.url = reverse('metrics')
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(
+            username='goku',
+            password='goku1234',
+            account=self.account
+        )
+        self.staff_user = User.objects.create_user(
+            username='vegeta',
+            password='vegeta1234',
+            is_staff=True,
+            account=self.account
+        )
+        metrics.reset()
+
+    def test_it_returns_forbidden_for_non_staff_users(self):
+        response = self.get(url=self.url, user=self.user)
+
+        expect(response.status_code).to(equal(status.HTTP_403_FORBIDDEN))
+
+    def test_it_returns_the_process_counters(self):
+        metrics.increment('subscription_status_cache.hits', 3)
+
+        response = self.get(url=self.url, user=self.staff_user)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        # The request own token is verified and cached as well, and the staff flag read from the user
+        expect(response.json()['counters']).to(equal({
+            'subscription_status_cache.hits': 3,
+            'jwt_token_cache.misses': 1,
+            'auth_user_cache.misses': 1,
+        }))
@@ -0,0 +1,94 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import override_settings
+from django.urls import reverse
+from expects import contain, equal, expect
+from mock import patch
+
+from ..models import (Account, Customer, GatewayOperation, PaymentMethod,
+                      Subscription, User)
+from ..models.constants import SubscriptionProduct, SubscriptionStatus
+from ..utils import QueryBudgets, query_metrics
+from .base import BaseAPITestCase, TestTransactionSavepoints
+
+
+class QueryBudgetsTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        cache.clear()
+        query_metrics.reset()
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(
+            username='goku', password='goku1234', is_staff=True, is_superuser=True, account=self.account)
+        Subscription.objects.create(
+            status=SubscriptionStatus.PENDING,
+            price_reference=SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME),
+            account=self.account)
+
+    def test_the_admin_lists_stay_within_their_budget_whatever_the_rows(self):
+        for index in range(20):
+            account = Account.objects.create(name=f'Account {index}')
+            User.objects.create_user(username=f'user{index}', password='user1234', account=account)
+            Customer.objects.create(id_reference=f'cus_{index}', account=account)
+            PaymentMethod.objects.create(id_reference=f'pm_{index}', account=account)
+            Subscription.objects.create(account=account)
+            GatewayOperation.objects.create(idempotency_key=f'key_{index}', operation='customer.create', account=account)
+        self.client.force_login(self.user)
+
+        for model in ('account', 'user', 'customer', 'paymentmethod', 'subscription', 'gatewayoperation'):
+            response = self.get(url=reverse(f'admin:api_{model}_changelist'))
+
+            expect(response.status_code).to(equal(200))
+            expect(response.db_view_name).to(equal(f'admin:api_{model}_changelist'))
+
+    def test_the_counters_of_every_view_are_in_the_metrics(self):
+        self.get(url=reverse('subscriptions-status'), user=self.user)
+        self.get(url=reverse('subscriptions-status'), user=self.user)
+
+        response = self.get(url=reverse('metrics'), user=self.user)
+
+        status_stats = response.json()['db_budgets']['views']['subscriptions-status']
+        expect(status_stats['requests']).to(equal(2))
+        expect(status_stats['queries_per_request']).to(equal(0.5))
+        expect(status_stats['over_budget']).to(equal(0))
+        expect(status_stats['budget']).to(equal(QueryBudgets().get('subscriptions-status')))
+
+    def test_the_views_that_make_queries_have_a_time_budget(self):
+        without_time = [
+            name for name, budget in QueryBudgets().load().items() if budget['queries'] and not budget['time_ms']]
+
+        expect(without_time).to(equal([]))
+
+    def test_only_the_savepoints_added_by_the_test_transaction_are_left_out_of_the_budgets(self):
+        savepoints = TestTransactionSavepoints()
+
+        with connection.execute_wrapper(savepoints):
+            with transaction.atomic():
+                with transaction.atomic():
+                    Account.objects.exists()
+
+        # The outer block would be the transaction in production, the inner one is a savepoint anyway
+        expect(savepoints.count).to(equal(2))
+
+    @patch.object(QueryBudgets, 'budgets', {'subscriptions-status': {'queries': 0}})
+    def test_the_requests_over_their_budget_are_counted(self):
+        response = self.client.get(reverse('subscriptions-status'), HTTP_AUTHORIZATION=self.authorization())
+
+        expect(response.status_code).to(equal(200))
+        expect(query_metrics.get('db.subscriptions-status.over_budget')).to(equal(1))
+        expect(QueryBudgets().exceeded('subscriptions-status', response.db_queries)).to(
+            equal(['1 queries, the budget is 0']))
+
+    @override_settings(DB_SLOW_QUERY_SECONDS=0.000001)
+    def test_the_slow_queries_are_logged_with_their_call_site(self):
+        with self.assertLogs('api.utils.queries', 'WARNING') as logs:
+            User.objects.filter(username='goku').exists()
+
+        expect(logs.output[0]).to(contain('api/tests/test_query_budgets.py'))
+        expect(logs.output[0]).to(contain('in test_the_slow_queries_are_logged_with_their_call_site'))
+        expect(logs.output[0]).to(contain('SELECT'))
+        expect(query_metrics.get('db.slow_queries')).to(equal(1))
+
+    def authorization(self):
+        self._authenticate_user(self.user)
+        return self.client._credentials['HTTP_AUTHORIZATION']
@@ -0,0 +1,38 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from expects import contain, equal, expect
+
+from ..models import Account, Customer, PaymentMethod, Subscription
+
+
+class QueryPlansTestCase(TestCase):
+
+    def test_it_creates_the_lookup_indexes(self):
+        with connection.cursor() as cursor:
+            customer_constraints = connection.introspection.get_constraints(cursor, Customer._meta.db_table)
+            payment_method_constraints = connection.introspection.get_constraints(cursor, PaymentMethod._meta.db_table)
+            subscription_constraints = connection.introspection.get_constraints(cursor, Subscription._meta.db_table)
+
+        expect(customer_constraints['customer_active_account_idx']['columns']).to(
+            equal(['account_id', 'created_at']))
+        unique_columns = [
+            constraint['columns'] for constraint in customer_constraints.values() if constraint['unique']]
+        expect(unique_columns).to(contain(['id_reference']))
+        expect(payment_method_constraints['payment_method_active_acc_idx']['columns']).to(
+            equal(['account_id', 'created_at']))
+        expect(subscription_constraints['subscription_account_idx']['columns']).to(
+            equal(['account_id', 'created_at']))
+        expect(subscription_constraints['subscription_reference_idx']['columns']).to(equal(['id_reference']))
+
+    @skipUnless(connection.vendor == 'sqlite', 'Small tables are sequentially scanned by Postgres')
+    def test_every_lookup_uses_an_index_scan(self):
+        output = StringIO()
+
+        call_command('benchmark_query_plans', rows=200, repeat=1, stdout=output)
+
+        expect(output.getvalue()).not_to(contain('NO INDEX SCAN'))
+        expect(Account.objects.count()).to(equal(0))
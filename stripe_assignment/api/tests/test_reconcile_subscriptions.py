@@ -0,0 +1,140 @@
+import time
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from expects import contain, equal, expect
+
+from ..models import (Account, Customer, ReconciliationCursor, Subscription,
+                      User)
+from ..models.constants import SubscriptionProduct, SubscriptionStatus
+from ..services import SubscriptionReconciler
+from .base import BaseAPITestCase
+from .fake_stripe import FakeStripe
+
+
+class ReconcileSubscriptionsTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.fake_stripe = FakeStripe()
+        self.subscriptions = []
+        for index in range(5):
+            account = Account.objects.create(name=f'Account {index}')
+            User.objects.create_user(username=f'user{index}', password='user1234', account=account)
+            Customer.objects.create(is_active=True, id_reference=f'cus_{index}', account=account)
+            self.subscriptions.append(Subscription.objects.create(
+                status=SubscriptionStatus.PENDING,
+                price_reference=SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME),
+                account=account))
+            self.fake_stripe.subscriptions[f'sub_{index}'] = self.stripe_subscription(index, 'active')
+
+    def stripe_subscription(self, index, status):
+        return {
+            'id': f'sub_{index}',
+            'object': 'subscription',
+            'customer': f'cus_{index}',
+            'status': status,
+            'created': 1633318983,
+            'current_period_start': 1633318983,
+            'current_period_end': 1635997383,
+        }
+
+    def reconcile(self, **options):
+        output = StringIO()
+        with self.fake_stripe:
+            call_command('reconcile_subscriptions', stdout=output, **options)
+        return output.getvalue()
+
+    def test_a_full_run_fixes_the_subscriptions_whose_webhooks_were_lost(self):
+        output = self.reconcile(chunk_size=2, page_size=2)
+
+        for index, subscription in enumerate(self.subscriptions):
+            subscription.refresh_from_db()
+            expect(subscription.status).to(equal(SubscriptionStatus.SUCCESSFUL))
+            expect(subscription.id_reference).to(equal(f'sub_{index}'))
+        expect(output).to(contain('Full run: fetched=5 matched=5 updated=5 unmatched=0'))
+        expect(output).to(contain('rows/s'))
+        # Three pages of two subscriptions
+        expect(len([request for request in self.fake_stripe.requests if request[0] == 'get'])).to(equal(3))
+
+    def test_it_writes_each_chunk_with_a_bulk_update_and_skips_unchanged_rows(self):
+        self.reconcile(full=True)
+        self.fake_stripe.subscriptions['sub_3'] = self.stripe_subscription(3, 'past_due')
+
+        with CaptureQueriesContext(connection) as queries:
+            output = self.reconcile(full=True, chunk_size=10)
+
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "api_subscription"')]
+        expect(len(updates)).to(equal(1))
+        expect(output).to(contain('matched=5 updated=1'))
+        self.subscriptions[3].refresh_from_db()
+        expect(self.subscriptions[3].status).to(equal(SubscriptionStatus.FAILED))
+        expect(self.subscriptions[3].payment_gateway_status).to(equal('past_due'))
+
+    def test_the_rows_found_by_customer_are_read_with_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            output = self.reconcile(chunk_size=10)
+
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT "api_subscription"')]
+        # One by reference and one by customer account
+        expect(len(selects)).to(equal(2))
+        expect(output).to(contain('matched=5 updated=5'))
+
+    def test_the_next_runs_only_fetch_the_events_since_the_cursor(self):
+        self.reconcile()
+        cursor = ReconciliationCursor.objects.get(name=SubscriptionReconciler.CURSOR).high_water_mark
+        self.fake_stripe.add_event('customer.subscription.updated', self.stripe_subscription(1, 'past_due'), cursor - 10)
+        self.fake_stripe.add_event('customer.subscription.updated', self.stripe_subscription(2, 'past_due'), cursor + 5)
+        self.fake_stripe.add_event('customer.subscription.deleted', self.stripe_subscription(2, 'canceled'), cursor + 10)
+
+        output = self.reconcile()
+
+        expect(output).to(contain('Incremental run: fetched=1 matched=1 updated=1'))
+        statuses = dict(Subscription.objects.values_list('id_reference', 'payment_gateway_status'))
+        expect(statuses['sub_1']).to(equal('active'))
+        expect(statuses['sub_2']).to(equal('canceled'))
+        expect(ReconciliationCursor.objects.get(name=SubscriptionReconciler.CURSOR).high_water_mark).to(
+            equal(cursor + 10))
+
+    def test_an_older_event_in_a_later_chunk_does_not_overwrite_the_newest_state(self):
+        self.reconcile()
+        cursor = ReconciliationCursor.objects.get(name=SubscriptionReconciler.CURSOR).high_water_mark
+        self.fake_stripe.add_event('customer.subscription.updated', self.stripe_subscription(2, 'past_due'), cursor + 5)
+        self.fake_stripe.add_event('customer.subscription.updated', self.stripe_subscription(3, 'past_due'), cursor + 7)
+        self.fake_stripe.add_event('customer.subscription.deleted', self.stripe_subscription(2, 'canceled'), cursor + 10)
+
+        output = self.reconcile(chunk_size=2, page_size=2)
+
+        expect(output).to(contain('Incremental run: fetched=3 matched=3 updated=2'))
+        subscription = Subscription.objects.get(id_reference='sub_2')
+        expect(subscription.payment_gateway_status).to(equal('canceled'))
+        expect(subscription.last_event_created).to(equal(cursor + 10))
+
+    def test_a_webhook_applied_during_the_run_is_not_overwritten(self):
+        subscription = self.subscriptions[1]
+        subscription.payment_gateway_status = 'canceled'
+        subscription.last_event_created = int(time.time()) + 60
+        subscription.save()
+
+        self.reconcile()
+
+        subscription.refresh_from_db()
+        expect(subscription.payment_gateway_status).to(equal('canceled'))
+
+    def test_a_dry_run_does_not_write_anything(self):
+        output = self.reconcile(dry_run=True)
+
+        expect(output).to(contain('updated=5'))
+        expect(Subscription.objects.filter(status=SubscriptionStatus.PENDING).count()).to(equal(5))
+        expect(ReconciliationCursor.objects.get(name=SubscriptionReconciler.CURSOR).high_water_mark).to(equal(0))
+
+    def test_unknown_customers_are_reported_as_unmatched(self):
+        self.fake_stripe.subscriptions['sub_other'] = dict(
+            self.stripe_subscription(0, 'active'), id='sub_other', customer='cus_other')
+
+        output = self.reconcile()
+
+        expect(output).to(contain('matched=5 updated=5 unmatched=1'))
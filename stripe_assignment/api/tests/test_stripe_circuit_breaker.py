@@ -0,0 +1,137 @@
+from django.test import override_settings
+from django.urls import reverse
+from expects import equal, expect, have_key, raise_error
+from mock import MagicMock, patch
+from rest_framework import status
+from stripe.error import APIConnectionError, CardError
+
+from ..exceptions import PaymentsGatewayUnavailableError
+from ..models import Account, Customer, PaymentMethod, Subscription, User
+from ..models.constants import PaymentMethodType, SubscriptionProduct
+from ..services import StripeCircuitBreaker
+from ..utils import metrics
+from .base import BaseAPITestCase
+
+
+@override_settings(
+    STRIPE_BREAKER_ENABLED=True, STRIPE_BREAKER_FAILURE_RATE=0.5, STRIPE_BREAKER_SLOW_CALL_SECONDS=1,
+    STRIPE_BREAKER_MIN_CALLS=4, STRIPE_BREAKER_WINDOW_SECONDS=30, STRIPE_BREAKER_OPEN_SECONDS=30,
+    STRIPE_RETRY_BUDGET=0)
+class StripeCircuitBreakerTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        StripeCircuitBreaker.reset()
+        metrics.reset()
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(username='goku', password='goku1234', account=self.account)
+        Customer.objects.create(is_active=True, id_reference='cus_whatever', account=self.account)
+        PaymentMethod.objects.create(
+            is_active=True, id_reference='pm_whatever', type=PaymentMethodType.CARD, account=self.account)
+        self.data = {
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767,
+        }
+
+    def tearDown(self):
+        StripeCircuitBreaker.reset()
+
+    def record_failures(self, times):
+        breaker = StripeCircuitBreaker()
+        for _ in range(times):
+            breaker.record(0.1, APIConnectionError('Connection refused'))
+
+    def test_it_opens_once_the_failure_rate_is_reached(self):
+        breaker = StripeCircuitBreaker()
+        breaker.record(0.1)
+        breaker.record(0.1)
+        self.record_failures(1)
+        expect(breaker.stats()['state']).to(equal(StripeCircuitBreaker.CLOSED))
+
+        self.record_failures(1)
+
+        expect(breaker.stats()['state']).to(equal(StripeCircuitBreaker.OPEN))
+        expect(lambda: breaker.allow()).to(raise_error(PaymentsGatewayUnavailableError))
+        expect(metrics.get('stripe_breaker.opened')).to(equal(1))
+
+    def test_slow_calls_count_as_failures_and_card_errors_do_not(self):
+        breaker = StripeCircuitBreaker()
+        for _ in range(2):
+            breaker.record(0.1, CardError('Declined', param='card', code='card_declined'))
+        expect(breaker.stats()['state']).to(equal(StripeCircuitBreaker.CLOSED))
+
+        breaker.record(1.5)
+        breaker.record(2)
+
+        expect(breaker.stats()['state']).to(equal(StripeCircuitBreaker.OPEN))
+
+    @patch('api.services.stripe_circuit_breaker.time.monotonic')
+    def test_a_single_probe_closes_it_after_the_open_period(self, monotonic):
+        monotonic.return_value = 1000
+        self.record_failures(4)
+        breaker = StripeCircuitBreaker()
+        expect(breaker.retry_after()).to(equal(30))
+
+        monotonic.return_value = 1031
+        expect(breaker.allow()).to(equal(True))
+        # Only one request probes Stripe at a time
+        expect(lambda: breaker.allow()).to(raise_error(PaymentsGatewayUnavailableError))
+
+        breaker.record(0.1)
+        breaker.release(True)
+
+        expect(breaker.stats()['state']).to(equal(StripeCircuitBreaker.CLOSED))
+        expect(breaker.allow()).to(equal(False))
+
+    @patch('api.services.stripe_circuit_breaker.time.monotonic')
+    def test_a_failed_probe_opens_it_again(self, monotonic):
+        monotonic.return_value = 1000
+        self.record_failures(4)
+        monotonic.return_value = 1031
+        breaker = StripeCircuitBreaker()
+        breaker.allow()
+
+        self.record_failures(1)
+
+        expect(breaker.stats()['state']).to(equal(StripeCircuitBreaker.OPEN))
+        expect(breaker.retry_after()).to(equal(30))
+
+    @patch('stripe.Subscription.create')
+    def test_the_subscriptions_fail_fast_with_a_503_while_it_is_open(self, subscription_create):
+        subscription_create.side_effect = APIConnectionError('Connection refused')
+        for _ in range(4):
+            response = self.post(url=reverse('subscriptions-subscribe'), user=self.user, data=self.data)
+            expect(response.status_code).to(equal(status.HTTP_400_BAD_REQUEST))
+
+        response = self.post(url=reverse('subscriptions-subscribe'), user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_503_SERVICE_UNAVAILABLE))
+        expect(response['Retry-After']).to(equal('30'))
+        expect(subscription_create.call_count).to(equal(4))
+        expect(Subscription.objects.filter(account=self.account).exists()).to(equal(False))
+
+    @patch('stripe.Subscription.create', return_value=MagicMock(id='sub_whatever'))
+    def test_it_does_not_apply_when_disabled(self, subscription_create):
+        self.record_failures(4)
+
+        with override_settings(STRIPE_BREAKER_ENABLED=False):
+            response = self.post(url=reverse('subscriptions-subscribe'), user=self.user, data=self.data)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+
+    def test_the_health_endpoint_reports_the_state_without_failing_the_check(self):
+        response = self.get(url=reverse('health'))
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.json()['status']).to(equal('ok'))
+        expect(response.json()['stripe_circuit']['state']).to(equal(StripeCircuitBreaker.CLOSED))
+
+        self.record_failures(4)
+        response = self.get(url=reverse('health'))
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(response.json()['status']).to(equal('degraded'))
+        expect(response.json()['stripe_circuit']['retry_after']).to(equal(30))
+        expect(response.json()['stripe_circuit']).to(have_key('opened', 1))
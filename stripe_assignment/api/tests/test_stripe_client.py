@@ -0,0 +1,74 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import stripe
+from django.test import SimpleTestCase
+from expects import be_a, equal, expect
+
+from ..services import StripeClient
+from ..utils import metrics
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({'id': 'cus_whatever', 'object': 'customer'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StripeClientTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_base = stripe.api_base
+        self.http_client = stripe.default_http_client
+        stripe.api_base = f'http://127.0.0.1:{self.server.server_port}'
+        stripe.default_http_client = StripeClient(pool_size=2, connect_timeout=1, read_timeout=1)
+        metrics.reset()
+
+    def tearDown(self):
+        stripe.api_base = self.api_base
+        stripe.default_http_client = self.http_client
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_the_client_is_configured_when_the_app_is_loaded(self):
+        expect(self.http_client).to(be_a(StripeClient))
+        expect(self.http_client._timeout).to(equal((5, 30)))
+
+    def test_consecutive_calls_reuse_the_same_connection(self):
+        for _ in range(5):
+            stripe.Customer.create(api_key='sk_test', name='Son Goku')
+
+        expect(StripeClient.stats()).to(equal({
+            'requests': 5,
+            'connections': 1,
+            'reused_connections': 4,
+            'reuse_rate': 0.8,
+        }))
+
+    def test_threads_share_the_connection_pool(self):
+        def create_customers():
+            for _ in range(5):
+                stripe.Customer.create(api_key='sk_test', name='Son Goku')
+
+        threads = [threading.Thread(target=create_customers) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expect(metrics.get('stripe_http.requests')).to(equal(10))
+        expect(metrics.get('stripe_http.connections') <= 2).to(equal(True))
@@ -0,0 +1,106 @@
+import time
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from expects import be_above, be_below, equal, expect, raise_error
+from mock import MagicMock, patch
+from rest_framework import status
+from stripe.error import RateLimitError
+
+from ..models import Account, Customer, PaymentMethod, Subscription, User
+from ..models.constants import PaymentMethodType, SubscriptionProduct
+from ..services import StripeRateLimiter
+from ..services.stripe_rate_limiter import SharedWindow, TokenBucket
+from ..utils import metrics
+from .base import BaseAPITestCase
+
+
+@override_settings(
+    STRIPE_RATE_LIMIT=20, STRIPE_RATE_LIMIT_BURST=2, STRIPE_RATE_LIMIT_MIN=1, STRIPE_RATE_LIMIT_RECOVERY=1,
+    STRIPE_RETRY_BASE_DELAY=0.01, STRIPE_RETRY_MAX_DELAY=0.02)
+class StripeRateLimiterTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        StripeRateLimiter.reset()
+        metrics.reset()
+        cache.clear()
+
+    def rate_limited(self, times, result='ok'):
+        return MagicMock(side_effect=[RateLimitError('Too many requests')] * times + [result])
+
+    def test_the_bucket_allows_a_burst_and_then_spaces_the_calls(self):
+        bucket = TokenBucket(rate=20, burst=2)
+        started_at = time.monotonic()
+
+        for _ in range(4):
+            expect(bucket.acquire(deadline=time.monotonic() + 1)).to(equal(True))
+
+        # Two calls of the burst, and two more at 20 per second
+        expect(time.monotonic() - started_at).to(be_above(0.09))
+
+    def test_the_bucket_does_not_wait_beyond_the_deadline(self):
+        bucket = TokenBucket(rate=1, burst=1)
+        bucket.acquire(deadline=time.monotonic())
+
+        expect(bucket.acquire(deadline=time.monotonic() + 0.1)).to(equal(False))
+
+    @patch('api.services.stripe_rate_limiter.time.time', return_value=1000.5)
+    def test_the_shared_window_counts_the_calls_of_every_worker_in_the_cache(self, now):
+        first_worker, second_worker = SharedWindow(cache), SharedWindow(cache)
+        first_worker.rate = 2
+        deadline = time.monotonic() + 0.1
+
+        expect(first_worker.acquire(deadline)).to(equal(True))
+        expect(second_worker.acquire(deadline)).to(equal(True))
+        # The next window starts in half a second, after the deadline
+        expect(second_worker.acquire(deadline)).to(equal(False))
+        expect(cache.get('stripe_rate_limit:1000')).to(equal(3))
+
+    def test_rate_limited_calls_are_retried(self):
+        function = self.rate_limited(2)
+
+        result = StripeRateLimiter().call(function, deadline=time.monotonic() + 1)
+
+        expect(result).to(equal('ok'))
+        expect(function.call_count).to(equal(3))
+        expect(metrics.get('stripe_rate_limit.retries')).to(equal(2))
+
+    def test_the_rate_halves_on_every_429_and_recovers_with_the_successes(self):
+        limiter = StripeRateLimiter()
+
+        limiter.call(self.rate_limited(2), deadline=time.monotonic() + 1)
+
+        # 20 / 2 / 2 and one successful call
+        expect(limiter.limiter.rate).to(equal(6))
+        expect(metrics.get_gauge('stripe_rate_limit.rate')).to(equal(6))
+
+    def test_the_retries_stop_at_the_deadline(self):
+        function = self.rate_limited(100)
+
+        expect(lambda: StripeRateLimiter().call(function, deadline=time.monotonic() + 0.05)).to(
+            raise_error(RateLimitError))
+        expect(function.call_count).to(be_below(100))
+        expect(metrics.get('stripe_rate_limit.exhausted')).to(equal(1))
+
+    @patch('stripe.Subscription.create')
+    def test_the_subscriptions_survive_a_rate_limited_stripe_call(self, subscription_create):
+        account = Account.objects.create(name="User account")
+        user = User.objects.create_user(username='goku', password='goku1234', account=account)
+        Customer.objects.create(is_active=True, id_reference='cus_whatever', account=account)
+        PaymentMethod.objects.create(
+            is_active=True, id_reference='pm_whatever', type=PaymentMethodType.CARD, account=account)
+        subscription_create.side_effect = [RateLimitError('Too many requests'), MagicMock(id='sub_whatever')]
+
+        response = self.post(url=reverse('subscriptions-subscribe'), user=user, data={
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767})
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(Subscription.objects.filter(account=account).exists()).to(equal(True))
+        # Both attempts send the same idempotency key
+        keys = {kwargs['idempotency_key'] for _, kwargs in subscription_create.call_args_list}
+        expect(len(keys)).to(equal(1))
@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import stripe
+from django.test import override_settings
+from django.urls import reverse
+from expects import be_above, be_below, equal, expect, raise_error
+from rest_framework import status
+
+from ..models import Account, User
+from ..models.constants import StripeGatewayMode, SubscriptionProduct
+from ..services import StripeCircuitBreaker, StripeClient
+from ..utils import metrics
+from ..utils.stripe_stand_in import LatencyDistribution, StripeStandIn
+from .base import BaseAPITestCase
+
+
+class WebhookReceiver(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        self.server.received.append((body, self.headers['Stripe-Signature']))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@override_settings(STRIPE_RATE_LIMIT=0, STRIPE_RETRY_BUDGET=0)
+class StripeStandInTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        self.api_base, self.api_key = stripe.api_base, stripe.api_key
+        self.http_client = stripe.default_http_client
+        stripe.default_http_client = StripeClient(pool_size=2, connect_timeout=1, read_timeout=5)
+        stripe.api_key = 'sk_test_stand_in'
+        StripeCircuitBreaker.reset()
+        metrics.reset()
+        self.servers = []
+
+    def tearDown(self):
+        stripe.api_base, stripe.api_key = self.api_base, self.api_key
+        stripe.default_http_client = self.http_client
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def start(self, server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        return server
+
+    def stand_in(self, **options):
+        server = self.start(StripeStandIn(('127.0.0.1', 0), **options))
+        stripe.api_base = server.url
+        return server
+
+    def subscribe(self):
+        account = Account.objects.create(name="User account")
+        user = User.objects.create_user(username='goku', password='goku1234', account=account)
+        return user, self.post(url=reverse('subscriptions-subscribe'), user=user, data={
+            'subscription_product': SubscriptionProduct.BASIC_PRODUCT_NAME,
+            'card_number': '4242424242424242',
+            'card_expiration_month': 10,
+            'card_expiration_year': 2100,
+            'card_cvc': 767})
+
+    def test_the_gateway_subscribes_over_http_reusing_the_connection(self):
+        server = self.stand_in()
+
+        for mode in (StripeGatewayMode.SEQUENTIAL, StripeGatewayMode.COMPACT):
+            with override_settings(STRIPE_GATEWAY_MODE=mode):
+                user, response = self.subscribe()
+
+            expect(response.status_code).to(equal(status.HTTP_200_OK))
+            subscription = user.get_subscription()
+            expect(subscription.price_reference).to(
+                equal(SubscriptionProduct.price_by_product(SubscriptionProduct.BASIC_PRODUCT_NAME)))
+            user.account.delete()
+
+        expect(server.stats()['requests']).to(equal(8))
+        expect(StripeClient.stats()['connections']).to(equal(1))
+
+    def test_retries_with_the_same_idempotency_key_get_the_same_object(self):
+        self.stand_in()
+
+        first = stripe.Customer.create(name='Son Goku', idempotency_key='key-1')
+        second = stripe.Customer.create(name='Son Goku', idempotency_key='key-1')
+
+        expect(second.id).to(equal(first.id))
+
+    def test_it_rate_limits_the_calls(self):
+        server = self.stand_in(rate_limit=1)
+
+        def create_customers():
+            for _ in range(3):
+                stripe.Customer.create(name='Son Goku')
+
+        expect(create_customers).to(raise_error(stripe.error.RateLimitError))
+        expect(server.stats()['throttled']).to(equal(1))
+
+    def test_it_answers_server_errors_and_declines(self):
+        self.stand_in(error_rate=1)
+        expect(lambda: stripe.Customer.create(name='Son Goku')).to(raise_error(stripe.error.APIError))
+
+        self.stand_in(decline_rate=1)
+        expect(lambda: stripe.PaymentMethod.create(type='card')).to(raise_error(stripe.error.CardError))
+
+    def test_it_delays_the_answers(self):
+        self.stand_in(latency=LatencyDistribution('constant', 0.1))
+        started_at = time.monotonic()
+
+        stripe.Customer.create(name='Son Goku')
+
+        expect(time.monotonic() - started_at).to(be_above(0.1))
+
+    def test_it_posts_signed_subscription_events(self):
+        receiver = self.start(ThreadingHTTPServer(('127.0.0.1', 0), WebhookReceiver))
+        receiver.received = []
+        self.stand_in(webhook_url=f'http://127.0.0.1:{receiver.server_port}/', webhook_secret='whsec_test')
+        customer = stripe.Customer.create(name='Son Goku')
+
+        subscription = stripe.Subscription.create(customer=customer.id, items=[{'price': 'price_basic'}])
+
+        deadline = time.monotonic() + 5
+        while not receiver.received and time.monotonic() < deadline:
+            time.sleep(0.01)
+        payload, signature = receiver.received[0]
+        event = stripe.Webhook.construct_event(payload, signature, 'whsec_test')
+        expect(event.type).to(equal('customer.subscription.created'))
+        expect(event.data.object.id).to(equal(subscription.id))
+        expect(json.loads(payload)['data']['object']['status']).to(equal('active'))
+
+    def test_the_latency_distributions(self):
+        for distribution in LatencyDistribution.DISTRIBUTIONS:
+            samples = [LatencyDistribution(distribution, 0.1).sample() for _ in range(2000)]
+            expect(sum(samples) / len(samples)).to(be_above(0.05))
+            expect(sum(samples) / len(samples)).to(be_below(0.2))
+        expect(lambda: LatencyDistribution('normal', 0.1)).to(raise_error(ValueError))
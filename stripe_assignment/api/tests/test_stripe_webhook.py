@@ -1,6 +1,7 @@
 from datetime import datetime
 
 import pytz
+from django.core.cache import cache
 from django.test import override_settings
 from django.urls import reverse
 from django.utils import timezone
@@ -9,6 +10,7 @@ from rest_framework import status
 
 from ..models import Account, Customer, Subscription, User
 from ..models.constants import SubscriptionProduct, SubscriptionStatus
+from ..services import WebhookEventDeduplicator
 from .base import BaseAPITestCase
 
 
@@ -25,6 +27,8 @@ class StripeWebHookTestCase(BaseAPITestCase):
             email='goku@dragonball.com',
             account=self.account
         )
+        cache.clear()
+        WebhookEventDeduplicator.recent_event_ids.clear()
 
     @override_settings(STRIPE_WEBHOOK_SECRET='')
     def test_it_updates_subscription_data_from_a_created_event(self):
@@ -152,3 +156,41 @@ class StripeWebHookTestCase(BaseAPITestCase):
         expect(subscription.id_reference).to(equal('sub_1Jgi4xKBAHswNGjYuEORMJpB'))
         expect(subscription.current_period_start).to(equal(current_period_start))
         expect(subscription.current_period_end).to(equal(current_period_end))
+
+    @override_settings(STRIPE_WEBHOOK_SECRET='')
+    def test_it_refreshes_the_cached_subscription_status(self):
+        stripe_data_mock = {
+            'id': 'evt_1Jgi50KBAHswNGjYg6mOHDr0',
+            'type': 'customer.subscription.updated',
+            'object': 'event',
+            'api_version': '2020-08-27',
+            'created': 1633318985,
+            'data': {
+                'object': {
+                    'id': 'sub_1Jgi4xKBAHswNGjYuEORMJpB',
+                    'created': 1633318983,
+                    'current_period_end': 1635997383,
+                    'current_period_start': 1633318983,
+                    'customer': 'cus_KLOsroz46wGUr7',
+                    'status': 'active',
+                }
+            }
+        }
+        Customer.objects.create(
+            is_active=True,
+            id_reference='cus_KLOsroz46wGUr7',
+            account=self.user.account)
+        Subscription.objects.create(
+            status=SubscriptionStatus.PENDING,
+            price_reference=SubscriptionProduct.price_by_product(
+                SubscriptionProduct.BASIC_PRODUCT_NAME),
+            account=self.account
+        )
+        status_url = reverse('subscriptions-status')
+        self.get(url=status_url, user=self.user)
+
+        self.post(url=self.url, user=None, data=stripe_data_mock)
+
+        response = self.get(url=status_url, user=self.user)
+        expect(response.json()['status']).to(equal(SubscriptionStatus.SUCCESSFUL))
+        expect(response.json()['id_reference']).to(equal('sub_1Jgi4xKBAHswNGjYuEORMJpB'))
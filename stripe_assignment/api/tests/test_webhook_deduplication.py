@@ -0,0 +1,114 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from expects import equal, expect
+from rest_framework import status
+
+from ..models import Account, Customer, Subscription, User, WebhookEvent
+from ..models.constants import (SubscriptionProduct, SubscriptionStatus,
+                                WebhookEventStatus)
+from ..services import WebhookEventDeduplicator
+from ..utils import metrics
+from .base import BaseAPITestCase
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='')
+class WebhookDeduplicationTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        self.url = reverse('stripe-webhook')
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(
+            username='goku',
+            password='goku1234',
+            is_staff=True,
+            account=self.account
+        )
+        Customer.objects.create(
+            is_active=True,
+            id_reference='cus_KLOsroz46wGUr7',
+            account=self.account)
+        self.subscription = Subscription.objects.create(
+            status=SubscriptionStatus.PENDING,
+            price_reference=SubscriptionProduct.price_by_product(
+                SubscriptionProduct.BASIC_PRODUCT_NAME),
+            account=self.account
+        )
+        self.stripe_data_mock = {
+            'id': 'evt_1Jgi50KBAHswNGjYg6mOHDr0',
+            'type': 'customer.subscription.updated',
+            'object': 'event',
+            'api_version': '2020-08-27',
+            'created': 1633318985,
+            'data': {
+                'object': {
+                    'id': 'sub_1Jgi4xKBAHswNGjYuEORMJpB',
+                    'created': 1633318983,
+                    'current_period_end': 1635997383,
+                    'current_period_start': 1633318983,
+                    'customer': 'cus_KLOsroz46wGUr7',
+                    'status': 'active',
+                }
+            }
+        }
+        cache.clear()
+        metrics.reset()
+        WebhookEventDeduplicator.recent_event_ids.clear()
+
+    def test_it_does_not_apply_an_already_recorded_event_again(self):
+        self.post(url=self.url, user=None, data=self.stripe_data_mock)
+        Subscription.objects.filter(id=self.subscription.id).update(status=SubscriptionStatus.FAILED)
+        WebhookEventDeduplicator.recent_event_ids.clear()
+
+        response = self.post(url=self.url, user=None, data=self.stripe_data_mock)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        self.subscription.refresh_from_db()
+        expect(self.subscription.status).to(equal(SubscriptionStatus.FAILED))
+        expect(WebhookEvent.objects.filter(event_id='evt_1Jgi50KBAHswNGjYg6mOHDr0').count()).to(equal(1))
+        expect(metrics.get('webhook_dedup.hits')).to(equal(1))
+        expect(metrics.get('webhook_dedup.misses')).to(equal(1))
+
+    def test_it_answers_recent_duplicates_without_querying_the_database(self):
+        self.post(url=self.url, user=None, data=self.stripe_data_mock)
+
+        with self.assertNumQueries(0):
+            response = self.post(url=self.url, user=None, data=self.stripe_data_mock)
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(metrics.get('webhook_dedup.lru_hits')).to(equal(1))
+
+    @override_settings(STRIPE_WEBHOOK_INBOX_ENABLED=True)
+    def test_it_does_not_store_duplicates_in_the_inbox(self):
+        self.post(url=self.url, user=None, data=self.stripe_data_mock)
+        WebhookEventDeduplicator.recent_event_ids.clear()
+
+        self.post(url=self.url, user=None, data=self.stripe_data_mock)
+
+        expect(WebhookEvent.objects.count()).to(equal(1))
+        expect(metrics.get('webhook_dedup.hits')).to(equal(1))
+
+    def test_it_prunes_the_applied_events_older_than_the_ttl(self):
+        old = timezone.now() - timedelta(days=4)
+        WebhookEvent.objects.create(event_id='evt_old', payload={}, status=WebhookEventStatus.PROCESSED)
+        WebhookEvent.objects.create(event_id='evt_old_pending', payload={})
+        WebhookEvent.objects.create(event_id='evt_recent', payload={}, status=WebhookEventStatus.PROCESSED)
+        WebhookEvent.objects.filter(event_id__in=['evt_old', 'evt_old_pending']).update(created_at=old)
+
+        call_command('prune_webhook_events', stdout=StringIO())
+
+        event_ids = sorted(WebhookEvent.objects.values_list('event_id', flat=True))
+        expect(event_ids).to(equal(['evt_old_pending', 'evt_recent']))
+
+    def test_the_metrics_include_the_dedup_hit_rate(self):
+        self.post(url=self.url, user=None, data=self.stripe_data_mock)
+        self.post(url=self.url, user=None, data=self.stripe_data_mock)
+
+        response = self.get(url=reverse('metrics'), user=self.user)
+
+        expect(response.json()['webhook_dedup']).to(equal({'hits': 1, 'misses': 1, 'hit_rate': 0.5}))
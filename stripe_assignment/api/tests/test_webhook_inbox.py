@@ -0,0 +1,211 @@
+import json
+import time
+from copy import deepcopy
+from io import StringIO
+
+import stripe
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from expects import be_above_or_equal, be_none, contain, equal, expect
+from rest_framework import status
+
+from ..models import Account, Customer, Subscription, User, WebhookEvent
+from ..models.constants import (SubscriptionProduct, SubscriptionStatus,
+                                WebhookEventStatus)
+from ..services import WebhookEventDeduplicator
+from ..utils import metrics
+from .base import BaseAPITestCase
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='', STRIPE_WEBHOOK_INBOX_ENABLED=True)
+class WebhookInboxTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        self.url = reverse('stripe-webhook')
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(
+            username='goku',
+            password='goku1234',
+            first_name='Son',
+            last_name='Goku',
+            email='goku@dragonball.com',
+            account=self.account
+        )
+        Customer.objects.create(
+            is_active=True,
+            id_reference='cus_KLOsroz46wGUr7',
+            account=self.account)
+        Subscription.objects.create(
+            status=SubscriptionStatus.PENDING,
+            price_reference=SubscriptionProduct.price_by_product(
+                SubscriptionProduct.BASIC_PRODUCT_NAME),
+            account=self.account
+        )
+        self.stripe_data_mock = {
+            'id': 'evt_1Jgi50KBAHswNGjYg6mOHDr0',
+            'type': 'customer.subscription.created',
+            'object': 'event',
+            'api_version': '2020-08-27',
+            'created': 1633318985,
+            'data': {
+                'object': {
+                    'id': 'sub_1Jgi4xKBAHswNGjYuEORMJpB',
+                    'created': 1633318983,
+                    'current_period_end': 1635997383,
+                    'current_period_start': 1633318983,
+                    'customer': 'cus_KLOsroz46wGUr7',
+                    'status': 'active',
+                }
+            }
+        }
+        metrics.reset()
+        WebhookEventDeduplicator.recent_event_ids.clear()
+
+    def test_it_stores_the_event_with_a_single_insert_and_does_not_apply_it(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(url=self.url, user=None, data=self.stripe_data_mock)
+
+        statements = [query['sql'].split()[0] for query in queries.captured_queries]
+        expect([statement for statement in statements if statement in ('SELECT', 'INSERT', 'UPDATE')]).to(
+            equal(['INSERT']))
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        event = WebhookEvent.objects.get()
+        expect(event.event_id).to(equal('evt_1Jgi50KBAHswNGjYg6mOHDr0'))
+        expect(event.type).to(equal('customer.subscription.created'))
+        expect(event.status).to(equal(WebhookEventStatus.PENDING))
+        expect(event.payload).to(equal(self.stripe_data_mock))
+        expect(self.user.get_subscription().status).to(equal(SubscriptionStatus.PENDING))
+
+    def test_the_worker_applies_the_stored_events(self):
+        self.post(url=self.url, user=None, data=self.stripe_data_mock)
+        output = StringIO()
+
+        call_command('process_webhook_events', once=True, stdout=output)
+
+        subscription = self.user.get_subscription()
+        expect(subscription.status).to(equal(SubscriptionStatus.SUCCESSFUL))
+        expect(subscription.id_reference).to(equal('sub_1Jgi4xKBAHswNGjYuEORMJpB'))
+        event = WebhookEvent.objects.get()
+        expect(event.status).to(equal(WebhookEventStatus.PROCESSED))
+        expect(event.attempts).to(equal(1))
+        expect(event.processed_at).not_to(be_none)
+        expect(metrics.get('webhook_inbox.processed')).to(equal(1))
+        expect(output.getvalue()).to(contain('processed=1'))
+        expect(output.getvalue()).to(contain('backlog=0'))
+
+    def post_subscription_burst(self):
+        # Delivered out of order: the newest state is the second event
+        for event_id, event_type, created, subscription_status in [
+            ('evt_1', 'customer.subscription.created', 1633318985, 'incomplete'),
+            ('evt_2', 'customer.subscription.updated', 1633318999, 'active'),
+            ('evt_3', 'customer.subscription.updated', 1633318990, 'past_due'),
+        ]:
+            event = deepcopy(self.stripe_data_mock)
+            event.update({'id': event_id, 'type': event_type, 'created': created})
+            event['data']['object']['status'] = subscription_status
+            self.post(url=self.url, user=None, data=event)
+
+    def test_the_worker_coalesces_a_burst_into_one_write_with_the_newest_state(self):
+        self.post_subscription_burst()
+
+        call_command('process_webhook_events', once=True, stdout=StringIO())
+
+        subscription = self.user.get_subscription()
+        expect(subscription.payment_gateway_status).to(equal('active'))
+        expect(subscription.status).to(equal(SubscriptionStatus.SUCCESSFUL))
+        expect(metrics.get('webhook.subscription_writes')).to(equal(1))
+        expect(WebhookEvent.objects.filter(status=WebhookEventStatus.PROCESSED).count()).to(equal(3))
+
+    def test_the_worker_can_apply_every_event_of_a_burst(self):
+        self.post_subscription_burst()
+
+        call_command('process_webhook_events', once=True, no_coalesce=True, stdout=StringIO())
+
+        # The older third event is not applied over the newest state
+        expect(self.user.get_subscription().payment_gateway_status).to(equal('active'))
+        expect(metrics.get('webhook.subscription_writes')).to(equal(2))
+        expect(metrics.get('webhook.stale_events')).to(equal(1))
+
+    def test_an_older_event_of_a_later_batch_does_not_overwrite_the_newest_state(self):
+        self.post_subscription_burst()
+
+        call_command('process_webhook_events', once=True, batch_size=2, stdout=StringIO())
+
+        subscription = self.user.get_subscription()
+        expect(subscription.payment_gateway_status).to(equal('active'))
+        expect(subscription.last_event_created).to(equal(1633318999))
+        expect(metrics.get('webhook.subscription_writes')).to(equal(1))
+        expect(metrics.get('webhook.stale_events')).to(equal(1))
+        expect(WebhookEvent.objects.filter(status=WebhookEventStatus.PROCESSED).count()).to(equal(3))
+
+    @override_settings(STRIPE_WEBHOOK_INBOX_MAX_ATTEMPTS=3, STRIPE_WEBHOOK_INBOX_RETRY_BACKOFF=60)
+    def test_the_worker_retries_failing_events_with_backoff_until_the_max_attempts(self):
+        del self.stripe_data_mock['data']['object']['current_period_start']
+        self.post(url=self.url, user=None, data=self.stripe_data_mock)
+
+        started_at = timezone.now()
+        call_command('process_webhook_events', once=True, stdout=StringIO())
+
+        event = WebhookEvent.objects.get()
+        expect(event.status).to(equal(WebhookEventStatus.PENDING))
+        expect(event.attempts).to(equal(1))
+        expect(event.error).to(contain('current_period_start'))
+        expect((event.next_attempt_at - started_at).total_seconds()).to(be_above_or_equal(60))
+
+        # The event is not retried until its backoff is over
+        call_command('process_webhook_events', once=True, stdout=StringIO())
+        event.refresh_from_db()
+        expect(event.attempts).to(equal(1))
+
+        started_at = timezone.now()
+        WebhookEvent.objects.update(next_attempt_at=started_at)
+        call_command('process_webhook_events', once=True, stdout=StringIO())
+
+        event.refresh_from_db()
+        expect(event.status).to(equal(WebhookEventStatus.PENDING))
+        expect(event.attempts).to(equal(2))
+        # The backoff doubles on every attempt
+        expect((event.next_attempt_at - started_at).total_seconds()).to(be_above_or_equal(120))
+
+        WebhookEvent.objects.update(next_attempt_at=timezone.now())
+        call_command('process_webhook_events', once=True, stdout=StringIO())
+
+        event.refresh_from_db()
+        expect(event.status).to(equal(WebhookEventStatus.FAILED))
+        expect(event.attempts).to(equal(3))
+        expect(self.user.get_subscription().status).to(equal(SubscriptionStatus.PENDING))
+
+    @override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+    def test_it_only_stores_events_with_a_valid_signature(self):
+        payload = json.dumps(self.stripe_data_mock)
+        timestamp = int(time.time())
+        signature = stripe.WebhookSignature._compute_signature(f'{timestamp}.{payload}', 'whsec_test')
+
+        self.client.post(
+            self.url, data=payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=f't={timestamp},v1=invalid')
+        expect(WebhookEvent.objects.count()).to(equal(0))
+
+        response = self.client.post(
+            self.url, data=payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}')
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(WebhookEvent.objects.get().payload).to(equal(self.stripe_data_mock))
+
+    def test_the_metrics_include_the_inbox_backlog(self):
+        staff_user = User.objects.create_user(
+            username='vegeta',
+            password='vegeta1234',
+            is_staff=True,
+            account=self.account
+        )
+        self.post(url=self.url, user=None, data=self.stripe_data_mock)
+
+        response = self.get(url=reverse('metrics'), user=staff_user)
+
+        expect(response.json()['webhook_inbox']['backlog']).to(equal(1))
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+import jwt
+from django.conf import settings
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from expects import contain, equal, expect
+from rest_framework import status
+
+from ...authentication import ClaimsJWTAuthentication
+from ...models import Account, User
+from ...services import KeySetTokenBackend
+from ..base import BaseAPITestCase
+
+
+class KeySetTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        self.status_url = reverse('subscriptions-status')
+        self.token_url = reverse('token_create')
+        self.account = Account.objects.create(name="User account")
+        self.user = User.objects.create_user(
+            username='goku',
+            password='goku1234',
+            account=self.account
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        ClaimsJWTAuthentication.verified_tokens.clear()
+
+    def tearDown(self):
+        self.directory.cleanup()
+        KeySetTokenBackend.configure()
+
+    def login(self):
+        response = self.post(url=self.token_url, data={'username': 'goku', 'password': 'goku1234'})
+        return response.json()['access']
+
+    def status_with(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {token}')
+        return self.client.get(self.status_url)
+
+    def write_key_set(self, *keys):
+        path = os.path.join(self.directory.name, 'keys.json')
+        with open(path, mode='w') as key_set_file:
+            json.dump({'keys': list(keys)}, key_set_file)
+        return path
+
+    def switch_to(self, algorithm, kid, **extra):
+        private_pem, public_pem = KeySetTokenBackend.generate_key_pair(algorithm)
+        with override_settings(
+                JWT_ALGORITHM=algorithm, JWT_SIGNING_KEY=private_pem, JWT_VERIFYING_KEY=public_pem,
+                JWT_SIGNING_KEY_ID=kid, **extra):
+            KeySetTokenBackend.configure()
+        return public_pem
+
+    def test_tokens_are_signed_with_the_configured_algorithm_and_key_id(self):
+        for algorithm in ('ES256', 'EdDSA'):
+            self.switch_to(algorithm, f'{algorithm}-key')
+
+            token = self.login()
+
+            expect(jwt.get_unverified_header(token)).to(equal({'alg': algorithm, 'kid': f'{algorithm}-key', 'typ': 'JWT'}))
+            expect(self.status_with(token).status_code).to(equal(status.HTTP_404_NOT_FOUND))
+
+    def test_tokens_of_the_previous_keys_are_accepted_after_a_rotation(self):
+        legacy_token = self.login()
+        first_public_pem = self.switch_to('ES256', 'first')
+        first_token = self.login()
+        key_set = self.write_key_set(
+            KeySetTokenBackend.jwk('RS256', settings.JWT_VERIFYING_KEY, 'legacy'),
+            KeySetTokenBackend.jwk('ES256', first_public_pem, 'first'))
+
+        self.switch_to('EdDSA', 'second', JWT_KEY_SET_FILE=key_set, JWT_DEFAULT_KEY_ID='legacy')
+
+        expect(self.status_with(legacy_token).status_code).to(equal(status.HTTP_404_NOT_FOUND))
+        expect(self.status_with(first_token).status_code).to(equal(status.HTTP_404_NOT_FOUND))
+        expect(self.status_with(self.login()).status_code).to(equal(status.HTTP_404_NOT_FOUND))
+
+    def test_tokens_of_removed_keys_are_rejected(self):
+        self.switch_to('ES256', 'first')
+        token = self.login()
+
+        self.switch_to('ES256', 'second')
+
+        expect(self.status_with(token).status_code).to(equal(status.HTTP_401_UNAUTHORIZED))
+
+    def test_the_algorithm_is_pinned_by_the_key(self):
+        self.switch_to('ES256', 'first')
+        private_pem, _ = KeySetTokenBackend.generate_key_pair('EdDSA')
+        forged = jwt.encode({'id': f'{self.user.id}'}, private_pem, algorithm='EdDSA', headers={'kid': 'first'})
+
+        expect(self.status_with(forged).status_code).to(equal(status.HTTP_401_UNAUTHORIZED))
+
+    def test_it_generates_key_pairs_into_a_key_set(self):
+        key_set = os.path.join(self.directory.name, 'keys.json')
+        output = StringIO()
+
+        call_command(
+            'generate_jwt_keys', 'first', algorithm='EdDSA', output_dir=self.directory.name, key_set=key_set,
+            stdout=output)
+
+        with open(key_set, mode='r') as key_set_file:
+            keys = json.load(key_set_file)['keys']
+        expect([(key['kid'], key['alg'], key['kty'], key['crv']) for key in keys]).to(
+            equal([('first', 'EdDSA', 'OKP', 'Ed25519')]))
+        expect(os.path.exists(os.path.join(self.directory.name, 'first.key'))).to(equal(True))
+        expect(output.getvalue()).to(contain('Added first'))
+
+    def test_the_benchmark_reports_every_algorithm(self):
+        output = StringIO()
+
+        call_command('benchmark_token_algorithms', tokens=5, algorithms=['ES256', 'EdDSA'], stdout=output)
+
+        expect(output.getvalue()).to(contain('RS256 (simplejwt backend): sign='))
+        expect(output.getvalue()).to(contain('ES256: sign='))
+        expect(output.getvalue()).to(contain('EdDSA: sign='))
@@ -1,9 +1,11 @@
+from django.core.cache import cache
 from django.urls import reverse
 from expects import equal, expect
 from rest_framework import status
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
 from ...models import Account, User
+from ...serializers import MyTokenObtainPairSerializer
 from ..base import BaseAPITestCase
 
 
@@ -11,6 +13,7 @@ class RefreshTokenTestCase(BaseAPITestCase):
 
     def setUp(self):
         self.url = reverse('token_refresh')
+        cache.clear()
 
     def test_it_returns_not_allowed_for_get_method(self):
         response = self.get(url=self.url, user=None, data={})
@@ -42,3 +45,27 @@ class RefreshTokenTestCase(BaseAPITestCase):
 
         expect(response.status_code).to(equal(status.HTTP_200_OK))
         expect(response.json()['access']).not_to(equal(str(refresh.access_token)))
+
+    def test_it_returns_unauthorized_for_deactivated_users(self):
+        account = Account.objects.create(name="User account")
+        user = User.objects.create_user(username='goku', password='goku1234', account=account)
+        refresh = MyTokenObtainPairSerializer.get_token(user)
+        self.post(url=self.url, user=None, data={'refresh': str(refresh)})
+        User.objects.filter(id=user.id).update(is_active=False)
+
+        response = self.post(url=self.url, user=None, data={'refresh': str(refresh)})
+
+        expect(response.status_code).to(equal(status.HTTP_401_UNAUTHORIZED))
+
+    def test_it_issues_the_current_claims_of_the_user(self):
+        account = Account.objects.create(name="User account")
+        user = User.objects.create_user(username='goku', password='goku1234', account=account)
+        refresh = MyTokenObtainPairSerializer.get_token(user)
+        other_account = Account.objects.create(name="Other account")
+        User.objects.filter(id=user.id).update(account=other_account)
+
+        response = self.post(url=self.url, user=None, data={'refresh': str(refresh)})
+
+        expect(response.status_code).to(equal(status.HTTP_200_OK))
+        expect(AccessToken(response.json()['access'])['account_id']).to(equal(f'{other_account.id}'))
+        expect(RefreshToken(response.json()['refresh'])['account_id']).to(equal(f'{other_account.id}'))
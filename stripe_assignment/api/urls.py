@@ -2,17 +2,23 @@ from django.conf.urls import include, url
 from django.urls import path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from rest_framework import routers
-from rest_framework_simplejwt import views as jwt_views
 
-from .resources import ObtainTokenPairView, SubscriptionsViewSet, StripeWebookView
+from .resources import (HealthView, MetricsView, ObtainTokenPairView,
+                        RefreshTokenView, StripeWebookView,
+                        SubscriptionsViewSet, async_subscriptions)
 
 router = routers.DefaultRouter()
 router.register(r'subscriptions', SubscriptionsViewSet, basename='subscriptions')
 
 urlpatterns = [
     path('token/obtain/', ObtainTokenPairView.as_view(), name='token_create'),
-    path('token/refresh/', jwt_views.TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', RefreshTokenView.as_view(), name='token_refresh'),
     path('stripe-webhook/', StripeWebookView.as_view(), name='stripe-webhook'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('health/', HealthView.as_view(), name='health'),
+    path('async/subscriptions/subscribe/', async_subscriptions.subscribe, name='async-subscriptions-subscribe'),
+    path('async/subscriptions/status/', async_subscriptions.subscription_status, name='async-subscriptions-status'),
+    path('async/stripe-webhook/', async_subscriptions.stripe_webhook, name='async-stripe-webhook'),
     url(r'', include(router.urls)),
 ]
 
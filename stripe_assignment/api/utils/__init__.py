@@ -0,0 +1,6 @@
+from .lru import LRUCache
+from .metrics import metrics
+from .workers import run_in_worker
+from .stats import percentile
+from .webhook_corpus import WebhookCorpus
+from .queries import QueryBudgets, QueryCounter, current_counter, query_metrics
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+# The counter of the request being served, copied to the async workers along with the rest of the context
+current_counter = ContextVar('current_counter', default=None)
+# Kept apart from the app metrics, there is a set of counters for every view
+query_metrics = Metrics()
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class QueryCounter:
+
+    # A connection execute_wrapper, it can be shared by the connections of several threads
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add(time.perf_counter() - started_at)
+
+    def add(self, duration):
+        with self.lock:
+            self.count += 1
+            self.duration += duration
+
+
+def track_query(execute, sql, params, many, context):
+    # Installed in every connection, counts the queries of the current request and logs the slow ones
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started_at
+        counter = current_counter.get()
+        if counter is not None:
+            counter.add(duration)
+        if settings.DB_SLOW_QUERY_SECONDS and duration >= settings.DB_SLOW_QUERY_SECONDS:
+            query_metrics.increment('db.slow_queries')
+            logger.warning('Slow query %.3fs at %s: %s', duration, call_site(), sql)
+
+
+def install_query_tracking(sender, connection, **kwargs):
+    if track_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, track_query)
+
+
+def call_site():
+    # The innermost frame of the app code, outside of this module
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        if frame.filename.startswith(API_DIR) and frame.filename != __file__:
+            return f'{os.path.relpath(frame.filename, os.path.dirname(API_DIR))}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+class QueryBudgets:
+
+    # The queries and database time each view is allowed per request, by view name
+    budgets = None
+
+    def get(self, view_name):
+        return self.load().get(view_name)
+
+    def load(self):
+        cls = type(self)
+        if cls.budgets is None:
+            with open(settings.DB_QUERY_BUDGETS_FILE) as budgets_file:
+                cls.budgets = {
+                    name: budget for name, budget in json.load(budgets_file).items() if not name.startswith('_')}
+        return cls.budgets
+
+    def exceeded(self, view_name, counter, include_time=True):
+        budget = self.get(view_name) or {}
+        exceeded = []
+        if 'queries' in budget and counter.count > budget['queries']:
+            exceeded.append(f'{counter.count} queries, the budget is {budget["queries"]}')
+        if include_time and 'time_ms' in budget and counter.duration * 1000 > budget['time_ms']:
+            exceeded.append(f'{counter.duration * 1000:.1f}ms of queries, the budget is {budget["time_ms"]}ms')
+        return exceeded
+
+    def record(self, view_name, counter):
+        query_metrics.increment(f'db.{view_name}.requests')
+        query_metrics.increment(f'db.{view_name}.queries', counter.count)
+        query_metrics.increment(f'db.{view_name}.time_ms', counter.duration * 1000)
+        if self.exceeded(view_name, counter):
+            query_metrics.increment(f'db.{view_name}.over_budget')
+
+    def stats(self):
+        views = {
+            name[len('db.'):-len('.requests')]
+            for name in query_metrics.snapshot()['counters'] if name.startswith('db.') and name.endswith('.requests')
+        }
+        stats = {'slow_queries': query_metrics.get('db.slow_queries'), 'views': {}}
+        for view_name in sorted(views):
+            requests = query_metrics.get(f'db.{view_name}.requests')
+            stats['views'][view_name] = {
+                'requests': requests,
+                'queries_per_request': query_metrics.get(f'db.{view_name}.queries') / requests,
+                'time_ms_per_request': query_metrics.get(f'db.{view_name}.time_ms') / requests,
+                'over_budget': query_metrics.get(f'db.{view_name}.over_budget'),
+                'budget': self.get(view_name),
+            }
+        return stats
@@ -0,0 +1,10 @@
+import math
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+
+    ordered = sorted(values)
+    index = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
@@ -0,0 +1,315 @@
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from urllib.request import Request, urlopen
+
+from .webhook_corpus import WebhookCorpus
+
+# An HTTP stand-in for the Stripe endpoints used by the gateway, for offline load and latency tests.
+# Point the app to it with STRIPE_API_BASE.
+
+
+class LatencyDistribution:
+
+    DISTRIBUTIONS = ('constant', 'uniform', 'exponential', 'lognormal')
+
+    def __init__(self, distribution, mean, sigma=0.5):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f'Unknown latency distribution {distribution}')
+        self.distribution = distribution
+        self.mean = mean
+        self.sigma = sigma
+
+    def sample(self):
+        if self.mean <= 0:
+            return 0
+        if self.distribution == 'uniform':
+            return random.uniform(0, 2 * self.mean)
+        if self.distribution == 'exponential':
+            return random.expovariate(1 / self.mean)
+        if self.distribution == 'lognormal':
+            # The mean is the median, sigma makes the tail longer
+            return random.lognormvariate(0, self.sigma) * self.mean
+        return self.mean
+
+
+def stripe_error(error_type, message, code=None):
+    return {'error': {'type': error_type, 'message': message, 'code': code}}
+
+
+class StripeObjects:
+
+    # The Stripe endpoints used by the gateway and the reconciliation, answered from memory.
+    # Shared by the stand-in server and the in-process fake Stripe client of the tests.
+    ROUTES = [
+        ('POST', r'^/v1/customers$', 'create_customer'),
+        ('POST', r'^/v1/customers/(?P<sid>[^/]+)$', 'modify_customer'),
+        ('POST', r'^/v1/payment_methods$', 'create_payment_method'),
+        ('POST', r'^/v1/payment_methods/(?P<sid>[^/]+)/attach$', 'attach_payment_method'),
+        ('POST', r'^/v1/subscriptions$', 'create_subscription'),
+        ('GET', r'^/v1/subscriptions$', 'list_subscriptions'),
+        ('GET', r'^/v1/events$', 'list_events'),
+    ]
+
+    def __init__(self, id_prefix='', subscription_status='active', on_event=None):
+        self.id_prefix = id_prefix
+        self.subscription_status = subscription_status
+        self.on_event = on_event
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.customers = {}
+        self.payment_methods = {}
+        self.subscriptions = {}
+        self.events = []
+
+    def route(self, method, path, params):
+        # Returns the status and body of the answer
+        for route_method, pattern, handler in self.ROUTES:
+            match = re.match(pattern, path)
+            if method.upper() == route_method and match:
+                return getattr(self, handler)(params, **match.groupdict())
+        return 404, stripe_error('invalid_request_error', f'Unrecognized request URL ({method.upper()}: {path})')
+
+    def next_id(self, prefix):
+        return f'{prefix}_{self.id_prefix}{next(self.ids)}'
+
+    def store(self, collection, kind, prefix, fields):
+        with self.lock:
+            stored = {'id': self.next_id(prefix), 'object': kind, 'created': int(time.time()), **fields}
+            collection[stored['id']] = stored
+        return stored
+
+    def find(self, collection, sid):
+        with self.lock:
+            return collection.get(sid)
+
+    def missing(self, kind, sid):
+        return 404, stripe_error('invalid_request_error', f"No such {kind}: '{sid}'", 'resource_missing')
+
+    def create_customer(self, params):
+        payment_method = params.get('payment_method')
+        if payment_method and not self.find(self.payment_methods, payment_method):
+            return self.missing('payment_method', payment_method)
+
+        customer = self.store(self.customers, 'customer', 'cus', {
+            'email': params.get('email'),
+            'name': params.get('name'),
+            'invoice_settings': {'default_payment_method': params.get('invoice_settings[default_payment_method]')},
+        })
+        if payment_method:
+            self.find(self.payment_methods, payment_method)['customer'] = customer['id']
+        return 200, customer
+
+    def modify_customer(self, params, sid):
+        customer = self.find(self.customers, sid)
+        if not customer:
+            return self.missing('customer', sid)
+        if 'invoice_settings[default_payment_method]' in params:
+            customer.setdefault('invoice_settings', {})['default_payment_method'] = (
+                params['invoice_settings[default_payment_method]'])
+        return 200, customer
+
+    def create_payment_method(self, params):
+        return 200, self.store(
+            self.payment_methods, 'payment_method', 'pm', {'type': params.get('type'), 'customer': None})
+
+    def attach_payment_method(self, params, sid):
+        payment_method = self.find(self.payment_methods, sid)
+        if not payment_method:
+            return self.missing('payment_method', sid)
+        payment_method['customer'] = params.get('customer')
+        return 200, payment_method
+
+    def create_subscription(self, params):
+        customer = params.get('customer')
+        if not self.find(self.customers, customer):
+            return self.missing('customer', customer)
+
+        now = int(time.time())
+        subscription = self.store(self.subscriptions, 'subscription', 'sub', {
+            'customer': customer,
+            'default_payment_method': params.get('default_payment_method'),
+            'status': self.subscription_status,
+            'current_period_start': now,
+            'current_period_end': now + 30 * 24 * 3600,
+            'items': {'object': 'list', 'data': [{'price': {'id': params.get('items[0][price]')}}]},
+        })
+        self.add_event('customer.subscription.created', subscription)
+        return 200, subscription
+
+    def list_subscriptions(self, params):
+        with self.lock:
+            subscriptions = list(reversed(self.subscriptions.values()))
+        return 200, self.page('/v1/subscriptions', subscriptions, params)
+
+    def add_event(self, event_type, data_object, created=None):
+        with self.lock:
+            event = {
+                'id': self.next_id('evt'),
+                'object': 'event',
+                'type': event_type,
+                'created': int(time.time()) if created is None else created,
+                'data': {'object': dict(data_object)},
+            }
+            self.events.append(event)
+        if self.on_event:
+            self.on_event(event)
+        return event
+
+    def list_events(self, params):
+        prefix = params.get('type', '').rstrip('*')
+        since = int(params.get('created[gte]', 0))
+        with self.lock:
+            events = [
+                event for event in reversed(self.events)
+                if event['type'].startswith(prefix) and event['created'] >= since
+            ]
+        return 200, self.page('/v1/events', events, params)
+
+    def page(self, url, items, params):
+        # Newest first, like every Stripe list
+        start = 0
+        if params.get('starting_after'):
+            start = [item['id'] for item in items].index(params['starting_after']) + 1
+        limit = int(params.get('limit', 10))
+        return {'object': 'list', 'url': url, 'has_more': start + limit < len(items), 'data': items[start:start + limit]}
+
+
+class StripeStandIn(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=None, error_rate=0, decline_rate=0, rate_limit=0,
+                 webhook_url='', webhook_secret='', webhook_delay=0, subscription_status='active'):
+        super().__init__(address, StripeStandInHandler)
+        self.latency = latency or LatencyDistribution('constant', 0)
+        self.error_rate = error_rate
+        self.decline_rate = decline_rate
+        self.rate_limit = rate_limit
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.webhook_delay = webhook_delay
+        self.objects = StripeObjects('standin', subscription_status, on_event=self.emit)
+        self.lock = threading.Lock()
+        self.idempotent_responses = {}
+        self.window = (0, 0)
+        self.counters = {
+            'requests': 0, 'errors': 0, 'declines': 0, 'throttled': 0, 'replayed': 0,
+            'webhooks': 0, 'webhook_failures': 0,
+        }
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def handle_request_data(self, method, path, params, idempotency_key):
+        # Returns the status and body of the answer, idempotent retries get the stored one
+        self.count('requests')
+        if self.is_throttled():
+            self.count('throttled')
+            return 429, stripe_error('invalid_request_error', 'Too many requests made to the API too quickly', 'rate_limit')
+
+        time.sleep(self.latency.sample())
+        if self.error_rate and random.random() < self.error_rate:
+            self.count('errors')
+            return 500, stripe_error('api_error', 'An unexpected error occurred')
+
+        if idempotency_key and method == 'POST':
+            with self.lock:
+                stored = self.idempotent_responses.get(idempotency_key)
+            if stored:
+                self.count('replayed')
+                return stored
+
+        if method == 'POST' and path == '/v1/payment_methods' and self.decline_rate and random.random() < self.decline_rate:
+            self.count('declines')
+            response = 402, stripe_error('card_error', 'Your card was declined.', 'card_declined')
+            response[1]['error']['param'] = 'number'
+        else:
+            response = self.objects.route(method, path, params)
+
+        # Only the successful answers are replayed, like the Stripe idempotency layer
+        if idempotency_key and method == 'POST' and response[0] == 200:
+            with self.lock:
+                self.idempotent_responses[idempotency_key] = response
+        return response
+
+    def is_throttled(self):
+        if not self.rate_limit:
+            return False
+        window = int(time.monotonic())
+        with self.lock:
+            start, calls = self.window
+            self.window = (window, 1) if start != window else (start, calls + 1)
+            return self.window[1] > self.rate_limit
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def emit(self, event):
+        if self.webhook_url:
+            # Delivered after the answer, like Stripe does
+            timer = threading.Timer(self.webhook_delay, self.deliver, args=(event,))
+            timer.daemon = True
+            timer.start()
+
+    def deliver(self, event):
+        payload = json.dumps(event)
+        headers = {'Content-Type': 'application/json'}
+        if self.webhook_secret:
+            headers['Stripe-Signature'] = WebhookCorpus.sign(payload, self.webhook_secret)
+        try:
+            urlopen(Request(self.webhook_url, data=payload.encode(), headers=headers, method='POST'), timeout=10)
+            self.count('webhooks')
+        except OSError:
+            self.count('webhook_failures')
+
+
+class StripeStandInHandler(BaseHTTPRequestHandler):
+
+    # Keeps the connections open, so the client connection pool is exercised
+    protocol_version = 'HTTP/1.1'
+    # The headers and the body are separate writes, Nagle would delay the body until the client acknowledges
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.answer('GET')
+
+    def do_POST(self):
+        self.answer('POST')
+
+    def answer(self, method):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        params = dict(parse_qsl(body if method == 'POST' else url.query))
+
+        status, data = self.server.handle_request_data(
+            method, url.path, params, self.headers.get('Idempotency-Key'))
+
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('Request-Id', self.server.objects.next_id('req'))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
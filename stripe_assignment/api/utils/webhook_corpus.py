@@ -0,0 +1,140 @@
+import hashlib
+import hmac
+import json
+import random
+import time
+
+
+class WebhookCorpus:
+
+    # A synthetic stream of customer.subscription.* events like the ones Stripe sends on renewal days:
+    # every account goes through created, active and monthly renewals, with some payments failing.
+    # Stripe delivers at least once and in any order, so some events are duplicated and some are delayed.
+    REORDER_WINDOW = 10
+    PAST_DUE_RATE = 0.03
+    CANCEL_RATE = 0.01
+    PERIOD = 30 * 24 * 3600
+
+    def __init__(self, events, accounts, duplicate_ratio=0, out_of_order_ratio=0, seed=None, prefix='corpus'):
+        self.events = events
+        self.accounts = accounts
+        self.duplicate_ratio = duplicate_ratio
+        self.out_of_order_ratio = out_of_order_ratio
+        self.random = random.Random(seed)
+        self.prefix = prefix
+
+    def customers(self):
+        return [f'cus_{self.prefix}_{index}' for index in range(self.accounts)]
+
+    def generate(self):
+        started_at = int(time.time()) - self.events
+        states = {}
+        stream = []
+        active = list(range(self.accounts))
+        while len(stream) < self.events and active:
+            account = self.random.choice(active)
+            sequence = len(stream)
+            stream.append(self.__next_event(account, states, started_at + sequence, sequence))
+            if states[account]['status'] == 'canceled':
+                active.remove(account)
+
+        for index in range(len(stream)):
+            if self.random.random() < self.out_of_order_ratio:
+                other = min(index + self.random.randint(1, self.REORDER_WINDOW), len(stream) - 1)
+                stream[index], stream[other] = stream[other], stream[index]
+
+        delivered = []
+        redeliveries = []
+        for index, event in enumerate(stream):
+            delivered.append(event)
+            if self.random.random() < self.duplicate_ratio:
+                # Redelivered a few events later, with the same id
+                redeliveries.append((index + self.random.randint(1, self.REORDER_WINDOW), dict(event)))
+            delivered.extend(duplicate for due, duplicate in redeliveries if due <= index)
+            redeliveries = [(due, duplicate) for due, duplicate in redeliveries if due > index]
+        delivered.extend(duplicate for _, duplicate in redeliveries)
+        return delivered
+
+    def __next_event(self, account, states, created, sequence):
+        state = states.get(account)
+        if state is None:
+            event_type = 'customer.subscription.created'
+            state = states[account] = {
+                'id': f'sub_{self.prefix}_{account}',
+                'status': 'incomplete',
+                'created': created,
+                'current_period_start': created,
+            }
+        else:
+            event_type = 'customer.subscription.updated'
+            roll = self.random.random()
+            if state['status'] == 'incomplete':
+                state['status'] = 'active'
+            elif roll < self.CANCEL_RATE:
+                event_type = 'customer.subscription.deleted'
+                state['status'] = 'canceled'
+            elif roll < self.CANCEL_RATE + self.PAST_DUE_RATE:
+                state['status'] = 'past_due'
+            else:
+                state['status'] = 'active'
+                state['current_period_start'] += self.PERIOD
+
+        return {
+            'id': f'evt_{self.prefix}_{sequence}',
+            'object': 'event',
+            'api_version': '2020-08-27',
+            'created': created,
+            'livemode': False,
+            'pending_webhooks': 1,
+            'request': {'id': None, 'idempotency_key': None},
+            'type': event_type,
+            'data': {
+                'object': {
+                    'id': state['id'],
+                    'object': 'subscription',
+                    'customer': f'cus_{self.prefix}_{account}',
+                    'status': state['status'],
+                    'created': state['created'],
+                    'current_period_start': state['current_period_start'],
+                    'current_period_end': state['current_period_start'] + self.PERIOD,
+                    'cancel_at_period_end': False,
+                    'collection_method': 'charge_automatically',
+                    'currency': 'usd',
+                    'default_payment_method': f'pm_{self.prefix}_{account}',
+                    'latest_invoice': f'in_{self.prefix}_{sequence}',
+                    'items': {
+                        'object': 'list',
+                        'data': [{
+                            'id': f'si_{self.prefix}_{account}',
+                            'object': 'subscription_item',
+                            'price': {
+                                'id': 'price_basic',
+                                'object': 'price',
+                                'currency': 'usd',
+                                'recurring': {'interval': 'month', 'interval_count': 1},
+                                'unit_amount': 1000,
+                            },
+                            'quantity': 1,
+                        }],
+                    },
+                },
+            },
+        }
+
+    @staticmethod
+    def sign(payload, secret, timestamp=None):
+        # The Stripe-Signature header, the same scheme checked by stripe.Webhook.construct_event
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+        return f't={timestamp},v1={signature}'
+
+    @staticmethod
+    def dump(events, path):
+        with open(path, 'w') as corpus:
+            for event in events:
+                corpus.write(json.dumps(event) + '\n')
+
+    @staticmethod
+    def load(path):
+        with open(path) as corpus:
+            return [json.loads(line) for line in corpus if line.strip()]
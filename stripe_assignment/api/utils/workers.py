@@ -0,0 +1,27 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+# Neither the ORM nor the Stripe SDK are async yet, async views run their blocking work in this bounded
+# pool so the event loop is never blocked. Its size is the number of requests a process keeps in flight.
+executor = ThreadPoolExecutor(max_workers=settings.ASYNC_WORKER_THREADS, thread_name_prefix='async-worker')
+
+
+def _run_with_connections(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_worker(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # The worker runs in a copy of the request context, like sync_to_async does
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor, functools.partial(context.run, _run_with_connections, func, *args, **kwargs))
@@ -65,8 +65,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -111,6 +112,50 @@ DATABASES = {
         "PORT": os.environ.get("SQL_PORT", "5432"),
     }
 }
+# Queries and database time allowed per request of every view, checked by the tests and counted at runtime
+DB_QUERY_BUDGETS_FILE = os.environ.get("DB_QUERY_BUDGETS_FILE", os.path.join(BASE_DIR, "api", "query_budgets.json"))
+# Queries slower than this are logged with their SQL and call site, 0 disables it
+DB_SLOW_QUERY_SECONDS = float(os.environ.get("DB_SLOW_QUERY_SECONDS", 0.2))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# -------------------------------------------------------------------
+# Use a shared backend (memcached, database) through CACHE_BACKEND and CACHE_LOCATION
+# when running several workers, so every worker sees the same invalidations.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+SUBSCRIPTION_STATUS_CACHE_ALIAS = os.environ.get("SUBSCRIPTION_STATUS_CACHE_ALIAS", "default")
+SUBSCRIPTION_STATUS_CACHE_TTL = int(os.environ.get("SUBSCRIPTION_STATUS_CACHE_TTL", 60))
+SUBSCRIPTION_STATUS_CACHE_NOT_FOUND_TTL = int(os.environ.get("SUBSCRIPTION_STATUS_CACHE_NOT_FOUND_TTL", 10))
+
+# Accounts accepted by each bulk status request, and accounts read by each of its queries
+SUBSCRIPTION_BULK_STATUS_MAX_ACCOUNTS = int(os.environ.get("SUBSCRIPTION_BULK_STATUS_MAX_ACCOUNTS", 1000))
+SUBSCRIPTION_BULK_STATUS_CHUNK_SIZE = int(os.environ.get("SUBSCRIPTION_BULK_STATUS_CHUNK_SIZE", 500))
+
+# Rows matched and written per query by the reconcile_subscriptions command
+STRIPE_RECONCILIATION_CHUNK_SIZE = int(os.environ.get("STRIPE_RECONCILIATION_CHUNK_SIZE", 500))
+
+# Users of the tokens without the account and active claims, issued before they were added
+AUTH_USER_CACHE_ALIAS = os.environ.get("AUTH_USER_CACHE_ALIAS", "default")
+AUTH_USER_CACHE_TTL = int(os.environ.get("AUTH_USER_CACHE_TTL", 300))
+
+# Responses of requests sent with an Idempotency-Key header, kept as long as Stripe keeps its idempotency keys
+IDEMPOTENCY_CACHE_ALIAS = os.environ.get("IDEMPOTENCY_CACHE_ALIAS", "default")
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", 86400))
+IDEMPOTENCY_LOCK_TTL = int(os.environ.get("IDEMPOTENCY_LOCK_TTL", 60))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.environ.get("IDEMPOTENCY_WAIT_TIMEOUT", 30))
+IDEMPOTENCY_POLL_INTERVAL = float(os.environ.get("IDEMPOTENCY_POLL_INTERVAL", 0.05))
+
+
+# Async views
+# -------------------------------------------------------------------
+# Threads running the blocking database and Stripe work of the async views of each process
+ASYNC_WORKER_THREADS = int(os.environ.get("ASYNC_WORKER_THREADS", 200))
 
 
 # Django Rest Framework configuration
@@ -118,7 +163,7 @@ DATABASES = {
 # -------------------------------------------------------------------
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.ClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated'
@@ -130,12 +175,25 @@ REST_FRAMEWORK = {
 
 # Json Web Token verifying key
 # -------------------------------------------------------------------
+# RS256, RS384, RS512, ES256, ES384, ES512 or EdDSA (Ed25519), the key pair must be of the same type
+JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "RS256")
 JWT_SIGNING_KEY = ""
 JWT_VERIFYING_KEY = ""
-with open('jwt-signing-key.key', mode='r') as private_key_file:
+with open(os.environ.get("JWT_SIGNING_KEY_FILE", "jwt-signing-key.key"), mode='r') as private_key_file:
     JWT_SIGNING_KEY = private_key_file.read()
-with open('jwt-verifying-key.key.pub', mode='r') as public_key_file:
+with open(os.environ.get("JWT_VERIFYING_KEY_FILE", "jwt-verifying-key.key.pub"), mode='r') as public_key_file:
     JWT_VERIFYING_KEY = public_key_file.read()
+# Key id sent in the kid header of the issued tokens
+JWT_SIGNING_KEY_ID = os.environ.get("JWT_SIGNING_KEY_ID", "")
+# JWKS file with the public keys of the previous key pairs still accepted, selected by the kid header
+JWT_KEY_SET_FILE = os.environ.get("JWT_KEY_SET_FILE", "")
+# Key id verifying the tokens without a kid header, by default the signing key pair
+JWT_DEFAULT_KEY_ID = os.environ.get("JWT_DEFAULT_KEY_ID", "")
+# Verified access tokens kept by each process, so repeated requests skip the signature verification
+JWT_VERIFIED_TOKEN_CACHE_SIZE = int(os.environ.get("JWT_VERIFIED_TOKEN_CACHE_SIZE", 10000))
+
+# Keys of the internal services calling the service endpoints with an "Authorization: Service <key>" header
+SERVICE_API_KEYS = [key for key in os.environ.get("SERVICE_API_KEYS", "").split(",") if key]
 
 
 ACCESS_TOKEN_MINUTES = int(os.environ.get("ACCESS_TOKEN_MINUTES", 5))
@@ -145,7 +203,7 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(minutes=REFRESH_TOKEN_MINUTES),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': False,
-    'ALGORITHM': 'RS256',
+    'ALGORITHM': JWT_ALGORITHM,
     'SIGNING_KEY': JWT_SIGNING_KEY,
     'VERIFYING_KEY': JWT_VERIFYING_KEY,
     'AUTH_HEADER_TYPES': ('JWT',),
@@ -224,6 +282,47 @@ STRIPE_API_SECRET = os.environ.get("STRIPE_API_SECRET", '')
 STRIPE_BASIC_PRODUCT_PRICE_ID = os.environ.get("STRIPE_BASIC_PRODUCT_PRICE_ID", '')
 STRIPE_PRO_PRODUCT_PRICE_ID = os.environ.get("STRIPE_PRO_PRODUCT_PRICE_ID", '')
 STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET", '')
+# Every Stripe call of a process shares a pool of keep-alive connections, timeouts are in seconds
+STRIPE_HTTP_POOL_SIZE = int(os.environ.get("STRIPE_HTTP_POOL_SIZE", 10))
+STRIPE_HTTP_CONNECT_TIMEOUT = float(os.environ.get("STRIPE_HTTP_CONNECT_TIMEOUT", 5))
+STRIPE_HTTP_READ_TIMEOUT = float(os.environ.get("STRIPE_HTTP_READ_TIMEOUT", 30))
+# Points the Stripe calls to another server, like the stand-in of the run_stripe_stand_in command
+STRIPE_API_BASE = os.environ.get("STRIPE_API_BASE", "https://api.stripe.com")
+# "concurrent" runs the independent Stripe calls of a subscription at the same time in a bounded thread pool,
+# "compact" attaches the payment method while creating the customer and the subscription, with fewer calls
+STRIPE_GATEWAY_MODE = os.environ.get("STRIPE_GATEWAY_MODE", "sequential")
+STRIPE_GATEWAY_MAX_WORKERS = int(os.environ.get("STRIPE_GATEWAY_MAX_WORKERS", 8))
+# Client side limit of Stripe calls per second of each process, Stripe allows 100 in live mode and 25 in test mode.
+# It halves on every 429 down to STRIPE_RATE_LIMIT_MIN, and recovers STRIPE_RATE_LIMIT_RECOVERY per successful call.
+# When shared, every worker counts its calls in the STRIPE_RATE_LIMIT_CACHE_ALIAS cache. 0 disables the limit.
+STRIPE_RATE_LIMIT = float(os.environ.get("STRIPE_RATE_LIMIT", 25))
+STRIPE_RATE_LIMIT_BURST = float(os.environ.get("STRIPE_RATE_LIMIT_BURST", 10))
+STRIPE_RATE_LIMIT_MIN = float(os.environ.get("STRIPE_RATE_LIMIT_MIN", 1))
+STRIPE_RATE_LIMIT_RECOVERY = float(os.environ.get("STRIPE_RATE_LIMIT_RECOVERY", 0.1))
+STRIPE_RATE_LIMIT_SHARED = os.environ.get("STRIPE_RATE_LIMIT_SHARED", "false").lower() == "true"
+STRIPE_RATE_LIMIT_CACHE_ALIAS = os.environ.get("STRIPE_RATE_LIMIT_CACHE_ALIAS", "default")
+# Rate limited Stripe calls are retried with jittered exponential backoff, within a budget of seconds per request
+STRIPE_RETRY_BUDGET = float(os.environ.get("STRIPE_RETRY_BUDGET", 5))
+STRIPE_RETRY_BASE_DELAY = float(os.environ.get("STRIPE_RETRY_BASE_DELAY", 0.25))
+STRIPE_RETRY_MAX_DELAY = float(os.environ.get("STRIPE_RETRY_MAX_DELAY", 2))
+
+# The circuit opens when at least STRIPE_BREAKER_FAILURE_RATE of the Stripe calls of the last STRIPE_BREAKER_WINDOW_SECONDS
+# failed or took STRIPE_BREAKER_SLOW_CALL_SECONDS or more, once there were at least STRIPE_BREAKER_MIN_CALLS of them.
+# It stays open STRIPE_BREAKER_OPEN_SECONDS, then a single request probes Stripe to close it again.
+STRIPE_BREAKER_ENABLED = os.environ.get("STRIPE_BREAKER_ENABLED", "true").lower() == "true"
+STRIPE_BREAKER_FAILURE_RATE = float(os.environ.get("STRIPE_BREAKER_FAILURE_RATE", 0.5))
+STRIPE_BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("STRIPE_BREAKER_SLOW_CALL_SECONDS", 10))
+STRIPE_BREAKER_MIN_CALLS = int(os.environ.get("STRIPE_BREAKER_MIN_CALLS", 10))
+STRIPE_BREAKER_WINDOW_SECONDS = float(os.environ.get("STRIPE_BREAKER_WINDOW_SECONDS", 30))
+STRIPE_BREAKER_OPEN_SECONDS = float(os.environ.get("STRIPE_BREAKER_OPEN_SECONDS", 30))
+# When enabled the webhook only stores the events, the process_webhook_events command applies them
+STRIPE_WEBHOOK_INBOX_ENABLED = os.environ.get("STRIPE_WEBHOOK_INBOX_ENABLED", "false").lower() == "true"
+STRIPE_WEBHOOK_INBOX_MAX_ATTEMPTS = int(os.environ.get("STRIPE_WEBHOOK_INBOX_MAX_ATTEMPTS", 5))
+# Seconds before the first retry of a failed event, doubled on every following attempt
+STRIPE_WEBHOOK_INBOX_RETRY_BACKOFF = float(os.environ.get("STRIPE_WEBHOOK_INBOX_RETRY_BACKOFF", 5))
+# Received event ids are kept this long to drop Stripe redeliveries, Stripe retries for up to three days
+STRIPE_WEBHOOK_DEDUP_TTL = int(os.environ.get("STRIPE_WEBHOOK_DEDUP_TTL", 259200))
+STRIPE_WEBHOOK_DEDUP_LRU_SIZE = int(os.environ.get("STRIPE_WEBHOOK_DEDUP_LRU_SIZE", 10000))
 
 
 # Configure static files